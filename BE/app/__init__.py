@@ -11,7 +11,7 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
-    CORS(app)
+    CORS(app, expose_headers=["X-Next-Cursor"])
     db.init_app(app)
     migrate.init_app(app, db)
 
@@ -20,4 +20,14 @@ def create_app():
     app.register_blueprint(images.bp)
     app.register_blueprint(text.text_bp)
 
+    from app.commands import register_commands
+    register_commands(app)
+
+    from app.services.image_storage_service import ImageStorageService
+
+    @app.before_request
+    def start_storage_collector():
+        # Only processes serving requests collect, not CLI commands such as `flask db upgrade`.
+        ImageStorageService.start_collector()
+
     return app
@@ -0,0 +1,152 @@
+import click
+from flask.cli import AppGroup
+
+inference_cli = AppGroup("inference", help="Shared text inference server.")
+
+
+@inference_cli.command("serve")
+@click.option("--address", default=None, help="Unix socket path or host:port (default: INFERENCE_SERVER_ADDRESS).")
+@click.option("--concurrency", type=int, default=None, help="Maximum concurrent inference requests.")
+def serve_inference(address, concurrency):
+    """Run the inference server that owns the text models for all web workers."""
+    from app.services.inference_server import InferenceServer
+
+    try:
+        server = InferenceServer(address=address, max_concurrency=concurrency)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    server.serve_forever()
+
+
+models_cli = AppGroup("models", help="Local text model cache.")
+
+
+@models_cli.command("prefetch")
+@click.option("--backend", default=None, help="Inference backend to prefetch for (default: TEXT_INFERENCE_BACKEND).")
+@click.option("--force", is_flag=True, help="Download again even if a model is already cached.")
+def prefetch_models(backend, force):
+    """Download (or export) every text model in use into TEXT_MODEL_DIR, with checksum manifests."""
+    from config import Config
+    from app.services.model_loader import configured_pipelines, prefetch_model
+
+    models = {model: task for task, model in configured_pipelines().values()}
+    for model_name, task in models.items():
+        click.echo(f"Prefetching {model_name} ({task})...")
+        path = prefetch_model(task, model_name, backend, force=force)
+        click.echo(f"  -> {path}")
+    click.echo(f"{len(models)} models cached in {Config.TEXT_MODEL_DIR}")
+
+
+text_cli = AppGroup("text", help="Stored text documents.")
+
+
+@text_cli.command("recover-imports")
+def recover_imports():
+    """Fail import jobs interrupted by a restart (run before starting the web workers)."""
+    from app.services.text_import_service import TextImportService
+
+    click.echo(f"Marked {TextImportService.fail_interrupted_jobs()} interrupted import jobs as failed")
+
+
+@text_cli.command("index-duplicates")
+@click.option("--batch-size", type=int, default=500, help="Documents indexed per commit.")
+def index_duplicates(batch_size):
+    """Compute near-duplicate signatures for documents stored before detection existed."""
+    from app import db
+    from app.models.text import TextDocument
+    from app.services.dedup_service import DedupService
+
+    indexed = 0
+    last_id = 0
+    while True:
+        # Documents awaiting analysis are indexed by their import job.
+        documents = TextDocument.query.filter(
+            TextDocument.minhash_signature.is_(None),
+            db.or_(TextDocument.analysis_status.is_(None), TextDocument.analysis_status != 'pending'),
+            TextDocument.id > last_id
+        ).order_by(TextDocument.id).limit(batch_size).all()
+        if not documents:
+            break
+        for document in documents:
+            DedupService.index_document(document, DedupService.signature(document.content))
+            indexed += 1
+        db.session.commit()
+        last_id = documents[-1].id
+    click.echo(f"Indexed {indexed} documents")
+
+
+images_cli = AppGroup("images", help="Stored images.")
+
+
+@images_cli.command("index-similarity")
+@click.option("--batch-size", type=int, default=100, help="Images indexed per commit.")
+def index_similarity(batch_size):
+    """Compute perceptual hashes for images stored before similarity search existed."""
+    from app import db
+    from app.models.image import ImageDocument
+    from app.services.image_service import ImageService
+
+    indexed = failed = 0
+    last_id = 0
+    while True:
+        documents = ImageDocument.query.filter(
+            ImageDocument.dhash.is_(None), ImageDocument.id > last_id
+        ).order_by(ImageDocument.id).limit(batch_size).all()
+        if not documents:
+            break
+        for document in documents:
+            try:
+                ImageService.index_similarity(document)
+                indexed += 1
+            except (OSError, ValueError) as e:
+                click.echo(f"  {document.unique_filename}: {e}")
+                failed += 1
+        db.session.commit()
+        last_id = documents[-1].id
+    click.echo(f"Indexed {indexed} images ({failed} failed)")
+
+
+@images_cli.command("record-files")
+@click.option("--batch-size", type=int, default=100, help="Files looked up per query.")
+def record_files(batch_size):
+    """Record the metadata of images stored before metadata was recorded."""
+    from app.services.image_storage_service import ImageStorageService
+
+    counts = ImageStorageService.record_unrecorded(batch_size)
+    click.echo(f"Recorded {counts['recorded']} images ({counts['failed']} failed)")
+
+
+@images_cli.command("migrate-layout")
+@click.option("--batch-size", type=int, default=100, help="Images moved per commit.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be moved.")
+def migrate_layout(batch_size, dry_run):
+    """Move images stored directly in the upload directory into hash-prefix shards."""
+    from app.services.image_storage_service import ImageStorageService
+
+    counts = ImageStorageService.migrate_layout(batch_size, dry_run)
+    verb = "Would move" if dry_run else "Moved"
+    click.echo(f"{verb} {counts['files']} files of {counts['images']} images ({counts['conflicts']} left in place: already in their shard)")
+
+
+@images_cli.command("gc")
+@click.option("--quota", type=int, default=None, help="Disk quota in bytes (default: IMAGE_STORAGE_QUOTA_BYTES).")
+def collect_garbage(quota):
+    """Remove abandoned temporary files and evict derivatives above the disk quota."""
+    from app.services.image_storage_service import ImageStorageService
+
+    report = ImageStorageService.collect(quota)
+    if report is None:
+        click.echo("Another process is collecting")
+        return
+    click.echo(
+        f"Reclaimed {report['reclaimed_bytes']} bytes in {report['reclaimed_files']} files; "
+        f"{report['usage_bytes']} bytes in use ({report['original_bytes']} originals)"
+    )
+
+
+def register_commands(app):
+    """Register the application's CLI command groups."""
+    app.cli.add_command(inference_cli)
+    app.cli.add_command(models_cli)
+    app.cli.add_command(text_cli)
+    app.cli.add_command(images_cli)
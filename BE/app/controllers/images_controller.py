@@ -1,8 +1,74 @@
 import mimetypes
 import os
-from flask import jsonify, request, send_file, send_from_directory
-from app.services.image_service import ImageService
-from app.utils.validators import validate_image_upload, validate_single_image_upload
+from flask import current_app, jsonify, request, send_file, stream_with_context
+from app import db
+from sqlalchemy.orm import load_only
+from app.models.image import ImageDocument
+from app.services.image_service import DOWNSCALE_MODES, MASK_METHODS, ImageService
+from app.services.image_batch_service import ImageBatchService
+from app.services.image_derivative_service import ImageDerivativeService
+from app.services.image_similarity_service import ImageSimilarityService
+from app.services.image_storage_service import ImageStorageService
+from app.utils.encoding import JSON, MSGPACK, NPY, counts, encoded_response, negotiate
+from app.utils.pagination import keyset_paginate, parse_limit
+from app.utils.validators import validate_batch_transform, validate_image_upload, validate_single_image_upload
+from config import Config
+
+# Originals that /view may re-encode as WebP for clients accepting it (not GIF: animations would be lost).
+WEBP_NEGOTIABLE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'bmp', 'tiff')
+IMAGE_FIELDS = (
+    'id', 'filename', 'original_filename', 'file_extension', 'file_size', 'created_at',
+    'dimensions', 'channels', 'color_histogram', 'processing_history', 'content_hash', 'ref_count'
+)
+# Listings leave out the histograms unless requested with ?fields=...
+IMAGE_LIST_FIELDS = tuple(field for field in IMAGE_FIELDS if field != 'color_histogram')
+# Columns each field is read from.
+IMAGE_FIELD_COLUMNS = {
+    'id': 'id',
+    'filename': 'unique_filename',
+    'original_filename': 'original_filename',
+    'file_extension': 'file_extension',
+    'file_size': 'file_size',
+    'created_at': 'created_at',
+    'dimensions': 'dimensions',
+    'channels': 'dimensions',
+    'color_histogram': 'color_histogram',
+    'processing_history': 'processing_history',
+    'content_hash': 'content_hash',
+    'ref_count': 'ref_count'
+}
+
+
+def serialize_image(document, fields=IMAGE_FIELDS):
+    """Serialize an ImageDocument, restricted to the requested fields."""
+    values = {
+        'id': lambda: document.id,
+        'filename': lambda: document.unique_filename,
+        'original_filename': lambda: document.original_filename,
+        'file_extension': lambda: document.file_extension,
+        'file_size': lambda: document.file_size,
+        'created_at': lambda: document.created_at.isoformat(),
+        'dimensions': lambda: {'height': document.dimensions['height'], 'width': document.dimensions['width']},
+        'channels': lambda: document.dimensions.get('channels'),
+        'color_histogram': lambda: document.color_histogram,
+        'processing_history': lambda: document.processing_history or [],
+        'content_hash': lambda: document.content_hash,
+        'ref_count': lambda: document.ref_count
+    }
+    return {field: values[field]() for field in fields}
+
+
+def compact_histogram(histogram):
+    """A color histogram's per-channel counts as arrays of one compact integer type."""
+    channels = list(histogram)
+    return dict(zip(channels, counts([histogram[channel] for channel in channels])))
+
+
+def compact_image(item):
+    """An image's details with its histogram (if any) as compact arrays, for binary encodings."""
+    if item.get('color_histogram'):
+        item = dict(item, color_histogram=compact_histogram(item['color_histogram']))
+    return item
 
 class ImageController:
     """
@@ -14,42 +80,212 @@ class ImageController:
     def upload_images():
         """
         Handle image uploads, including batch processing.
-        Ensures the upload directory exists before saving files.
+        Ensures the upload directory exists before saving files. Images are stored by
+        content hash; re-uploading stored content reuses it (marked 'duplicate').
+        Segmentation masks are computed on request (/<image_id>/mask) unless asked for here.
+        
+        Form Fields:
+            mask (str): Also compute each new image's mask with this method ("simple", "adaptive"
+                or "otsu"; default: IMAGE_EAGER_MASK, empty for none).
         
         Returns:
-            JSON response with the number of processed images and their details.
+            JSON (or MessagePack, per Accept) response with the number of processed images and
+            their details, in upload order. Files that failed carry an 'error' instead of failing
+            the whole batch.
         """
         os.makedirs(ImageService.UPLOAD_FOLDER, exist_ok=True)
         
         files = request.files.getlist('files')
+        mask_method = request.form.get('mask', Config.IMAGE_EAGER_MASK) or None
+        if mask_method is not None and mask_method not in MASK_METHODS:
+            return jsonify({'error': f"'mask' must be one of: {', '.join(MASK_METHODS)}"}), 400
         
         try:
-            results = ImageService.batch_process_images(files)
-            return jsonify({
-                'message': f'Processed {len(results)} images',
-                'results': results
-            }), 200
+            results = ImageService.batch_process_images(files, current_app._get_current_object(), mask_method)
+            failed = sum(1 for result in results if 'error' in result)
+            encoding = negotiate(MSGPACK)
+            return encoded_response({
+                'message': f'Processed {len(results) - failed} images',
+                'failed': failed,
+                'results': results if encoding == JSON else [compact_image(result) for result in results]
+            }, encoding)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    @staticmethod
+    def list_images():
+        """
+        Retrieve a page of stored images' metadata, newest first.
+
+        Query Parameters:
+            fields (str): Comma-separated fields to return (histograms are left out by default).
+            limit (int): Page size (default 50, max 200).
+            cursor (str): Value of the X-Next-Cursor header from the previous page.
+
+        Returns:
+            JSON (or MessagePack, per Accept) response containing image details, with an X-Next-Cursor
+            header when more images are available.
+        """
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or list(IMAGE_LIST_FIELDS)
+        unknown = set(fields) - set(IMAGE_FIELDS)
+        if unknown:
+            return jsonify({'error': f'Unknown fields: {", ".join(sorted(unknown))}'}), 400
+
+        columns = {'id', 'created_at'} | {IMAGE_FIELD_COLUMNS[field] for field in fields}
+        query = ImageDocument.query.options(load_only(*(getattr(ImageDocument, c) for c in columns)))
+        try:
+            documents, next_cursor = keyset_paginate(
+                query, ImageDocument.created_at, ImageDocument.id,
+                cursor=request.args.get('cursor'),
+                limit=parse_limit(request.args.get('limit', type=int))
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        encoding = negotiate(MSGPACK)
+        items = [serialize_image(document, fields) for document in documents]
+        response = encoded_response(items if encoding == JSON else [compact_image(item) for item in items], encoding)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
     @staticmethod
     def get_image_details(image_id):
         """
-        Retrieve details for a specific image.
+        Retrieve details for a specific image from its stored metadata.
         
         Args:
-            image_id (str): Unique identifier for the image.
+            image_id (str): Id or unique filename of the image.
         
         Returns:
-            JSON response containing image details or an error message if not found.
+            JSON (or MessagePack, per Accept) response containing image details or an error
+            message if not found.
+        """
+        document = ImageService.get_document(image_id)
+        if document is None:
+            return jsonify({'error': 'Image not found'}), 404
+        encoding = negotiate(MSGPACK)
+        details = serialize_image(document)
+        return encoded_response(details if encoding == JSON else compact_image(details), encoding)
+
+    @staticmethod
+    def get_image_histogram(image_id):
         """
-        image_path = os.path.join(ImageService.UPLOAD_FOLDER, f'{image_id}')
+        Retrieve the stored color histogram of an image.
+        
+        Args:
+            image_id (str): Id or unique filename of the image.
         
-        if not os.path.exists(image_path):
+        Returns:
+            JSON, MessagePack or NPY response (per Accept) containing the color histogram data.
+        """
+        document = ImageService.get_document(image_id)
+        if document is None:
             return jsonify({'error': 'Image not found'}), 404
+        return ImageController._histogram_response(document.color_histogram)
+
+    @staticmethod
+    def get_similar_images(image_id):
+        """
+        Find stored images that look like an image, by perceptual hash and color signature.
+        
+        Args:
+            image_id (str): Id or unique filename of the image.
+        
+        Query Parameters:
+            limit (int): Maximum number of results (default 10, max 100).
+            max_distance (int): Maximum hash Hamming distance, 0-12 (default: IMAGE_SIMILAR_MAX_DISTANCE).
+                Near-duplicates are within about 2.
+            max_color_distance (float): Maximum color signature distance, 0-2 (default: no limit).
+        
+        Returns:
+            JSON response with the matching images, closest first.
+        """
+        document = ImageService.get_document(image_id)
+        if document is None:
+            return jsonify({'error': 'Image not found'}), 404
+
+        max_distance = request.args.get('max_distance', Config.IMAGE_SIMILAR_MAX_DISTANCE, type=int)
+        if not 0 <= max_distance <= ImageSimilarityService.MAX_DISTANCE:
+            return jsonify({'error': f"'max_distance' must be between 0 and {ImageSimilarityService.MAX_DISTANCE}"}), 400
+        max_color_distance = request.args.get('max_color_distance', type=float)
+        limit = parse_limit(request.args.get('limit', type=int), default=10, maximum=100)
+
+        if document.dhash is None:
+            # Stored before similarity indexing.
+            try:
+                ImageService.index_similarity(document)
+                db.session.commit()
+            except (OSError, ValueError) as e:
+                db.session.rollback()
+                return jsonify({'error': f'Could not index image: {e}'}), 422
+
+        matches = ImageSimilarityService.find_similar(document, limit, max_distance, max_color_distance)
+        return jsonify({
+            'id': document.id,
+            'results': [
+                dict(serialize_image(match, ('id', 'filename', 'original_filename', 'dimensions')),
+                     distance=distance, color_distance=round(color_distance, 4))
+                for match, distance, color_distance in matches
+            ]
+        }), 200
+
+    @staticmethod
+    def get_image_mask(image_id):
+        """
+        Retrieve an image's segmentation mask (PNG). Masks are computed on first request
+        and cached next to the image afterwards.
+        
+        Args:
+            image_id (str): Id or unique filename of the image.
+        
+        Query Parameters:
+            method (str): "simple" (default), "adaptive" or "otsu".
+            max_dimension (int): Compute the mask on a copy downscaled to this longest side
+                (default: IMAGE_MASK_MAX_DIMENSION; 0 for full resolution).
+        
+        Returns:
+            The mask image, or an error message.
+        """
+        method = request.args.get('method', 'simple')
+        if method not in MASK_METHODS:
+            return jsonify({'error': f"'method' must be one of: {', '.join(MASK_METHODS)}"}), 400
+        max_dimension = request.args.get('max_dimension', Config.IMAGE_MASK_MAX_DIMENSION, type=int)
+        if max_dimension < 0:
+            return jsonify({'error': "'max_dimension' must not be negative"}), 400
+
+        document = ImageService.get_document(image_id)
+        if document is not None:
+            ImageService.wait_for_write(document.file_path)
+        if document is None or not os.path.isfile(document.file_path):
+            return jsonify({'error': 'Image not found'}), 404
+        try:
+            mask_path = ImageService.get_mask(document, method, max_dimension or None)
+        except (OSError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({'error': f'Could not compute mask: {e}'}), 422
+        return ImageController._send_image(mask_path)
+
+    @staticmethod
+    def delete_image(image_id):
+        """
+        Release one reference to a stored image. Identical uploads share one stored copy,
+        which is deleted along with its mask and metadata once no references are left.
+        
+        Args:
+            image_id (str): Id or unique filename of the image.
         
-        details = ImageService.process_single_image(image_path)
-        return jsonify(details), 200
+        Returns:
+            JSON response with the remaining reference count.
+        """
+        document = ImageService.get_document(image_id)
+        if document is None:
+            return jsonify({'error': 'Image not found'}), 404
+        ref_count = ImageService.release_image(document)
+        return jsonify({
+            'message': 'Image deleted' if ref_count == 0 else 'Image reference released',
+            'ref_count': ref_count
+        }), 200
 
     @staticmethod
     @validate_single_image_upload
@@ -57,35 +293,37 @@ class ImageController:
         """
         Generate a color histogram for an uploaded image.
         
+        The image is decoded in memory and not stored.
+        
         Returns:
-            JSON response containing the color histogram data.
+            JSON, MessagePack or NPY response (per Accept) containing the color histogram data.
         """
-        image_file = request.files['image']
-        filename = ImageService.generate_unique_filename(image_file.filename)
-        filepath = os.path.join(ImageService.UPLOAD_FOLDER, filename)
-        image_file.save(filepath)
-        
-        details = ImageService.process_single_image(filepath)
-        return jsonify(details['color_histogram']), 200
+        try:
+            img = ImageService.decode_image(request.files['image'].read())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return ImageController._histogram_response(ImageService.compute_color_histogram(img))
 
     @staticmethod
     @validate_single_image_upload
     def resize_image():
         """
         Resize an uploaded image based on the given width and height.
+        An optional 'downscale' field ("fast", "balanced" or "quality") trades quality for speed.
         
         Returns:
             JSON response containing the original and resized image filenames.
         """
-        image_file = request.files['image']
-        filename = ImageService.generate_unique_filename(image_file.filename)
-        filepath = os.path.join(ImageService.UPLOAD_FOLDER, filename)
-        image_file.save(filepath)
+        mode = request.form.get('downscale', Config.IMAGE_DOWNSCALE_MODE).lower()
+        if mode not in DOWNSCALE_MODES:
+            return jsonify({'error': f"'downscale' must be one of: {', '.join(DOWNSCALE_MODES)}"}), 400
+
+        filename, filepath, data = ImageService.save_upload(request.files['image'])
         
         width = request.form.get('width', type=int)
         height = request.form.get('height', type=int)
         
-        resized_path = ImageService.resize_image(filepath, width, height)
+        resized_path = ImageService.resize_image(filepath, width, height, data=data, mode=mode)
         
         return jsonify({
             'original_filename': filename,
@@ -101,44 +339,123 @@ class ImageController:
         Returns:
             JSON response containing the original and converted image filenames.
         """
-        image_file = request.files['image']
-        filename = ImageService.generate_unique_filename(image_file.filename)
-        filepath = os.path.join(ImageService.UPLOAD_FOLDER, filename)
-        image_file.save(filepath)
+        filename, filepath, data = ImageService.save_upload(request.files['image'])
         
         output_format = request.form.get('format', 'png').lower()
-        converted_path = ImageService.convert_image_format(filepath, output_format)
+        converted_path = ImageService.convert_image_format(filepath, output_format, data=data)
         
         return jsonify({
             'original_filename': filename,
             'converted_filename': os.path.basename(converted_path)
         }), 200
         
+    @staticmethod
+    @validate_batch_transform
+    def batch_transform():
+        """
+        Resize / convert (and optionally mask) many images in one request, streaming a ZIP
+        archive back as images finish. The images are stored ones (JSON body with an
+        'images' list of ids or filenames) or a multipart batch ('files', not stored).
+        
+        Options (JSON keys or form fields):
+            w, h, fit, format, quality, downscale: As for derivatives of /view/<image_name>.
+            mask (str): Also add each result's segmentation mask ("simple", "adaptive" or "otsu").
+        
+        Returns:
+            ZIP archive with the transformed images and a manifest.json listing every image's
+            output or error.
+        """
+        if request.is_json:
+            args = request.get_json()
+            items = []
+            for image_id in args['images']:
+                document = ImageService.get_document(str(image_id))
+                if document is not None:
+                    ImageService.wait_for_write(document.file_path)
+                if document is None or not os.path.isfile(document.file_path):
+                    items.append((image_id, str(image_id), None, 'Image not found'))
+                else:
+                    items.append((image_id, document.original_filename, document.file_path, None))
+        else:
+            args = request.form
+            items = [(f.filename, f.filename, ImageBatchService.spool(f), None) for f in request.files.getlist('files')]
+
+        try:
+            ImageBatchService.validate_options(args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        response = current_app.response_class(
+            stream_with_context(ImageBatchService.stream_zip(items, args)), mimetype='application/zip'
+        )
+        response.headers.set('Content-Disposition', 'attachment', filename='images.zip')
+        return response
+
+    @staticmethod
+    def get_storage_metrics():
+        """
+        Report the upload directory's usage and what the garbage collector reclaimed
+        (in this process, since it started).
+        
+        Returns:
+            JSON response with storage metrics.
+        """
+        return jsonify(ImageStorageService.metrics()), 200
+
     @staticmethod
     def get_image_by_name(image_name):
         """
-        Retrieve and return an image by its name.
+        Retrieve and return an image by its name, or a resized / converted derivative of it.
+        Derivatives are generated on first request and served from a disk cache afterwards.
+        Without an explicit format, clients whose Accept header lists image/webp get a WebP
+        encoding (IMAGE_NEGOTIATE_WEBP) — of an original only once a background worker has
+        encoded it, and only when it is smaller — and the response varies by Accept.
         
         Args:
             image_name (str): Name of the image file.
         
+        Query Parameters:
+            w, h (int): Target width and/or height (aspect ratio is kept if only one is given).
+            fit (str): "contain" (default), "cover" (crop) or "fill" (stretch), with both w and h.
+            format (str): Output format, e.g. "webp" (default: the original's, or WebP if accepted).
+            quality (int): Encoder quality for JPEG and lossy WebP, 1-100 (default: IMAGE_JPEG_QUALITY
+                or IMAGE_WEBP_QUALITY).
+            downscale (str): "fast", "balanced" or "quality" resampling (default: IMAGE_DOWNSCALE_MODE).
+        
         Returns:
             The image file with the correct MIME type or an error message if not found.
         """
-        image_path = os.path.join(ImageService.UPLOAD_FOLDER, image_name)
-        image_path = os.path.normpath(image_path)
-        
-        if not os.path.exists(image_path):
-            return jsonify({'error': f'Image not found at {image_path}'}), 404
+        image_path = ImageService.resolve_path(image_name)
+        if image_path is None:
+            return jsonify({'error': 'Image not found'}), 404
 
-        mime_type, _ = mimetypes.guess_type(image_path)
-        if not mime_type:
-            mime_type = 'application/octet-stream'
+        extension = image_name.rsplit('.', 1)[-1].lower()
+        negotiable = (
+            Config.IMAGE_NEGOTIATE_WEBP and 'format' not in request.args and extension in WEBP_NEGOTIABLE_EXTENSIONS
+        )
+        webp = negotiable and ImageController._accepts('image/webp')
+        transformed = any(param in request.args for param in ('w', 'h', 'fit', 'format', 'quality'))
 
-        try:
-            return send_file(image_path, mimetype=mime_type), 200
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+        if transformed:
+            try:
+                # Only resized derivatives are sure to fit in WebP's dimension limit.
+                resized = 'w' in request.args or 'h' in request.args
+                options = ImageDerivativeService.parse_options(request.args, 'webp' if webp and resized else extension)
+                image_path = ImageDerivativeService.get_derivative(image_path, options)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            except OSError as e:
+                return jsonify({'error': f'Could not generate derivative: {e}'}), 422
+        elif webp:
+            # Never fails: the original is served until its WebP encoding is ready (and smaller).
+            image_path = ImageDerivativeService.webp_variant(image_path)[0] or image_path
+
+        # What is served for a derivative or negotiated URL changes with the encoder profile (or
+        # once a queued WebP encoding is ready): clients revalidate it by ETag instead.
+        response = ImageController._send_image(image_path, revalidate=transformed or webp)
+        if negotiable:
+            response.vary.add('Accept')
+        return response
         
     @staticmethod
     def download_image(image_name):
@@ -151,16 +468,73 @@ class ImageController:
         Returns:
             The image file as an attachment for download or an error message if not found.
         """
-        image_path = os.path.join(ImageService.UPLOAD_FOLDER, image_name)
-        
-        if not os.path.exists(image_path):
+        image_path = ImageService.resolve_path(image_name)
+        if image_path is None:
             return jsonify({'error': 'Image not found'}), 404
         
-        try:
-            return send_from_directory(
-                ImageService.UPLOAD_FOLDER,
-                image_name,
-                as_attachment=True
-            ), 200
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+        return ImageController._send_image(image_path, as_attachment=True)
+
+    @staticmethod
+    def _histogram_response(histogram):
+        """
+        Send a color histogram as JSON, MessagePack (compact integer arrays per channel) or
+        NPY (a channels x 256 array, channel names in X-Array-Labels), per Accept.
+        """
+        encoding = negotiate(MSGPACK, NPY)
+        if encoding == NPY:
+            channels = list(histogram)
+            return encoded_response(
+                counts([histogram[channel] for channel in channels]), encoding, labels=channels
+            )
+        return encoded_response(histogram if encoding == JSON else compact_histogram(histogram), encoding)
+
+    @staticmethod
+    def _accepts(mimetype):
+        """Whether the request's Accept header lists a media type explicitly (wildcards do not count)."""
+        return any(value == mimetype and quality > 0 for value, quality in request.accept_mimetypes)
+
+    @staticmethod
+    def _send_image(image_path, as_attachment=False, revalidate=False):
+        """
+        Send a stored image or derivative. Their names never get reused for other content,
+        so responses are cacheable forever; conditional (ETag / Last-Modified) and Range
+        requests are answered with 304 and 206. With IMAGE_SENDFILE_MODE, the front proxy
+        sends the bytes instead of the worker.
+        
+        Args:
+            image_path (str): Path of the file.
+            as_attachment (bool): Send as a download.
+            revalidate (bool): The URL may serve other content later: cacheable, but only
+                after revalidating it (no-cache) rather than forever.
+        
+        Returns:
+            The file response.
+        """
+        ImageStorageService.record_access(image_path)
+        mime_type = mimetypes.guess_type(image_path)[0] or 'application/octet-stream'
+        relative_path = os.path.relpath(image_path, Config.IMAGE_SENDFILE_ROOT)
+
+        if Config.IMAGE_SENDFILE_MODE == 'x-accel' and not relative_path.startswith(os.pardir):
+            # nginx serves the file from its internal location, including conditional and range requests.
+            response = current_app.response_class(mimetype=mime_type)
+            response.headers['X-Accel-Redirect'] = (
+                Config.IMAGE_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative_path.replace(os.sep, '/')
+            )
+            if as_attachment:
+                response.headers.set('Content-Disposition', 'attachment', filename=os.path.basename(image_path))
+            response.cache_control.public = True
+            response.cache_control.max_age = Config.IMAGE_CACHE_MAX_AGE
+        else:
+            # X-Sendfile is applied by send_file itself when IMAGE_SENDFILE_MODE is "x-sendfile".
+            # Derivative names are content-addressed, while their modification time tracks use.
+            response = send_file(
+                image_path, mimetype=mime_type, as_attachment=as_attachment, max_age=Config.IMAGE_CACHE_MAX_AGE,
+                etag=os.path.basename(image_path) if revalidate else True
+            )
+
+        if revalidate:
+            response.cache_control.max_age = None
+            response.cache_control.no_cache = True
+        else:
+            response.cache_control.immutable = True
+        return response
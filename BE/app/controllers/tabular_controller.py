@@ -1,7 +1,9 @@
 import json
 import logging
+import numpy as np
 from flask import request, jsonify, send_file
 from app.services.tabular_service import TabularService
+from app.utils.encoding import JSON, MSGPACK, counts, encoded_response, labelled_matrix, negotiate
 from app.utils.validators import validate_file_upload, validate_file_update
 
 # Configure logging
@@ -75,7 +77,8 @@ class TabularController:
         Computes and returns statistics for a dataset.
         
         Returns:
-            JSON response with dataset statistics or an error message.
+            JSON response with dataset statistics or an error message. In MessagePack (per
+            Accept), the correlation matrix is {"columns", "values": float32 matrix}.
         """
         try:
             data_entry = TabularService.get_tabular_data(data_id)
@@ -83,7 +86,10 @@ class TabularController:
                 return jsonify({"error": "Data not found"}), 404
 
             stats = TabularService.compute_statistics(data_entry.data)
-            return jsonify({"filename": data_entry.filename, "statistics": stats}), 200
+            encoding = negotiate(MSGPACK)
+            if encoding != JSON:
+                stats = dict(stats, correlation_matrix=labelled_matrix(stats["correlation_matrix"]))
+            return encoded_response({"filename": data_entry.filename, "statistics": stats}, encoding)
         except Exception as e:
             logger.exception(f"Error computing statistics for data ID {data_id}")
             return jsonify({"error": str(e)}), 500
@@ -182,13 +188,27 @@ class TabularController:
         Retrieves visualization data for charts and graphs.
         
         Returns:
-            JSON response with visualization data or an error message.
+            JSON response with visualization data or an error message. In MessagePack (per
+            Accept), histogram values are float32 arrays, bin counts compact integer arrays and
+            the correlation heatmap is {"columns", "values": float32 matrix}.
         """
         try:
             viz_data = TabularService.get_visualization_data(data_id)
             if not viz_data:
                 return jsonify({"error": "Data not found"}), 404
-            return jsonify(viz_data), 200
+            encoding = negotiate(MSGPACK)
+            if encoding != JSON:
+                viz_data = dict(
+                    viz_data,
+                    histogram_data={
+                        column: {
+                            "values": np.asarray(histogram["values"], dtype=np.float32),
+                            "bins": counts(histogram["bins"])
+                        } for column, histogram in viz_data["histogram_data"].items()
+                    },
+                    correlation_heatmap=labelled_matrix(viz_data["correlation_heatmap"])
+                )
+            return encoded_response(viz_data, encoding)
         except Exception as e:
             logger.exception(f"Error retrieving visualizations for data ID {data_id}")
             return jsonify({"error": str(e)}), 500
@@ -1,11 +1,62 @@
-from operator import or_
-from flask import request, jsonify
+import csv
+import json
+import math
+import threading
+import numpy as np
+from flask import Response, current_app, request, jsonify, stream_with_context
+from sqlalchemy import or_
+from sqlalchemy.orm import load_only
 from app.services.text_service import TextService
-from app.models.text import TextDocument
+from app.services.text_import_service import TextImportService
+from app.services.dedup_service import DedupService
+from app.services.cluster_service import ClusterService
+from app.services.categorizer_training_service import CategorizerTrainingService
+from app.models.text import TextCluster, TextDocument, TextImportJob
 from app.models.database import db
-from app.utils.validators import validate_document_update, validate_text_input, validate_doc_id, validate_tsne_input
+from config import Config
+from app.utils.encoding import MSGPACK, NPY, encoded_response, negotiate
+from app.utils.pagination import keyset_paginate, parse_limit
+from app.utils.validators import (
+    validate_document_update, validate_text_import, validate_text_input, validate_doc_id, validate_tsne_input
+)
 
-text_service = TextService()
+_text_service_lock = threading.Lock()
+# Most recent categorized documents the embedding categorizer is trained on, at most.
+CATEGORIZER_MAX_TRAINING_DOCUMENTS = 50000
+
+
+def get_text_service():
+    """
+    The application's TextService, created on first use so that CLI commands (which import
+    this module through create_app) don't load the models.
+    """
+    service = current_app.extensions.get('text_service')
+    if service is None:
+        with _text_service_lock:
+            service = current_app.extensions.get('text_service')
+            if service is None:
+                service = current_app.extensions['text_service'] = TextService()
+    return service
+
+DOCUMENT_FIELDS = (
+    'id', 'title', 'content', 'created_at', 'category', 'sentiment_score', 'keywords', 'summary', 'analysis_status'
+)
+
+
+def serialize_document(doc, fields=DOCUMENT_FIELDS):
+    """Serialize a TextDocument, restricted to the requested fields."""
+    values = {
+        'id': lambda: doc.id,
+        'title': lambda: doc.title,
+        'content': lambda: doc.content,
+        'created_at': lambda: doc.created_at.isoformat(),
+        'category': lambda: doc.category,
+        'sentiment_score': lambda: doc.sentiment_score,
+        'keywords': lambda: doc.keywords,
+        'summary': lambda: doc.summary,
+        'analysis_status': lambda: doc.analysis_status or 'done'
+    }
+    return {field: values[field]() for field in fields}
 
 class TextController:
     """
@@ -19,16 +70,100 @@ class TextController:
         """
         Analyze the given text and store the results in the database.
         Extracts sentiment score, keywords, summary, and category.
+        Near-duplicates of stored documents reuse their analysis or are rejected,
+        depending on TEXT_DEDUP_MODE. An optional "mode" (fast, balanced, quality or auto)
+        and "latency_budget_ms" select the model tier.
 
         Returns:
             JSON response with analysis details.
         """
         data = request.get_json()
-        analysis = text_service.analyze_text(data['text'])
+        text = data['text']
+        signature = DedupService.signature(text)
+        duplicate, similarity = TextController._find_duplicate(signature)
+        if duplicate is not None and Config.TEXT_DEDUP_MODE == 'reject':
+            return TextController._duplicate_error(duplicate, similarity)
+
+        if duplicate is not None:
+            analysis = TextController._reused_analysis(duplicate, similarity)
+        else:
+            analysis = get_text_service().analyze_text(text, data.get('mode'), data.get('latency_budget_ms'))
+        TextController._save_analysis(text, data.get('title', 'Untitled'), analysis, signature)
+        return jsonify(analysis)
+
+    @staticmethod
+    @validate_text_input
+    def analyze_text_stream():
+        """
+        Analyze the given text and stream each result as newline-delimited JSON
+        as soon as it is ready. The document is stored once all stages are done.
+
+        Each line is {"stage": <field>, "value": <result>}; the final line is
+        {"stage": "done", "document_id": <id>}.
+
+        Returns:
+            Streaming application/x-ndjson response.
+        """
+        data = request.get_json()
+        text = data['text']
+        title = data.get('title', 'Untitled')
+        signature = DedupService.signature(text)
+        duplicate, similarity = TextController._find_duplicate(signature)
+        if duplicate is not None and Config.TEXT_DEDUP_MODE == 'reject':
+            return TextController._duplicate_error(duplicate, similarity)
+
+        if duplicate is not None:
+            stages = TextController._reused_analysis(duplicate, similarity).items()
+        else:
+            stages = get_text_service().iter_analysis(text, data.get('mode'), data.get('latency_budget_ms'))
+
+        def generate():
+            analysis = {}
+            for field, value in stages:
+                analysis[field] = value
+                yield json.dumps({'stage': field, 'value': value}) + '\n'
+
+            doc = TextController._save_analysis(text, title, analysis, signature)
+            yield json.dumps({'stage': 'done', 'document_id': doc.id}) + '\n'
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        # Stop reverse proxies from buffering the stream.
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    @staticmethod
+    def _find_duplicate(signature):
+        """Look up a near-duplicate of a new text, unless deduplication is off."""
+        if Config.TEXT_DEDUP_MODE not in ('reuse', 'reject'):
+            return None, 0.0
+        return DedupService.find_duplicate(signature)
+
+    @staticmethod
+    def _duplicate_error(duplicate, similarity):
+        return jsonify({
+            'error': 'Text is a near-duplicate of an existing document',
+            'duplicate_of': duplicate.id,
+            'similarity': similarity
+        }), 409
 
+    @staticmethod
+    def _reused_analysis(duplicate, similarity):
+        """Build an analysis result from a near-duplicate's stored analysis."""
+        return {
+            'sentiment_score': duplicate.sentiment_score,
+            'keywords': duplicate.keywords,
+            'summary': duplicate.summary,
+            'category': duplicate.category,
+            'metadata': {'duplicate_of': duplicate.id, 'similarity': similarity}
+        }
+
+    @staticmethod
+    def _save_analysis(text, title, analysis, signature):
+        """Store a text and its analysis results as a TextDocument, and index it for deduplication."""
         doc = TextDocument(
-            content=data['text'],
-            title=data.get('title', 'Untitled'),
+            content=text,
+            title=title,
             sentiment_score=analysis['sentiment_score'],
             keywords=analysis['keywords'],
             summary=analysis['summary'],
@@ -36,9 +171,11 @@ class TextController:
         )
 
         db.session.add(doc)
+        db.session.flush()
+        DedupService.index_document(doc, signature)
+        ClusterService.assign([doc], current_app._get_current_object())
         db.session.commit()
-
-        return jsonify(analysis)
+        return doc
 
     @staticmethod
     @validate_tsne_input
@@ -47,41 +184,246 @@ class TextController:
         Generate t-SNE visualization coordinates for text clustering.
 
         Returns:
-            JSON response with t-SNE coordinates.
+            JSON response with t-SNE coordinates; as float32 arrays in MessagePack, or an
+            n x 2 NPY array, per Accept.
         """
         data = request.get_json()
-        tsne_result = text_service.generate_tsne(data['texts'])
-        return jsonify({'coordinates': tsne_result})
+        tsne_result = get_text_service().generate_tsne(data['texts'])
+        encoding = negotiate(MSGPACK, NPY)
+        if encoding == NPY:
+            return encoded_response(np.asarray(tsne_result, dtype=np.float32), encoding)
+        if encoding == MSGPACK:
+            tsne_result = np.asarray(tsne_result, dtype=np.float32)
+        return encoded_response({'coordinates': tsne_result}, encoding)
+
+    @staticmethod
+    def train_categorizer():
+        """
+        Start training the embedding categorizer in the background, on the most recent documents
+        already assigned one of the configured labels, with an optional JSON "limit" on their
+        number (default 5000). Only available when the embedding categorizer is enabled.
+
+        Returns:
+            JSON response saying whether training was started.
+        """
+        data = request.get_json(silent=True) or {}
+        limit = data.get('limit')
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+            return jsonify({'error': "'limit' must be a positive integer"}), 400
+        limit = parse_limit(limit, default=5000, maximum=CATEGORIZER_MAX_TRAINING_DOCUMENTS)
+
+        text_service = get_text_service()
+        if text_service.embedding_categorizer is None:
+            return jsonify({'error': 'Categorizer training requires TEXT_CATEGORIZER=embedding.'}), 400
+        if len(CategorizerTrainingService.trainable_categories(text_service.category_labels)) < 2:
+            return jsonify({'error': 'Need documents from at least 2 categories to train the categorizer.'}), 400
+
+        if not CategorizerTrainingService.start(current_app._get_current_object(), text_service, limit):
+            return jsonify({'message': 'Categorizer training is already running'}), 409
+        return jsonify({'message': 'Categorizer training started', 'limit': limit}), 202
+
+    @staticmethod
+    def get_categorizer():
+        """
+        Describe the categorizer: its kind, candidate labels, whether training is running,
+        and the trained head (when, on how many documents and which categories), if any.
+
+        Returns:
+            JSON response with the categorizer status.
+        """
+        text_service = get_text_service()
+        embedding_categorizer = text_service.embedding_categorizer
+        return jsonify({
+            'categorizer': text_service.categorizer,
+            'labels': text_service.category_labels,
+            'training': CategorizerTrainingService.is_running(),
+            'head': embedding_categorizer.head_info if embedding_categorizer is not None else None
+        })
+
+    @staticmethod
+    @validate_text_import
+    def import_documents():
+        """
+        Bulk import documents from NDJSON or CSV, sent as a "file" part or as the raw body.
+        Each row needs a "text" (or "content") field and may have a "title".
+        Rows are stored immediately; their analysis is filled in in the background,
+        with the model tier given by the optional "mode" query parameter.
+
+        Returns:
+            JSON response with the import job, its progress and the number of skipped rows.
+        """
+        if 'file' in request.files:
+            file = request.files['file']
+            filename = file.filename
+            file_type = 'csv' if filename.lower().endswith('.csv') else 'ndjson'
+            stream = file.stream
+        else:
+            filename = None
+            file_type = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+            stream = request.stream
+
+        try:
+            job, skipped = TextImportService.create_job(filename, TextImportService.iter_rows(stream, file_type))
+        except (UnicodeDecodeError, csv.Error) as e:
+            db.session.rollback()
+            return jsonify({'error': f'Could not parse import: {e}'}), 400
+
+        TextImportService.start_analysis(
+            current_app._get_current_object(), job.id, get_text_service(), request.args.get('mode')
+        )
+        return jsonify(dict(TextImportService.job_to_dict(job), skipped=skipped)), 202
+
+    @staticmethod
+    def get_import_job(job_id):
+        """
+        Report the progress of a bulk import job.
+
+        Args:
+            job_id (int): The ID of the import job.
+
+        Returns:
+            JSON response with the job status and progress.
+        """
+        job = TextImportJob.query.get_or_404(job_id)
+        return jsonify(TextImportService.job_to_dict(job))
+
+    @staticmethod
+    def get_clusters():
+        """
+        List the topic clusters of the stored corpus with their sizes and centroid keywords.
+
+        Returns:
+            JSON response with the clustering model info and its clusters.
+        """
+        clusters = TextCluster.query.order_by(TextCluster.size.desc()).all()
+        return jsonify(dict(ClusterService.model_info(), clusters=[{
+            'id': cluster.id,
+            'size': cluster.size,
+            'keywords': cluster.keywords,
+            'updated_at': cluster.updated_at.isoformat()
+        } for cluster in clusters]))
+
+    @staticmethod
+    def get_cluster_documents(cluster_id):
+        """
+        Retrieve a page of the documents in a cluster, newest first.
+
+        Args:
+            cluster_id (int): The ID of the cluster.
+
+        Query Parameters:
+            fields, limit, cursor: As for GET /documents (fields defaults to omit content).
+
+        Returns:
+            JSON response containing document details, with an X-Next-Cursor header
+            when more documents are available.
+        """
+        TextCluster.query.get_or_404(cluster_id)
+        return TextController._document_page(
+            [TextDocument.cluster_id == cluster_id], ('id', 'title', 'created_at', 'category')
+        )
+
+    @staticmethod
+    def refit_clusters():
+        """
+        Start refitting the clustering model on the stored corpus in the background.
+
+        Returns:
+            JSON response saying whether a refit was started.
+        """
+        if not ClusterService.start_refit(current_app._get_current_object()):
+            return jsonify({'message': 'A cluster refit is already running'}), 409
+        return jsonify({'message': 'Cluster refit started'}), 202
+
+    @staticmethod
+    def get_inference_metrics():
+        """
+        Report the inference server's queue depth, in-flight requests and throughput.
+
+        Returns:
+            JSON response with inference metrics.
+        """
+        try:
+            return jsonify(get_text_service().inference_metrics())
+        except (OSError, EOFError) as e:
+            return jsonify({'error': f'Inference server unavailable: {e}'}), 503
 
     @staticmethod
     def get_documents():
         """
-        Retrieve a list of stored text documents, optionally filtering by a search query.
+        Retrieve a page of stored text documents, newest first, optionally filtered.
+
+        Query Parameters:
+            search (str): Case-insensitive match on title or content.
+            category (str): Exact category match.
+            min_sentiment, max_sentiment (float): Inclusive sentiment score range.
+            fields (str): Comma-separated fields to return (e.g. "id,title,category").
+            limit (int): Page size (default 50, max 200).
+            cursor (str): Value of the X-Next-Cursor header from the previous page.
 
         Returns:
-            JSON response containing document details.
+            JSON response containing document details, with an X-Next-Cursor
+            header when more documents are available.
         """
         search_query = request.args.get('search', '').strip()
-        
-        query = TextDocument.query
+        category = request.args.get('category')
+        bounds = {}
+        for name in ('min_sentiment', 'max_sentiment'):
+            value = request.args.get(name)
+            if value is None:
+                continue
+            try:
+                bounds[name] = float(value)
+            except ValueError:
+                bounds[name] = float('nan')
+            if not math.isfinite(bounds[name]):
+                return jsonify({'error': f"'{name}' must be a number"}), 400
+        min_sentiment = bounds.get('min_sentiment')
+        max_sentiment = bounds.get('max_sentiment')
+
+        filters = []
         if search_query:
-            query = query.filter(or_(
+            filters.append(or_(
                 TextDocument.title.ilike(f"%{search_query}%"),
                 TextDocument.content.ilike(f"%{search_query}%")
             ))
+        if category:
+            filters.append(TextDocument.category == category)
+        if min_sentiment is not None:
+            filters.append(TextDocument.sentiment_score >= min_sentiment)
+        if max_sentiment is not None:
+            filters.append(TextDocument.sentiment_score <= max_sentiment)
 
-        documents = query.all()
-        
-        return jsonify([{
-            'id': doc.id,
-            'title': doc.title,
-            'content': doc.content,
-            'created_at': doc.created_at.isoformat(),
-            'category': doc.category,
-            'sentiment_score': doc.sentiment_score,
-            'keywords': doc.keywords,
-            'summary': doc.summary
-        } for doc in documents])
+        return TextController._document_page(filters, DOCUMENT_FIELDS)
+
+    @staticmethod
+    def _document_page(filters, default_fields):
+        """
+        Build a keyset-paginated, field-projected document listing response
+        from the fields, limit and cursor query parameters.
+        """
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or list(default_fields)
+        unknown = set(fields) - set(DOCUMENT_FIELDS)
+        if unknown:
+            return jsonify({'error': f'Unknown fields: {", ".join(sorted(unknown))}'}), 400
+
+        # Only load the projected columns (plus the keyset columns) from the database.
+        columns = {'id', 'created_at'} | set(fields)
+        query = TextDocument.query.options(load_only(*(getattr(TextDocument, c) for c in columns))).filter(*filters)
+
+        try:
+            documents, next_cursor = keyset_paginate(
+                query, TextDocument.created_at, TextDocument.id,
+                cursor=request.args.get('cursor'),
+                limit=parse_limit(request.args.get('limit', type=int))
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        response = jsonify([serialize_document(doc, fields) for doc in documents])
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
 
     @staticmethod
     @validate_doc_id
@@ -96,16 +438,7 @@ class TextController:
             JSON response containing document details.
         """
         doc = TextDocument.query.get_or_404(doc_id)
-        return jsonify({
-            'id': doc.id,
-            'title': doc.title,
-            'content': doc.content,
-            'created_at': doc.created_at.isoformat(),
-            'category': doc.category,
-            'sentiment_score': doc.sentiment_score,
-            'keywords': doc.keywords,
-            'summary': doc.summary
-        })
+        return jsonify(serialize_document(doc))
 
     @staticmethod
     @validate_document_update
@@ -113,7 +446,7 @@ class TextController:
     def update_document(doc_id):
         """
         Update an existing document with new content, title, or category.
-        Reanalyzes text if content is updated.
+        Reanalyzes text if content is updated, optionally with a "mode" and "latency_budget_ms".
         
         Args:
             doc_id (int): The ID of the document to update.
@@ -125,8 +458,10 @@ class TextController:
         data = request.get_json()
 
         if 'content' in data:
-            analysis = text_service.analyze_text(data['content'])
+            analysis = get_text_service().analyze_text(data['content'], data.get('mode'), data.get('latency_budget_ms'))
+            DedupService.index_document(doc, DedupService.signature(data['content']))
             doc.content = data['content']
+            ClusterService.assign([doc])
             doc.sentiment_score = analysis['sentiment_score']
             doc.keywords = analysis['keywords']
             doc.summary = analysis['summary']
@@ -152,6 +487,8 @@ class TextController:
             JSON response confirming deletion success.
         """
         doc = TextDocument.query.get_or_404(doc_id)
+        DedupService.remove_document(doc.id)
+        ClusterService.unassign(doc)
         db.session.delete(doc)
         db.session.commit()
         return jsonify({'message': 'Document deleted successfully'})
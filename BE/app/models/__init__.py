@@ -1,2 +1,3 @@
 from app.models.tabular import TabularData
-from app.models.text import TextDocument
\ No newline at end of file
+from app.models.image import ImageDocument, ImageHashBand
+from app.models.text import TextCluster, TextDocument, TextDocumentLSHBand, TextImportJob
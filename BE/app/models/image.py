@@ -0,0 +1,35 @@
+from .database import db
+from datetime import datetime
+
+class ImageDocument(db.Model):
+    """Metadata of a stored image, recorded at upload so it can be served without decoding the file."""
+    __tablename__ = 'image_document'
+    __table_args__ = (
+        db.Index('ix_image_document_created_at_id', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    original_filename = db.Column(db.String(255), nullable=False)
+    unique_filename = db.Column(db.String(255), nullable=False, unique=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_extension = db.Column(db.String(10), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    dimensions = db.Column(db.JSON)  # {"height", "width", "channels"}
+    color_histogram = db.Column(db.JSON)  # {"red", "green", "blue"}: 256 pixel counts each
+    processing_history = db.Column(db.JSON)  # [{"operation", "output", "created_at", ...}]
+    # SHA-256 of the stored bytes (NULL for images stored before content addressing)
+    content_hash = db.Column(db.String(64), unique=True)
+    # Uploads referencing this image; it is garbage collected when this drops to zero
+    ref_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    dhash = db.Column(db.BigInteger)  # 64-bit perceptual difference hash (NULL until indexed)
+    color_signature = db.Column(db.LargeBinary)  # float32 coarse histogram, see ImageSimilarityService
+
+
+class ImageHashBand(db.Model):
+    """One row per (hash chunk bucket, image): the multi-index hashing table used for similarity search."""
+    __tablename__ = 'image_hash_band'
+
+    bucket = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('image_document.id', ondelete='CASCADE'),
+                         primary_key=True, index=True)
@@ -2,11 +2,50 @@ from .database import db
 from datetime import datetime
 
 class TextDocument(db.Model):
+    __table_args__ = (
+        db.Index('ix_text_document_created_at_id', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     title = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    category = db.Column(db.String(100))
-    sentiment_score = db.Column(db.Float)
+    category = db.Column(db.String(100), index=True)
+    sentiment_score = db.Column(db.Float, index=True)
     keywords = db.Column(db.JSON)
     summary = db.Column(db.Text)
+    # NULL for documents analyzed on creation; 'pending', 'done' or 'failed' for bulk imports
+    analysis_status = db.Column(db.String(20), index=True)
+    import_job_id = db.Column(db.Integer, db.ForeignKey('text_import_job.id'), index=True)
+    minhash_signature = db.Column(db.LargeBinary)
+    cluster_id = db.Column(db.Integer, index=True)
+
+
+class TextDocumentLSHBand(db.Model):
+    """One row per (LSH band bucket, document): the banded index used for near-duplicate lookups."""
+    __tablename__ = 'text_document_lsh_band'
+
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('text_document.id', ondelete='CASCADE'),
+                            primary_key=True, index=True)
+
+
+class TextImportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    analyzed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    duplicates = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+
+class TextCluster(db.Model):
+    """A topic cluster of the current clustering model (ids are the model's cluster indexes)."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    size = db.Column(db.Integer, nullable=False, default=0)
+    keywords = db.Column(db.JSON)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
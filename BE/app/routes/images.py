@@ -5,11 +5,18 @@ from app.controllers.images_controller import ImageController
 
 bp = Blueprint('image', __name__, url_prefix='/api/images')
 
+bp.route('', methods=['GET'])(ImageController.list_images)
 bp.route('/upload', methods=['POST'])(ImageController.upload_images)
 bp.route('/<image_id>', methods=['GET'])(ImageController.get_image_details)
+bp.route('/<image_id>', methods=['DELETE'])(ImageController.delete_image)
+bp.route('/<image_id>/histogram', methods=['GET'])(ImageController.get_image_histogram)
+bp.route('/<image_id>/similar', methods=['GET'])(ImageController.get_similar_images)
+bp.route('/<image_id>/mask', methods=['GET'])(ImageController.get_image_mask)
 bp.route('/histogram', methods=['POST'])(ImageController.generate_histogram)
 bp.route('/resize', methods=['POST'])(ImageController.resize_image)
 bp.route('/convert', methods=['POST'])(ImageController.convert_image_format)
+bp.route('/batch-transform', methods=['POST'])(ImageController.batch_transform)
+bp.route('/storage/metrics', methods=['GET'])(ImageController.get_storage_metrics)
 bp.route('/view/<image_name>', methods=['GET'])(ImageController.get_image_by_name)
 bp.route('/download/<image_name>', methods=['GET'])(ImageController.download_image)
 
@@ -4,8 +4,17 @@ from app.controllers.text_controller import TextController
 text_bp = Blueprint("text", __name__, url_prefix="/api/text")
 
 text_bp.route("/analyze", methods=["POST"])(TextController.analyze_text)
+text_bp.route("/analyze/stream", methods=["POST"])(TextController.analyze_text_stream)
 text_bp.route("/tsne", methods=["POST"])(TextController.generate_tsne)
+text_bp.route("/categorizer", methods=["GET"])(TextController.get_categorizer)
+text_bp.route("/categorizer/train", methods=["POST"])(TextController.train_categorizer)
+text_bp.route("/clusters", methods=["GET"])(TextController.get_clusters)
+text_bp.route("/clusters/refit", methods=["POST"])(TextController.refit_clusters)
+text_bp.route("/clusters/<int:cluster_id>/documents", methods=["GET"])(TextController.get_cluster_documents)
+text_bp.route("/inference/metrics", methods=["GET"])(TextController.get_inference_metrics)
 text_bp.route("/documents", methods=["GET"])(TextController.get_documents)
+text_bp.route("/documents/import", methods=["POST"])(TextController.import_documents)
+text_bp.route("/imports/<int:job_id>", methods=["GET"])(TextController.get_import_job)
 text_bp.route("/documents/<int:doc_id>", methods=["GET"])(TextController.get_document)
 text_bp.route("/documents/<int:doc_id>", methods=["PUT"])(TextController.update_document)
 text_bp.route("/documents/<int:doc_id>", methods=["DELETE"])(TextController.delete_document)
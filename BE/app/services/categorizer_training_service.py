@@ -0,0 +1,99 @@
+import fcntl
+import logging
+import os
+import threading
+from sqlalchemy.orm import load_only
+from app import db
+from app.models.text import TextDocument
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class CategorizerTrainingService:
+    """
+    Trains the embedding categorizer's classification head in the background, on the
+    most recent documents already assigned one of the configured category labels.
+    """
+    # Rows fetched from the database at a time while collecting the training set.
+    FETCH_BATCH_SIZE = 1000
+
+    @staticmethod
+    def trainable_categories(labels, at_least=2):
+        """Up to `at_least` distinct configured labels that stored documents are assigned."""
+        rows = db.session.query(TextDocument.category).filter(
+            TextDocument.category.in_(labels)
+        ).distinct().limit(at_least).all()
+        return [category for (category,) in rows]
+
+    @staticmethod
+    def start(app, text_service, limit):
+        """
+        Train the head in a background thread, unless a training run is already going on
+        in any process.
+
+        Args:
+            app: The Flask application (the background thread needs its own app context).
+            text_service (TextService): Service whose embedding categorizer is trained.
+            limit (int): Maximum number of documents to train on.
+
+        Returns:
+            bool: True if training was started.
+        """
+        lock = CategorizerTrainingService._acquire_lock()
+        if lock is None:
+            return False
+
+        def run():
+            try:
+                with app.app_context():
+                    CategorizerTrainingService.train(text_service, limit)
+            except Exception:
+                logger.exception("Categorizer training failed")
+            finally:
+                lock.close()  # Releases the lock.
+
+        threading.Thread(target=run, name="text-categorizer-training", daemon=True).start()
+        return True
+
+    @staticmethod
+    def train(text_service, limit):
+        """
+        Train the head on up to `limit` documents.
+
+        Returns:
+            int: Number of distinct categories learned.
+        """
+        texts, categories = [], []
+        query = TextDocument.query.filter(
+            TextDocument.category.in_(text_service.category_labels)
+        ).order_by(TextDocument.created_at.desc()).options(
+            load_only(TextDocument.content, TextDocument.category)
+        ).limit(limit)
+        for doc in query.yield_per(CategorizerTrainingService.FETCH_BATCH_SIZE):
+            texts.append(doc.content)
+            categories.append(doc.category)
+        learned = text_service.train_categorizer(texts, categories)
+        logger.info(f"Categorizer trained on {len(texts)} documents ({learned} categories)")
+        return learned
+
+    @staticmethod
+    def is_running():
+        """Whether a training run holds the lock, in this or any other process."""
+        lock = CategorizerTrainingService._acquire_lock()
+        if lock is None:
+            return True
+        lock.close()
+        return False
+
+    @staticmethod
+    def _acquire_lock():
+        path = Config.TEXT_CATEGORIZER_HEAD_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock = open(path + '.lock', 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
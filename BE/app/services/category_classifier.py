@@ -0,0 +1,199 @@
+import logging
+import os
+import threading
+from datetime import datetime
+import joblib
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCategorizer:
+    """
+    Fast text categorizer that compares a single document embedding against
+    cached label embeddings, instead of running one NLI pass per candidate label.
+
+    Optionally, a lightweight logistic-regression head can be trained on the
+    embeddings of previously categorized documents; it then takes precedence
+    over label similarity, restricted to the candidate labels it was trained on.
+    The head is saved to `head_path`, so it survives restarts and is picked up by
+    every process using the same path.
+    """
+    LABEL_TEMPLATE = "This text is about {}."
+    # Texts per embedding call while training, so a large training set isn't sent as one batch.
+    EMBED_BATCH_SIZE = 64
+
+    def __init__(self, embedder, min_similarity=0.2, min_probability=0.3, head_path=None, model_name=None):
+        """
+        Args:
+            embedder: A transformers "feature-extraction" pipeline.
+            min_similarity (float): Cosine similarity below which a text is 'Uncategorized'.
+            min_probability (float): Probability below which the trained head returns 'Uncategorized'.
+            head_path (str): File the trained head is saved to and loaded from (None: memory only).
+            model_name (str): Name of the embedding model; a saved head trained on another
+                model's embeddings is ignored.
+        """
+        self.embedder = embedder
+        self.min_similarity = min_similarity
+        self.min_probability = min_probability
+        self.head_path = head_path
+        self.model_name = model_name
+        self._label_embeddings = {}
+        self._lock = threading.Lock()
+        self._head = None
+        self._head_info = None
+        self._head_mtime = None
+
+    def embed(self, texts):
+        """
+        Embed texts with mean pooling over token vectors.
+
+        Args:
+            texts (list of str): Texts to embed.
+
+        Returns:
+            np.ndarray: L2-normalized embeddings of shape (len(texts), hidden_size).
+        """
+        outputs = self.embedder(texts, truncation=True)
+        vectors = np.vstack([np.asarray(output[0]).mean(axis=0) for output in outputs])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def label_embeddings(self, labels):
+        """
+        Return embeddings for a label set, encoding it only the first time it is seen.
+
+        Args:
+            labels (list of str): Candidate labels.
+
+        Returns:
+            np.ndarray: Label embeddings of shape (len(labels), hidden_size).
+        """
+        key = tuple(labels)
+        with self._lock:
+            cached = self._label_embeddings.get(key)
+        if cached is None:
+            cached = self.embed([self.LABEL_TEMPLATE.format(label) for label in labels])
+            with self._lock:
+                self._label_embeddings[key] = cached
+        return cached
+
+    def fit(self, texts, categories):
+        """
+        Train the lightweight classification head on already categorized texts,
+        embedding them EMBED_BATCH_SIZE at a time.
+
+        Args:
+            texts (list of str): Document contents.
+            categories (list of str): Category assigned to each document.
+
+        Returns:
+            int: Number of distinct categories learned.
+        """
+        if len(set(categories)) < 2:
+            raise ValueError("Need documents from at least 2 categories to train the categorizer.")
+
+        embeddings = np.vstack([
+            self.embed(texts[i:i + self.EMBED_BATCH_SIZE]) for i in range(0, len(texts), self.EMBED_BATCH_SIZE)
+        ])
+        head = LogisticRegression(max_iter=1000)
+        head.fit(embeddings, categories)
+        info = {
+            'trained_at': datetime.utcnow().isoformat(),
+            'documents': len(texts),
+            'categories': [str(c) for c in head.classes_]
+        }
+        with self._lock:
+            self._head, self._head_info = head, info
+            if self.head_path:
+                os.makedirs(os.path.dirname(self.head_path), exist_ok=True)
+                joblib.dump({'model_name': self.model_name, 'head': head, 'info': info}, self.head_path + '.tmp')
+                os.replace(self.head_path + '.tmp', self.head_path)
+                self._head_mtime = os.path.getmtime(self.head_path)
+        return len(head.classes_)
+
+    def _current_head(self):
+        """Return the trained head, reloading it if another process saved a new one."""
+        if self.head_path:
+            try:
+                mtime = os.path.getmtime(self.head_path)
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != self._head_mtime:
+                with self._lock:
+                    if mtime != self._head_mtime:
+                        self._head, self._head_info = self._load_head()
+                        self._head_mtime = mtime
+        return self._head
+
+    def _load_head(self):
+        """Read the saved head and its info, or (None, None) if it can't be used."""
+        try:
+            saved = joblib.load(self.head_path)
+            model_name, head = saved['model_name'], saved['head']
+        except Exception:
+            logger.exception(
+                f"Ignoring the unreadable categorizer head in {self.head_path}; using label similarity"
+            )
+            return None, None
+        if model_name != self.model_name:
+            logger.warning(
+                f"Ignoring the categorizer head in {self.head_path}: it was trained on {model_name} embeddings"
+            )
+            return None, None
+        return head, saved.get('info')
+
+    @property
+    def head_info(self):
+        """When the current head was trained, on how many documents and which categories (None if untrained)."""
+        return self._head_info if self._current_head() is not None else None
+
+    @property
+    def is_trained(self):
+        return self._current_head() is not None
+
+    def predict(self, text, labels):
+        """
+        Categorize a single text.
+
+        Args:
+            text (str): The input text.
+            labels (list of str): Candidate labels.
+
+        Returns:
+            str: Best matching category or 'Uncategorized'.
+        """
+        return self.predict_batch([text], labels)[0]
+
+    def predict_batch(self, texts, labels):
+        """
+        Categorize several texts with a single embedding pass.
+
+        Args:
+            texts (list of str): The input texts.
+            labels (list of str): Candidate labels. The trained head only picks among the
+                labels it was trained on; without a head (or if it knows none of them),
+                texts are matched against the label embeddings.
+
+        Returns:
+            list of str: Best matching category or 'Uncategorized' per text.
+        """
+        embeddings = self.embed(texts)
+
+        head = self._current_head()
+        known = [i for i, category in enumerate(head.classes_) if category in labels] if head is not None else []
+        if known:
+            probabilities = head.predict_proba(embeddings)[:, known]
+            best = probabilities.argmax(axis=1)
+            return [
+                str(head.classes_[known[b]]) if p[b] > self.min_probability else "Uncategorized"
+                for b, p in zip(best, probabilities)
+            ]
+
+        similarities = embeddings @ self.label_embeddings(labels).T
+        best = similarities.argmax(axis=1)
+        return [
+            labels[b] if row[b] > self.min_similarity else "Uncategorized"
+            for b, row in zip(best, similarities)
+        ]
@@ -0,0 +1,236 @@
+import fcntl
+import logging
+import os
+import threading
+from datetime import datetime
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from app import db
+from app.models.text import TextCluster, TextDocument
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterService:
+    """
+    Online topic clustering of stored text documents.
+
+    A TF-IDF -> SVD -> mini-batch k-means model is periodically refitted in the
+    background on the stored corpus. In between, new documents are assigned to
+    their nearest centroid at insert time, which costs one projection and k
+    distance computations. A refit runs in one process at a time (under a file lock
+    next to the model), and is due once TEXT_CLUSTER_REFIT_EVERY documents were stored
+    after the documents the current model was fitted on.
+    """
+    PAGE_SIZE = 1000
+    SVD_COMPONENTS = 100
+
+    _model = None
+    _model_mtime = None
+    _model_lock = threading.Lock()
+
+    @staticmethod
+    def _load_model():
+        """Return the current model, reloading it if another process refitted it."""
+        path = Config.TEXT_CLUSTER_MODEL_PATH
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        with ClusterService._model_lock:
+            if ClusterService._model_mtime != mtime:
+                ClusterService._model = joblib.load(path)
+                ClusterService._model_mtime = mtime
+            return ClusterService._model
+
+    @staticmethod
+    def _embed(model, texts):
+        vectors = model['vectorizer'].transform(texts)
+        if model['svd'] is not None:
+            vectors = model['svd'].transform(vectors)
+        return normalize(vectors)
+
+    @staticmethod
+    def assign(documents, app=None):
+        """
+        Assign new documents to their nearest cluster, and schedule a background refit
+        once enough documents have been added. The caller commits.
+
+        Args:
+            documents (list of TextDocument): Flushed documents to assign.
+            app: The Flask application, used to run a refit in the background.
+        """
+        model = ClusterService._load_model()
+        if model is not None and model['kmeans'] is not None and documents:
+            labels = model['kmeans'].predict(ClusterService._embed(model, [doc.content for doc in documents]))
+            for doc, label in zip(documents, labels):
+                if doc.cluster_id is not None:
+                    ClusterService._adjust_size(doc.cluster_id, -1)
+                doc.cluster_id = int(label)
+                ClusterService._adjust_size(doc.cluster_id, 1)
+
+        if app is not None and (model is None or ClusterService._refit_due(model)):
+            ClusterService.start_refit(app)
+
+    @staticmethod
+    def _refit_due(model):
+        """
+        Whether TEXT_CLUSTER_REFIT_EVERY documents (or, after a refit that found too few
+        documents, the number still missing) were stored since the model was fitted.
+        """
+        every = model.get('refit_after', Config.TEXT_CLUSTER_REFIT_EVERY)
+        return db.session.query(TextDocument.id).filter(
+            TextDocument.id > model.get('last_document_id', 0)
+        ).order_by(TextDocument.id).offset(every - 1).limit(1).first() is not None
+
+    @staticmethod
+    def unassign(doc):
+        """Remove a document from its cluster's size before it is deleted. The caller commits."""
+        if doc.cluster_id is not None:
+            ClusterService._adjust_size(doc.cluster_id, -1)
+
+    @staticmethod
+    def _adjust_size(cluster_id, delta):
+        TextCluster.query.filter_by(id=cluster_id).update({TextCluster.size: TextCluster.size + delta})
+
+    @staticmethod
+    def start_refit(app):
+        """
+        Refit the clustering model in a background thread, unless a refit is already running
+        in any process.
+
+        Returns:
+            bool: True if a refit was started.
+        """
+        path = Config.TEXT_CLUSTER_MODEL_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock = open(path + '.lock', 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+
+        def run():
+            try:
+                with app.app_context():
+                    ClusterService.refit()
+            except Exception:
+                logger.exception("Text cluster refit failed")
+            finally:
+                lock.close()  # Releases the lock.
+
+        threading.Thread(target=run, name="text-cluster-refit", daemon=True).start()
+        return True
+
+    @staticmethod
+    def refit():
+        """
+        Fit a new model on a sample of the corpus, reassign every document and
+        recompute cluster sizes and centroid keywords. The new model is saved first, so
+        documents stored during the reassignment are labelled by it too.
+
+        With too few documents for two clusters, and no model yet, an "insufficient data"
+        model without clusters is saved instead, so that the next refit waits for the
+        missing documents rather than running again on every insert.
+
+        Returns:
+            int: Number of clusters, or 0 if there are too few documents.
+        """
+        last_document_id = db.session.query(db.func.max(TextDocument.id)).scalar() or 0
+        sample = [content for (content,) in db.session.query(TextDocument.content).order_by(
+            TextDocument.id.desc()
+        ).limit(Config.TEXT_CLUSTER_FIT_SAMPLE)]
+        n_clusters = min(Config.TEXT_CLUSTER_COUNT, len(sample))
+        if n_clusters < 2:
+            current = ClusterService._load_model()
+            if current is None or current['kmeans'] is None:
+                ClusterService._save_model({
+                    'vectorizer': None, 'svd': None, 'kmeans': None,
+                    'fitted_at': datetime.utcnow(),
+                    'last_document_id': last_document_id,
+                    'refit_after': 2 - len(sample) if Config.TEXT_CLUSTER_COUNT >= 2 else Config.TEXT_CLUSTER_REFIT_EVERY
+                })
+            return 0
+
+        vectorizer = TfidfVectorizer(stop_words='english', max_features=50000, sublinear_tf=True)
+        tfidf = vectorizer.fit_transform(sample)
+        svd = None
+        if tfidf.shape[1] > ClusterService.SVD_COMPONENTS:
+            svd = TruncatedSVD(n_components=ClusterService.SVD_COMPONENTS, random_state=42).fit(tfidf)
+        model = {'vectorizer': vectorizer, 'svd': svd}
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=1024, n_init=3)
+        model['kmeans'] = kmeans.fit(ClusterService._embed(model, sample))
+        model['fitted_at'] = datetime.utcnow()
+        model['last_document_id'] = last_document_id
+        ClusterService._save_model(model)
+
+        # Reassign the whole corpus page by page.
+        last_id = 0
+        while True:
+            page = db.session.query(TextDocument.id, TextDocument.content).filter(
+                TextDocument.id > last_id
+            ).order_by(TextDocument.id).limit(ClusterService.PAGE_SIZE).all()
+            if not page:
+                break
+            labels = kmeans.predict(ClusterService._embed(model, [content for _, content in page]))
+            db.session.bulk_update_mappings(TextDocument, [
+                {'id': doc_id, 'cluster_id': int(label)} for (doc_id, _), label in zip(page, labels)
+            ])
+            db.session.commit()
+            last_id = page[-1][0]
+
+        TextCluster.query.delete()
+        db.session.add_all([
+            TextCluster(
+                id=cluster_id,
+                size=0,
+                keywords=ClusterService._centroid_keywords(model, cluster_id),
+                updated_at=model['fitted_at']
+            ) for cluster_id in range(n_clusters)
+        ])
+        db.session.commit()
+        # Counted after the swap, in one statement, so documents assigned meanwhile (whose
+        # size adjustments may have hit the old rows) are included.
+        ClusterService.recount_sizes()
+        return n_clusters
+
+    @staticmethod
+    def recount_sizes():
+        """Set every cluster's size to the number of documents assigned to it."""
+        TextCluster.query.update({
+            TextCluster.size: db.session.query(db.func.count(TextDocument.id)).filter(
+                TextDocument.cluster_id == TextCluster.id
+            ).scalar_subquery()
+        }, synchronize_session=False)
+        db.session.commit()
+
+    @staticmethod
+    def _save_model(model):
+        path = Config.TEXT_CLUSTER_MODEL_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(model, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _centroid_keywords(model, cluster_id, top_n=10):
+        """Map a centroid back to term space and return its highest-weighted terms."""
+        centroid = model['kmeans'].cluster_centers_[cluster_id]
+        if model['svd'] is not None:
+            centroid = centroid @ model['svd'].components_
+        terms = model['vectorizer'].get_feature_names_out()
+        return [str(terms[i]) for i in np.argsort(centroid)[::-1][:top_n]]
+
+    @staticmethod
+    def model_info():
+        """Describe the current clustering model."""
+        model = ClusterService._load_model()
+        if model is None or model['kmeans'] is None:
+            return {'fitted_at': None, 'clusters': 0}
+        return {'fitted_at': model['fitted_at'].isoformat(), 'clusters': int(model['kmeans'].n_clusters)}
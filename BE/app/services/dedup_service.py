@@ -0,0 +1,127 @@
+import hashlib
+import re
+import numpy as np
+from sqlalchemy import or_
+from app import db
+from app.models.text import TextDocument, TextDocumentLSHBand
+from config import Config
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class DedupService:
+    """
+    Near-duplicate detection for text documents with MinHash signatures and a
+    banded LSH index stored in the database.
+
+    Each document's signature is split into bands; every band is hashed to a bucket
+    and stored in text_document_lsh_band. Documents sharing at least one bucket are
+    candidates, and candidates are confirmed by comparing full signatures, so a
+    lookup costs a handful of index probes regardless of corpus size.
+    """
+    NUM_PERM = 128
+    BANDS = 16  # 16 bands x 8 rows: documents above ~0.7 Jaccard similarity become candidates
+    ROWS = NUM_PERM // BANDS
+    SHINGLE_SIZE = 5
+    MAX_CANDIDATES = 100
+
+    _generator = np.random.RandomState(1)
+    _a = _generator.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+    _b = _generator.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+    @staticmethod
+    def signature(text):
+        """
+        Compute the MinHash signature of a text over word shingles.
+
+        Args:
+            text (str): The input text.
+
+        Returns:
+            np.ndarray: uint32 signature of length NUM_PERM.
+        """
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        size = min(DedupService.SHINGLE_SIZE, max(len(tokens), 1))
+        shingles = {" ".join(tokens[i:i + size]) for i in range(max(len(tokens) - size + 1, 1))}
+        hashes = np.array([
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles
+        ], dtype=np.uint64)
+
+        # Universal hashing (a * x + b) mod p for all permutations at once, then the minimum per permutation.
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(hashes, DedupService._a) + DedupService._b) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=0).astype(np.uint32)
+
+    @staticmethod
+    def buckets(signature):
+        """Hash each band of a signature to a signed 64-bit bucket id (unique per band)."""
+        buckets = []
+        for band in range(DedupService.BANDS):
+            rows = signature[band * DedupService.ROWS:(band + 1) * DedupService.ROWS]
+            digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+            buckets.append(int.from_bytes(digest, "little", signed=True))
+        return buckets
+
+    @staticmethod
+    def similarity(signature, other):
+        """Estimate the Jaccard similarity of two documents from their signatures."""
+        return float(np.mean(signature == other))
+
+    @staticmethod
+    def find_duplicate(signature, threshold=None, exclude_id=None):
+        """
+        Find the most similar already analyzed document above the similarity threshold.
+
+        Args:
+            signature (np.ndarray): Signature of the new document.
+            threshold (float): Minimum estimated Jaccard similarity (default: TEXT_DEDUP_THRESHOLD).
+            exclude_id (int): Document to ignore, e.g. the one being updated.
+
+        Returns:
+            tuple: (TextDocument, similarity), or (None, 0.0) if there is no near-duplicate.
+        """
+        threshold = Config.TEXT_DEDUP_THRESHOLD if threshold is None else threshold
+        candidate_ids = db.session.query(TextDocumentLSHBand.document_id).filter(
+            TextDocumentLSHBand.bucket.in_(DedupService.buckets(signature))
+        ).distinct().limit(DedupService.MAX_CANDIDATES)
+
+        query = TextDocument.query.filter(
+            TextDocument.id.in_(candidate_ids.scalar_subquery()),
+            or_(TextDocument.analysis_status.is_(None), TextDocument.analysis_status == 'done')
+        )
+        if exclude_id is not None:
+            query = query.filter(TextDocument.id != exclude_id)
+
+        best, best_similarity = None, 0.0
+        for candidate in query:
+            if candidate.minhash_signature is None:
+                continue
+            similarity = DedupService.similarity(
+                signature, np.frombuffer(candidate.minhash_signature, dtype=np.uint32)
+            )
+            if similarity >= threshold and similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        return best, best_similarity
+
+    @staticmethod
+    def index_document(doc, signature):
+        """
+        Store a document's signature and LSH buckets. The caller commits.
+
+        Args:
+            doc (TextDocument): A flushed document (it must have an id).
+            signature (np.ndarray): The document's signature.
+        """
+        DedupService.remove_document(doc.id)
+        doc.minhash_signature = signature.tobytes()
+        db.session.add_all([
+            TextDocumentLSHBand(bucket=bucket, document_id=doc.id)
+            for bucket in set(DedupService.buckets(signature))
+        ])
+
+    @staticmethod
+    def remove_document(doc_id):
+        """Drop a document's LSH buckets. The caller commits."""
+        TextDocumentLSHBand.query.filter_by(document_id=doc_id).delete()
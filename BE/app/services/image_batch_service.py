@@ -0,0 +1,200 @@
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import cv2
+import numpy as np
+from PIL import Image
+from app.services.image_derivative_service import DERIVATIVE_FORMATS, ImageDerivativeService
+from app.services.image_service import MASK_METHODS, ImageService
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Transforms of batch requests; Pillow and OpenCV release the GIL while resampling and encoding.
+_transform_executor = ThreadPoolExecutor(max_workers=Config.IMAGE_BATCH_WORKERS, thread_name_prefix="image-transform")
+
+# Uploads larger than this are spooled to disk while they wait for a worker.
+_SPOOL_MAX_BYTES = 1024 * 1024
+# Transform options echoed in the manifest.
+BATCH_OPTIONS = ('w', 'h', 'fit', 'format', 'quality', 'downscale', 'mask')
+
+
+class _StreamSink:
+    """Non-seekable file object that collects what ZipFile writes until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ImageBatchService:
+    """
+    Runs a transform pipeline (resize -> convert -> optional segmentation mask) over many
+    images in parallel and streams the results as a ZIP archive.
+
+    The archive is written to a non-seekable sink (entries use data descriptors) and
+    drained after every finished image, so it is never held in memory as a whole; at most
+    twice IMAGE_BATCH_WORKERS results are in flight. Failures do not abort the batch; every
+    image gets an entry in manifest.json, written last.
+    """
+
+    @staticmethod
+    def validate_options(args):
+        """
+        Validate the pipeline options.
+
+        Args:
+            args: Mapping with optional w, h, fit, format, quality, downscale and mask.
+
+        Raises:
+            ValueError: If an option is invalid.
+        """
+        ImageDerivativeService.parse_options(args, 'png')
+        if args.get('mask') not in (None, '') and args.get('mask') not in MASK_METHODS:
+            raise ValueError(f"'mask' must be one of: {', '.join(MASK_METHODS)}")
+
+    @staticmethod
+    def spool(upload):
+        """
+        Copy an uploaded file into a temporary file owned by the batch: the request's own
+        files are closed once the view returns, before the archive is streamed.
+
+        Args:
+            upload: Uploaded file.
+
+        Returns:
+            File object positioned at the start (in memory, or on disk above 1 MiB).
+        """
+        spooled = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_BYTES)
+        shutil.copyfileobj(upload.stream, spooled)
+        spooled.seek(0)
+        return spooled
+
+    @staticmethod
+    def transform(source, filename, stem, args):
+        """
+        Run the pipeline on one image.
+
+        Args:
+            source: Path of a stored image (served through the derivative cache), or a spooled
+                upload (closed once read).
+            filename (str): The image's file name; its extension is the default output format.
+            stem (str): Name of the image's entries in the archive, without extension.
+            args: Pipeline options (see `validate_options`).
+
+        Returns:
+            tuple: ([(entry name, bytes)], manifest entry)
+        """
+        extension = filename.rsplit('.', 1)[-1].lower()
+        options = ImageDerivativeService.parse_options(args, extension if extension in DERIVATIVE_FORMATS else 'png')
+        try:
+            if isinstance(source, str):
+                with open(ImageDerivativeService.get_derivative(source, options), 'rb') as f:
+                    data = f.read()
+            else:
+                output = io.BytesIO()
+                with source:
+                    ImageDerivativeService.render(source, options, output)
+                data = output.getvalue()
+        except Image.UnidentifiedImageError:
+            raise ValueError('Could not decode image')
+
+        name = f"{stem}.{'jpg' if options['format'] == 'jpeg' else options['format']}"
+        entries = [(name, data)]
+        with Image.open(io.BytesIO(data)) as img:
+            info = {'output': name, 'width': img.width, 'height': img.height, 'size': len(data)}
+            if args.get('mask'):
+                rgb = np.asarray(img.convert('RGB'))
+                mask = ImageService.segmentation_mask(rgb[..., ::-1], args['mask'])
+                info['mask'] = f"{stem}_mask.png"
+                entries.append((info['mask'], cv2.imencode('.png', mask)[1].tobytes()))
+        return entries, info
+
+    @staticmethod
+    def stream_zip(items, args):
+        """
+        Transform images in parallel and yield a ZIP archive of the results incrementally,
+        in the order the images finish.
+
+        Args:
+            items (list): (label, filename, source, error) per image: label identifies the image
+                in the manifest, source is a stored image's path or a spooled upload, and error
+                is set (with source None) for images that could not be resolved.
+            args: Pipeline options (see `validate_options`).
+
+        Yields:
+            bytes: Consecutive chunks of the archive.
+        """
+        sink = _StreamSink()
+        results = [None] * len(items)
+        pending = {}
+        stems = set()
+        queue = iter(enumerate(items))
+
+        def unique_stem(index, filename):
+            stem = os.path.splitext(os.path.basename(filename))[0] or 'image'
+            while stem in stems:
+                stem = f"{stem}_{index}"
+            stems.add(stem)
+            return stem
+
+        def submit_next():
+            for index, (label, filename, source, error) in queue:
+                if error:
+                    results[index] = {'source': label, 'error': error}
+                    continue
+                future = _transform_executor.submit(
+                    ImageBatchService.transform, source, filename, unique_stem(index, filename), args
+                )
+                pending[future] = (index, label)
+                return
+
+        try:
+            with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+                for _ in range(Config.IMAGE_BATCH_WORKERS * 2):
+                    submit_next()
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, label = pending.pop(future)
+                        try:
+                            entries, info = future.result()
+                        except Exception as e:
+                            logger.warning(f"Batch transform of {label} failed: {e}")
+                            results[index] = {'source': label, 'error': str(e)}
+                        else:
+                            for name, data in entries:
+                                archive.writestr(name, data)
+                            results[index] = dict(info, source=label)
+                        submit_next()
+                    yield sink.drain()
+
+                failed = sum(1 for result in results if 'error' in result)
+                manifest = {
+                    'succeeded': len(results) - failed,
+                    'failed': failed,
+                    'options': {key: args.get(key) for key in BATCH_OPTIONS if args.get(key) not in (None, '')},
+                    'results': results
+                }
+                archive.writestr('manifest.json', json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+            yield sink.drain()
+        finally:
+            # The client went away mid-stream: drop the transforms that have not started.
+            for future in pending:
+                future.cancel()
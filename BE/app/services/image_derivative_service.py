@@ -0,0 +1,326 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from PIL import Image, ImageOps
+from app.services.image_service import DOWNSCALE_MODES, ImageService
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Output formats a derivative can be encoded as, by requested name.
+DERIVATIVE_FORMATS = {
+    'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'gif': 'GIF', 'bmp': 'BMP', 'tiff': 'TIFF'
+}
+FIT_MODES = ('contain', 'cover', 'fill')
+# EXIF orientations that swap width and height.
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+# Largest width or height a WebP image can have.
+WEBP_MAX_DIMENSION = 16383
+
+# Encodes negotiated WebP copies of originals off the request path, one at a time.
+_background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-derivative")
+
+
+class ImageDerivativeService:
+    """
+    Resized / converted variants of stored images, generated on demand and kept in a
+    content-addressed disk cache.
+
+    A derivative's file name is a hash of the original's identity and the requested
+    options, so a cached file never goes stale. The cache is bounded by
+    IMAGE_DERIVATIVE_CACHE_BYTES: least recently used derivatives (by modification time,
+    refreshed on every hit) are evicted first. Concurrent requests for the same derivative
+    wait for a single generation.
+    """
+    _key_locks = {}
+    _key_locks_guard = threading.Lock()
+    _evict_lock = threading.Lock()
+    _cache_bytes = None
+    _queued = set()
+    _queued_lock = threading.Lock()
+
+    @staticmethod
+    def parse_options(args, source_extension):
+        """
+        Validate derivative options from query parameters.
+
+        Args:
+            args: Mapping with optional w, h, fit, format, quality and downscale.
+            source_extension (str): Extension of the original, the default output format.
+
+        Returns:
+            dict: Normalized options.
+
+        Raises:
+            ValueError: If an option is invalid.
+        """
+        options = {}
+        for name in ('w', 'h'):
+            value = args.get(name)
+            if value is None:
+                options[name] = None
+                continue
+            if not str(value).isdigit() or not 1 <= int(value) <= Config.IMAGE_DERIVATIVE_MAX_DIMENSION:
+                raise ValueError(f"'{name}' must be an integer between 1 and {Config.IMAGE_DERIVATIVE_MAX_DIMENSION}")
+            options[name] = int(value)
+
+        options['fit'] = args.get('fit', 'contain').lower()
+        if options['fit'] not in FIT_MODES:
+            raise ValueError(f"'fit' must be one of: {', '.join(FIT_MODES)}")
+        if options['fit'] != 'contain' and not (options['w'] and options['h']):
+            raise ValueError(f"fit={options['fit']} needs both 'w' and 'h'")
+
+        options['format'] = args.get('format', source_extension).lower()
+        if options['format'] not in DERIVATIVE_FORMATS:
+            raise ValueError(f"'format' must be one of: {', '.join(DERIVATIVE_FORMATS)}")
+
+        quality = args.get('quality')
+        if quality is not None and (not str(quality).isdigit() or not 1 <= int(quality) <= 100):
+            raise ValueError("'quality' must be an integer between 1 and 100")
+        options['quality'] = int(quality) if quality is not None else None
+
+        options['downscale'] = args.get('downscale', Config.IMAGE_DOWNSCALE_MODE).lower()
+        if options['downscale'] not in DOWNSCALE_MODES:
+            raise ValueError(f"'downscale' must be one of: {', '.join(DOWNSCALE_MODES)}")
+        return options
+
+    @staticmethod
+    def cache_key(source_path, options):
+        """
+        Content-addressed key of a derivative: the original's identity plus the options and
+        encoder profile, so changing the profile's settings regenerates derivatives.
+        """
+        stat = os.stat(source_path)
+        image_format = DERIVATIVE_FORMATS[options['format']]
+        profile = ImageService.encoder_options(image_format, options['quality'])
+        identity = (
+            f"{os.path.basename(source_path)}|{stat.st_size}|{stat.st_mtime_ns}|"
+            f"{options['w']}|{options['h']}|{options['fit']}|{image_format}|{options['quality']}|{options['downscale']}|"
+            f"{sorted(profile.items())}|{Config.IMAGE_WEBP_LOSSLESS if image_format == 'WEBP' else ''}"
+        )
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    @staticmethod
+    def get_derivative(source_path, options):
+        """
+        Return the path of a cached derivative, generating it if needed.
+
+        Args:
+            source_path (str): Path of the original image.
+            options (dict): Options from `parse_options`.
+
+        Returns:
+            str: Path of the derivative in the cache.
+        """
+        key, path = ImageDerivativeService._cache_path(source_path, options)
+        with ImageDerivativeService._lock_for(key):
+            if os.path.exists(path):
+                os.utime(path)  # Mark as recently used.
+                return path
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            ImageDerivativeService.render(source_path, options, tmp_path)
+            os.replace(tmp_path, path)
+
+        ImageDerivativeService._account(path)
+        return path
+
+    @staticmethod
+    def webp_variant(source_path):
+        """
+        The WebP encoding of an original, for clients that accept WebP, without encoding it on
+        the request path: if it isn't cached yet, it is queued for a background worker and the
+        original is served meanwhile. Images larger than WebP allows are never encoded.
+
+        Args:
+            source_path (str): Path of the original image.
+
+        Returns:
+            tuple: (path of the cached WebP if it is smaller than the original, else None;
+                whether the WebP is still being generated).
+        """
+        try:
+            with Image.open(source_path) as img:
+                if max(img.size) > WEBP_MAX_DIMENSION:
+                    return None, False
+        except (OSError, ValueError):
+            return None, False
+
+        options = ImageDerivativeService.parse_options({}, 'webp')
+        key, path = ImageDerivativeService._cache_path(source_path, options)
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # Mark as recently used.
+                smaller = os.path.getsize(path) < os.path.getsize(source_path)
+            except OSError:  # Evicted meanwhile.
+                return None, False
+            return (path if smaller else None), False
+
+        with ImageDerivativeService._queued_lock:
+            if key not in ImageDerivativeService._queued:
+                ImageDerivativeService._queued.add(key)
+                _background_executor.submit(ImageDerivativeService._generate_queued, key, source_path, options)
+        return None, True
+
+    @staticmethod
+    def _generate_queued(key, source_path, options):
+        try:
+            ImageDerivativeService.get_derivative(source_path, options)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not encode {os.path.basename(source_path)} as WebP: {e}")
+        finally:
+            with ImageDerivativeService._queued_lock:
+                ImageDerivativeService._queued.discard(key)
+
+    @staticmethod
+    def _cache_path(source_path, options):
+        """Cache key and path of a derivative."""
+        key = ImageDerivativeService.cache_key(source_path, options)
+        extension = 'jpg' if options['format'] == 'jpeg' else options['format']
+        return key, os.path.join(Config.IMAGE_DERIVATIVE_CACHE_DIR, key[:2], f"{key}.{extension}")
+
+    @staticmethod
+    def render(source, options, destination):
+        """
+        Generate a derivative without caching it.
+
+        Args:
+            source: Path or file object of the original image.
+            options (dict): Options from `parse_options`.
+            destination: Path or file object to write the encoded derivative to.
+        """
+        with Image.open(source) as img:
+            source_format = img.format
+            derivative = ImageDerivativeService._transform(img, options)
+            image_format = DERIVATIVE_FORMATS[options['format']]
+            derivative.save(
+                destination, format=image_format,
+                **ImageService.encoder_options(image_format, options['quality'], source_format)
+            )
+
+    @staticmethod
+    @contextmanager
+    def _lock_for(key):
+        """Hold the per-key lock; it is dropped from the registry once nobody holds or waits for it."""
+        guard, locks = ImageDerivativeService._key_locks_guard, ImageDerivativeService._key_locks
+        with guard:
+            lock, waiters = locks.get(key, (threading.Lock(), 0))
+            locks[key] = (lock, waiters + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with guard:
+                lock, waiters = locks[key]
+                if waiters == 1:
+                    del locks[key]
+                else:
+                    locks[key] = (lock, waiters - 1)
+
+    @staticmethod
+    def _output_size(options, source_size):
+        """Size of the derivative of an image of source_size (width, height), after EXIF rotation."""
+        width, height = options['w'], options['h']
+        source_width, source_height = source_size
+        if width and height:
+            if options['fit'] != 'contain':
+                return width, height
+            scale = min(width / source_width, height / source_height)
+            return max(1, round(source_width * scale)), max(1, round(source_height * scale))
+        if width:
+            return width, max(1, round(source_height * width / source_width))
+        if height:
+            return max(1, round(source_width * height / source_height)), height
+        return source_size
+
+    @staticmethod
+    def _cover_box(source_size, size):
+        """Centered region of the source with the aspect ratio of size."""
+        source_width, source_height = source_size
+        if source_width * size[1] > source_height * size[0]:
+            crop_width = source_height * size[0] / size[1]
+            return ((source_width - crop_width) / 2, 0, (source_width + crop_width) / 2, source_height)
+        crop_height = source_width * size[1] / size[0]
+        return (0, (source_height - crop_height) / 2, source_width, (source_height + crop_height) / 2)
+
+    @staticmethod
+    def _transform(img, options):
+        transposed = img.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS
+        source_size = img.size[::-1] if transposed else img.size
+        size = ImageDerivativeService._output_size(options, source_size)
+        if size != source_size:
+            # Decode only as much resolution as the output needs.
+            ImageService.draft(img, size[::-1] if transposed else size, options['downscale'])
+
+        img = ImageOps.exif_transpose(img)
+        if size != img.size:
+            box = ImageDerivativeService._cover_box(img.size, size) if options['fit'] == 'cover' else None
+            img = ImageService.resample(img, size, box=box, mode=options['downscale'])
+
+        if DERIVATIVE_FORMATS[options['format']] == 'JPEG' and img.mode != 'RGB':
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[3])
+                img = background
+            else:
+                img = img.convert('RGB')
+        return img
+
+    @staticmethod
+    def _account(new_path):
+        """Track the cache size and evict least recently used derivatives above the budget."""
+        with ImageDerivativeService._evict_lock:
+            if ImageDerivativeService._cache_bytes is None:
+                ImageDerivativeService._cache_bytes = sum(size for _, size, _ in ImageDerivativeService._entries())
+            else:
+                ImageDerivativeService._cache_bytes += os.path.getsize(new_path)
+            if ImageDerivativeService._cache_bytes > Config.IMAGE_DERIVATIVE_CACHE_BYTES:
+                ImageDerivativeService._cache_bytes = ImageDerivativeService._evict(keep=new_path)
+
+    @staticmethod
+    def _entries():
+        """Yield (path, size, last used) for every cached derivative."""
+        for root, _, files in os.walk(Config.IMAGE_DERIVATIVE_CACHE_DIR):
+            for filename in files:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def _evict(keep=None):
+        """
+        Delete least recently used derivatives until the cache is under 90% of its budget.
+        Rescans the directory, so derivatives written by other processes are accounted for.
+
+        Args:
+            keep (str): A derivative that is about to be served and must not be evicted.
+
+        Returns:
+            int: The cache size after eviction.
+        """
+        entries = sorted(ImageDerivativeService._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = Config.IMAGE_DERIVATIVE_CACHE_BYTES * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        logger.info(f"Derivative cache evicted down to {total} bytes")
+        return total
@@ -1,8 +1,64 @@
+import glob
+import hashlib
+import io
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
 import cv2
-import PIL
+import numpy as np
 from PIL import Image
 import uuid
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.image import ImageDocument
+from app.services.image_similarity_service import ImageSimilarityService
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Bounded pool shared by all batch uploads; OpenCV releases the GIL while decoding and thresholding.
+_batch_executor = ThreadPoolExecutor(max_workers=Config.IMAGE_BATCH_WORKERS, thread_name_prefix="image-batch")
+# Writes originals and masks to disk off the request path.
+_persist_executor = ThreadPoolExecutor(max_workers=Config.IMAGE_PERSIST_WORKERS, thread_name_prefix="image-persist")
+# Background writes not finished yet, by destination path, so readers can wait for them.
+_pending_writes = {}
+_pending_writes_lock = threading.Lock()
+# Longest a request waits for a pending write of the file it reads.
+WRITE_WAIT_SECONDS = 30
+# Journal of file writes, accesses and removals in the upload directory, see ImageService.log_usage.
+USAGE_JOURNAL = '.usage.log'
+
+# Offsets that put the blue, green and red values of a BGR pixel into disjoint histogram bins.
+_CHANNEL_OFFSETS = np.array([0, 256, 512], dtype=np.uint16)
+# Working memory per pixel of a strip: the histogram's offset values and bin indices, gray and mask rows.
+_STRIP_BYTES_PER_PIXEL = 32
+ADAPTIVE_BLOCK_SIZE = 11
+MASK_METHODS = ('simple', 'adaptive', 'otsu')
+# Uncompressed layouts that can be mapped instead of decoded: channels, and the slice giving BGR order.
+_RAW_LAYOUTS = {
+    'L': (1, None),
+    'RGB': (3, slice(2, None, -1)),
+    'RGBA': (4, slice(2, None, -1)),
+    'RGBX': (4, slice(2, None, -1)),
+    'BGR': (3, slice(0, 3)),
+    'BGRA': (4, slice(0, 3)),
+    'BGRX': (4, slice(0, 3))
+}
+
+# Resampling per downscale mode (IMAGE_DOWNSCALE_MODE). With a reducing gap, JPEGs are decoded
+# at a reduced scale (DCT scaling) and shrunk by whole factors before the final resample,
+# keeping at least `reducing_gap` times the target size; "quality" resamples the full image.
+DOWNSCALE_MODES = {
+    'fast': {'resample': Image.BILINEAR, 'reducing_gap': 1.0},
+    'balanced': {'resample': Image.LANCZOS, 'reducing_gap': 2.0},
+    'quality': {'resample': Image.LANCZOS, 'reducing_gap': None}
+}
+# Source formats whose WebP encodings are lossless when IMAGE_WEBP_LOSSLESS is "auto".
+LOSSLESS_FORMATS = ('PNG', 'GIF', 'BMP', 'TIFF')
 
 class ImageService:
     """
@@ -11,6 +67,9 @@ class ImageService:
     """
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads', 'images')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
+    # Files are sharded into UPLOAD_FOLDER/ab/cd/ by the first characters of their name.
+    SHARD_LEVELS = 2
+    SHARD_WIDTH = 2
 
     @staticmethod
     def allowed_file(filename):
@@ -35,112 +94,800 @@ class ImageService:
         return f"{unique_id}.{ext}"
 
     @staticmethod
-    def process_single_image(image_path):
+    def storage_path(filename):
         """
-        Process a single image and extract key information such as dimensions,
-        channels, and color histogram.
+        Sharded path of a stored file. Names start with a content hash (or random hex), so
+        files spread evenly, and an image's mask and resized / converted copies share its directory.
         
-        :param image_path: Path to the image file
-        :return: Dictionary containing image details
+        :param filename: Name of the file
+        :return: Path under UPLOAD_FOLDER
+        """
+        width = ImageService.SHARD_WIDTH
+        shards = [filename[i * width:(i + 1) * width] for i in range(ImageService.SHARD_LEVELS)]
+        return os.path.join(ImageService.UPLOAD_FOLDER, *shards, filename)
+
+    @staticmethod
+    def resolve_path(filename):
+        """
+        Find a stored file by name, in its shard or, if not migrated yet, directly in UPLOAD_FOLDER.
+        
+        :param filename: Name of the file
+        :return: Path of the file, or None if there is no such file
+        """
+        if os.path.basename(filename) != filename or filename.startswith('.'):
+            return None
+        for path in (ImageService.storage_path(filename), os.path.join(ImageService.UPLOAD_FOLDER, filename)):
+            ImageService.wait_for_write(path)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    @staticmethod
+    def decode_image(data):
+        """
+        Decode an encoded image (PNG, JPEG, ...) from memory.
+        
+        :param data: Encoded image bytes
+        :return: BGR image array
+        """
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError('Could not decode image')
+        return img
+
+    @staticmethod
+    def load_raster(source):
+        """
+        Load an image as a BGR array. Images above IMAGE_TILED_PIXELS stored in an uncompressed
+        layout (BMP, uncompressed TIFF) are mapped instead of decoded: a zero-copy view of the
+        bytes or a memory map of the file, read strip by strip as it is processed.
+        
+        :param source: Encoded image bytes, or path to the image file
+        :return: BGR image array (a 2-D gray array for mapped grayscale images)
         """
-        img = cv2.imread(image_path)
-        height, width, channels = img.shape
+        try:
+            with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+                if img.width * img.height > Config.IMAGE_TILED_PIXELS:
+                    if isinstance(source, bytes):
+                        buffer = np.frombuffer(source, dtype=np.uint8)
+                    else:
+                        buffer = np.memmap(source, dtype=np.uint8, mode='r')
+                    view = ImageService._raw_view(img, buffer)
+                    if view is not None:
+                        return view
+        except Exception:
+            # Pillow cannot read it (or deems it too large); OpenCV decides below.
+            pass
 
-        color_hist = {
-            'red': cv2.calcHist([img], [2], None, [256], [0, 256]).flatten().tolist(),
-            'green': cv2.calcHist([img], [1], None, [256], [0, 256]).flatten().tolist(),
-            'blue': cv2.calcHist([img], [0], None, [256], [0, 256]).flatten().tolist()
+        if isinstance(source, bytes):
+            return ImageService.decode_image(source)
+        img = cv2.imread(source)
+        if img is None:
+            raise ValueError('Could not decode image')
+        return img
+
+    @staticmethod
+    def _raw_view(img, buffer):
+        """
+        View of an opened image's uncompressed pixel data in its encoded bytes.
+        
+        :param img: Opened PIL image
+        :param buffer: The image's bytes (uint8 array or memory map)
+        :return: BGR (or gray) array view, or None if the layout cannot be mapped
+        """
+        tiles = [tuple(tile) for tile in img.tile]
+        if not tiles or any(codec != 'raw' for codec, _, _, _ in tiles):
+            return None
+        # Tile arguments are (rawmode, stride, orientation), or just the rawmode.
+        args = [tile_args if isinstance(tile_args, tuple) else (tile_args, 0, 1) for _, _, _, tile_args in tiles]
+        rawmode, stride, orientation = args[0][:3]
+        if rawmode not in _RAW_LAYOUTS or img.getexif().get(0x0112, 1) != 1:
+            return None
+        channels, bgr = _RAW_LAYOUTS[rawmode]
+        stride = stride or img.width * channels
+        offset = tiles[0][2]
+
+        # Several strips are fine as long as they are consecutive rows of one block.
+        if len(tiles) > 1 and orientation < 0:
+            return None
+        for (_, extents, tile_offset, _), tile_args in zip(tiles, args):
+            if (tile_args[:3] != args[0][:3] or extents[0] != 0 or extents[2] != img.width
+                    or tile_offset != offset + extents[1] * stride):
+                return None
+        if tiles[-1][1][3] != img.height or offset + stride * img.height > buffer.size:
+            return None
+
+        view = np.ndarray(
+            (img.height, img.width, channels), dtype=np.uint8, buffer=buffer, offset=offset,
+            strides=(stride, channels, 1)
+        )
+        if orientation < 0:
+            view = view[::-1]
+        return view[..., 0] if bgr is None else view[..., bgr]
+
+    @staticmethod
+    def strips(height, width):
+        """
+        Row ranges to process a raster in: all of it, or strips of about IMAGE_TILE_BYTES
+        working memory once it is above IMAGE_TILED_PIXELS.
+        
+        :param height: Raster height
+        :param width: Raster width
+        :return: Iterator of (top, bottom) row ranges
+        """
+        if height * width <= Config.IMAGE_TILED_PIXELS:
+            yield 0, height
+            return
+        rows = max(1, Config.IMAGE_TILE_BYTES // (width * _STRIP_BYTES_PER_PIXEL))
+        for top in range(0, height, rows):
+            yield top, min(height, top + rows)
+
+    @staticmethod
+    def compute_color_histogram(img):
+        """
+        Compute the red, green and blue histograms of a BGR image in a single pass
+        (strip by strip for large images).
+        
+        :param img: BGR image array
+        :return: Dictionary of 256-bin pixel counts per channel
+        """
+        counts = np.zeros((3, 256), dtype=np.int64)
+        for top, bottom in ImageService.strips(*img.shape[:2]):
+            strip = img[top:bottom]
+            if strip.ndim == 2:
+                counts += np.bincount(strip.ravel(), minlength=256)
+            else:
+                counts += np.bincount((strip.reshape(-1, 3) + _CHANNEL_OFFSETS).ravel(), minlength=768).reshape(3, 256)
+        return {
+            'red': counts[2].tolist(),
+            'green': counts[1].tolist(),
+            'blue': counts[0].tolist()
         }
 
+    @staticmethod
+    def describe_image(img, filename):
+        """
+        Extract key information such as dimensions, channels, and color histogram
+        from a decoded image.
+        
+        :param img: BGR image array
+        :param filename: Name of the image file
+        :return: Dictionary containing image details
+        """
+        height, width = img.shape[:2]
+        # Images are described as decoded in color, which gray ones are too unless mapped.
+        channels = img.shape[2] if img.ndim == 3 else 3
         return {
-            'filename': os.path.basename(image_path),
+            'filename': filename,
             'dimensions': {'height': height, 'width': width},
             'channels': channels,
-            'color_histogram': color_hist
+            'color_histogram': ImageService.compute_color_histogram(img)
         }
 
     @staticmethod
-    def generate_segmentation_mask(image_path, method='simple'):
+    def process_single_image(image_path):
         """
-        Generate a segmentation mask for an image using simple or adaptive thresholding.
+        Process a single image and extract key information such as dimensions,
+        channels, and color histogram.
         
         :param image_path: Path to the image file
-        :param method: Segmentation method ('simple' or 'adaptive')
-        :return: Path to the saved mask image
+        :return: Dictionary containing image details
+        """
+        img = ImageService.load_raster(image_path)
+        return ImageService.describe_image(img, os.path.basename(image_path))
+
+    @staticmethod
+    def _gray(img):
+        img = np.ascontiguousarray(img)
+        return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    def gray_thumbnail(img, size):
+        """
+        Shrink an image to a small gray thumbnail by area averaging (strip by strip for
+        large images).
+        
+        :param img: BGR image array (or gray)
+        :param size: Thumbnail (width, height)
+        :return: Gray thumbnail array
+        """
+        height, width = img.shape[:2]
+        if height * width <= Config.IMAGE_TILED_PIXELS or width < size[0] or height < size[1]:
+            return cv2.resize(ImageService._gray(img), size, interpolation=cv2.INTER_AREA)
+
+        column_starts = np.linspace(0, width, size[0] + 1).astype(int)[:-1]
+        row_bins = np.arange(height) * size[1] // height
+        sums = np.zeros((size[1], size[0]))
+        for top, bottom in ImageService.strips(height, width):
+            block_sums = np.add.reduceat(ImageService._gray(img[top:bottom]), column_starts, axis=1, dtype=np.int64)
+            np.add.at(sums, row_bins[top:bottom], block_sums)
+        pixels = np.outer(np.bincount(row_bins, minlength=size[1]), np.diff(np.append(column_starts, width)))
+        return np.round(sums / pixels).astype(np.uint8)
+
+    @staticmethod
+    def index_similarity(document, img=None):
+        """
+        Record an image's perceptual hash and color signature for similarity search.
+        The caller commits.
+        
+        :param document: Flushed ImageDocument with its color histogram
+        :param img: Decoded image, if already available (otherwise the stored file is read)
         """
-        img = cv2.imread(image_path)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        img = img if img is not None else ImageService.load_raster(document.file_path)
+        ImageSimilarityService.index_image(
+            document, ImageService.gray_thumbnail(img, ImageSimilarityService.THUMBNAIL_SIZE)
+        )
+
+    @staticmethod
+    def segmentation_mask(img, method='simple', threshold=None):
+        """
+        Compute a segmentation mask for a decoded image using simple, adaptive or Otsu thresholding.
+        
+        :param img: BGR image array (or gray)
+        :param method: Segmentation method ('simple', 'adaptive' or 'otsu')
+        :param threshold: Otsu threshold computed beforehand, e.g. over a whole image processed in strips
+        :return: Mask array
+        """
+        gray = ImageService._gray(img)
 
         if method == 'simple':
             _, mask = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
         elif method == 'adaptive':
             mask = cv2.adaptiveThreshold(
                 gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY, 11, 2
+                cv2.THRESH_BINARY, ADAPTIVE_BLOCK_SIZE, 2
             )
+        elif method == 'otsu':
+            if threshold is None:
+                _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            else:
+                _, mask = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+        else:
+            raise ValueError(f"Unknown segmentation method: {method}")
+        return mask
+
+    @staticmethod
+    def otsu_threshold(img):
+        """
+        Otsu threshold of an image's gray levels, accumulated strip by strip.
+        
+        :param img: BGR image array (or gray)
+        :return: Threshold (pixels above it are foreground)
+        """
+        counts = np.zeros(256, dtype=np.int64)
+        for top, bottom in ImageService.strips(*img.shape[:2]):
+            counts += np.bincount(ImageService._gray(img[top:bottom]).ravel(), minlength=256)
 
-        mask_path = image_path.replace('.', '_mask.')
-        cv2.imwrite(mask_path, mask)
+        # Maximize the between-class variance over all split points, as OpenCV does.
+        p = counts / counts.sum()
+        omega = np.cumsum(p)
+        mu = np.cumsum(p * np.arange(256))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sigma = (mu[-1] * omega - mu) ** 2 / (omega * (1 - omega))
+        eps = np.finfo(np.float32).eps
+        sigma[(np.minimum(omega, 1 - omega) < eps)] = 0
+        return int(np.argmax(sigma))
+
+    @staticmethod
+    def mask_path(image_path, method='simple', max_dimension=None):
+        """
+        Path of a segmentation mask cached next to an image.
+        
+        :param image_path: Path to the image file
+        :param method: Segmentation method
+        :param max_dimension: Longest side the mask was computed at (None: full resolution)
+        :return: Path to the mask image
+        """
+        root = os.path.splitext(image_path)[0]
+        size = f"_{max_dimension}" if max_dimension else ''
+        return f"{root}_mask_{method}{size}.png"
+
+    @staticmethod
+    def generate_segmentation_mask(image_path, method='simple'):
+        """
+        Generate a segmentation mask for an image using simple, adaptive or Otsu thresholding.
+        
+        :param image_path: Path to the image file
+        :param method: Segmentation method ('simple', 'adaptive' or 'otsu')
+        :return: Path to the saved mask image
+        """
+        img = ImageService.load_raster(image_path)
+        mask_path = ImageService.mask_path(image_path, method)
+        ImageService.write_segmentation_mask(img, mask_path, '.png', method)
         return os.path.basename(mask_path)
 
     @staticmethod
-    def batch_process_images(image_files):
+    def get_mask(document, method='simple', max_dimension=None):
         """
-        Process multiple images in a batch.
+        Path of an image's segmentation mask, computed on first request and cached next to
+        the image afterwards.
+        
+        :param document: ImageDocument of the image
+        :param method: Segmentation method ('simple', 'adaptive' or 'otsu')
+        :param max_dimension: Compute the mask on a copy downscaled to this longest side
+            (faster, and a smaller mask); None or a size above the image's is full resolution
+        :return: Path to the mask image
+        """
+        if max_dimension and max(document.dimensions['height'], document.dimensions['width']) <= max_dimension:
+            max_dimension = None
+        path = ImageService.mask_path(document.file_path, method, max_dimension)
+        ImageService.wait_for_write(path)  # An eager mask may still be in the works.
+        if os.path.isfile(path):
+            return path
+
+        img = ImageService.load_raster(document.file_path)
+        if max_dimension:
+            height, width = img.shape[:2]
+            scale = max_dimension / max(height, width)
+            img = ImageService.gray_thumbnail(img, (max(1, round(width * scale)), max(1, round(height * scale))))
+
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        ImageService.write_segmentation_mask(img, tmp_path, '.png', method)
+        os.replace(tmp_path, path)
+        ImageService.log_usage('W', path)
+
+        document.processing_history = (document.processing_history or []) + [
+            ImageService._mask_history(path, method, max_dimension)
+        ]
+        db.session.commit()
+        return path
+
+    @staticmethod
+    def _mask_history(path, method, max_dimension=None):
+        return {
+            'operation': 'segmentation_mask',
+            'method': method,
+            'max_dimension': max_dimension,
+            'output': os.path.basename(path),
+            'created_at': datetime.utcnow().isoformat()
+        }
+
+    @staticmethod
+    def write_segmentation_mask(img, path, ext, method='simple'):
+        """
+        Compute an image's segmentation mask and write it encoded to a file. Large images
+        are thresholded strip by strip into a memory-mapped scratch file, which is encoded
+        from the mapping, so neither the mask nor a full gray copy is held in memory.
+        
+        :param img: BGR image array (or gray)
+        :param path: Destination path
+        :param ext: Extension giving the encoding, e.g. '.png'
+        :param method: Segmentation method ('simple', 'adaptive' or 'otsu')
+        """
+        height, width = img.shape[:2]
+        if height * width <= Config.IMAGE_TILED_PIXELS:
+            with open(path, 'wb') as f:
+                f.write(cv2.imencode(ext, ImageService.segmentation_mask(img, method))[1].tobytes())
+            return
+
+        # Adaptive thresholding looks at neighbouring rows, so strips overlap by half a block;
+        # Otsu's threshold depends on the whole image, so it is computed in a first pass.
+        halo = ADAPTIVE_BLOCK_SIZE // 2 if method == 'adaptive' else 0
+        threshold = ImageService.otsu_threshold(img) if method == 'otsu' else None
+        scratch_path = f"{path}.{uuid.uuid4().hex}.raw"
+        mask = np.memmap(scratch_path, dtype=np.uint8, mode='w+', shape=(height, width))
+        try:
+            for top, bottom in ImageService.strips(height, width):
+                start, end = max(0, top - halo), min(height, bottom + halo)
+                strip_mask = ImageService.segmentation_mask(img[start:end], method, threshold)
+                mask[top:bottom] = strip_mask[top - start:bottom - start]
+            image_format = Image.registered_extensions()[ext.lower()]
+            # OpenCV's default PNG compression, as used for smaller masks.
+            save_options = {'compress_level': 1} if image_format == 'PNG' else {}
+            Image.frombuffer('L', (width, height), mask, 'raw', 'L', 0, 1).save(path, format=image_format, **save_options)
+        finally:
+            del mask
+            os.remove(scratch_path)
+
+    @staticmethod
+    def draft(img, size, mode=None):
+        """
+        Let a JPEG be decoded at a reduced scale, still at least the mode's reducing gap
+        times the target size. Has to be called before the image is loaded; other formats
+        are unaffected.
+        
+        :param img: Opened, not yet loaded, PIL image
+        :param size: Target (width, height), in the image's stored orientation
+        :param mode: Downscale mode (default: IMAGE_DOWNSCALE_MODE)
+        """
+        gap = DOWNSCALE_MODES[mode or Config.IMAGE_DOWNSCALE_MODE]['reducing_gap']
+        if gap is not None and size[0] < img.width and size[1] < img.height:
+            img.draft(None, (int(size[0] * gap), int(size[1] * gap)))
+
+    @staticmethod
+    def resample(img, size, box=None, mode=None):
+        """
+        Resize an image with the resampling of a downscale mode.
+        
+        :param img: PIL image
+        :param size: Target (width, height)
+        :param box: Region of the image to resize (default: all of it)
+        :param mode: Downscale mode (default: IMAGE_DOWNSCALE_MODE)
+        :return: Resized image
+        """
+        settings = DOWNSCALE_MODES[mode or Config.IMAGE_DOWNSCALE_MODE]
+        return img.resize(size, settings['resample'], box=box, reducing_gap=settings['reducing_gap'])
+
+    @staticmethod
+    def encoder_options(image_format, quality=None, source_format=None):
+        """
+        Encoder settings of an output format, from the configured profile (IMAGE_JPEG_*,
+        IMAGE_PNG_*, IMAGE_WEBP_*).
+        
+        :param image_format: Pillow format name of the output, e.g. 'JPEG'
+        :param quality: Quality overriding the profile's, for JPEG and lossy WebP
+        :param source_format: Pillow format name of the source, deciding whether WebP is lossless
+        :return: Keyword arguments for Image.save
+        """
+        if image_format == 'JPEG':
+            return {
+                'quality': quality or Config.IMAGE_JPEG_QUALITY,
+                'optimize': True,
+                'progressive': Config.IMAGE_JPEG_PROGRESSIVE
+            }
+        if image_format == 'PNG':
+            return {'compress_level': Config.IMAGE_PNG_COMPRESS_LEVEL}
+        if image_format == 'WEBP':
+            lossless = Config.IMAGE_WEBP_LOSSLESS in ('1', 'true', 'yes') or (
+                Config.IMAGE_WEBP_LOSSLESS == 'auto' and source_format in LOSSLESS_FORMATS
+            )
+            if lossless:
+                return {'lossless': True, 'method': Config.IMAGE_WEBP_METHOD}
+            return {'quality': quality or Config.IMAGE_WEBP_QUALITY, 'method': Config.IMAGE_WEBP_METHOD}
+        return {}
+
+    @staticmethod
+    def read_upload(image_file):
+        """
+        Read an uploaded file in chunks, hashing its content on the way.
+        
+        :param image_file: Uploaded image file
+        :return: Tuple of (image bytes, SHA-256 hex digest)
+        """
+        digest = hashlib.sha256()
+        chunks = []
+        for chunk in iter(lambda: image_file.stream.read(1 << 20), b''):
+            digest.update(chunk)
+            chunks.append(chunk)
+        return b''.join(chunks), digest.hexdigest()
+
+    @staticmethod
+    def store_image(data, content_hash, original_filename, img=None, mask_method=None):
+        """
+        Store an image under its content hash. New content is decoded once to record its
+        metadata (and, if asked for, its segmentation mask); content that is already stored
+        just gains a reference, and its existing blob and metadata are reused.
+        
+        :param data: Image bytes
+        :param content_hash: SHA-256 hex digest of the bytes
+        :param original_filename: Name the image was uploaded as
+        :param img: Decoded image, if already available
+        :param mask_method: Segmentation method of a mask to compute right away (default: none;
+            masks are otherwise computed on first request)
+        :return: Tuple of (ImageDocument, whether the content was new)
+        """
+        document = ImageDocument.query.filter_by(content_hash=content_hash).first()
+        if document is None:
+            img = img if img is not None else ImageService.load_raster(data)
+            filename = f"{content_hash}.{original_filename.rsplit('.', 1)[-1].lower()}"
+            details = ImageService.describe_image(img, filename)
+
+            document = ImageService._new_document(
+                original_filename, filename, len(data),
+                details['dimensions'], details['channels'], details['color_histogram']
+            )
+            document.content_hash = content_hash
+            document.ref_count = 1
+            mask_path = ImageService.mask_path(document.file_path, mask_method) if mask_method else None
+            if mask_path:
+                document.processing_history = [ImageService._mask_history(mask_path, mask_method)]
+            db.session.add(document)
+            try:
+                db.session.flush()
+                ImageService.index_similarity(document, img)
+                db.session.commit()
+            except IntegrityError:
+                # The same content was stored concurrently; reference that copy instead.
+                db.session.rollback()
+                document = ImageDocument.query.filter_by(content_hash=content_hash).one()
+            else:
+                os.makedirs(os.path.dirname(document.file_path), exist_ok=True)
+                ImageService.persist_async(document.file_path, data)
+                if mask_path:
+                    ImageService.write_async(
+                        mask_path, lambda tmp_path: ImageService.write_segmentation_mask(img, tmp_path, '.png', mask_method)
+                    )
+                return document, True
+
+        # Content stored without the requested mask gets it now, as the caller reports its name.
+        mask_path = ImageService.mask_path(document.file_path, mask_method) if mask_method else None
+        if mask_path and os.path.isfile(mask_path):
+            mask_path = None
+        if mask_path:
+            document.processing_history = (document.processing_history or []) + [
+                ImageService._mask_history(mask_path, mask_method)
+            ]
+        ImageDocument.query.filter_by(id=document.id).update({ImageDocument.ref_count: ImageDocument.ref_count + 1})
+        db.session.commit()
+        os.makedirs(os.path.dirname(document.file_path), exist_ok=True)
+        if not os.path.isfile(document.file_path):
+            # Heal a blob lost to an interrupted write or garbage collection.
+            ImageService.persist_async(document.file_path, data)
+        if mask_path:
+            ImageService.write_async(mask_path, lambda tmp_path: ImageService.write_segmentation_mask(
+                img if img is not None else ImageService.load_raster(data), tmp_path, '.png', mask_method
+            ))
+        return document, False
+
+    @staticmethod
+    def release_image(document):
+        """
+        Drop one reference to a stored image. When no references are left, its metadata,
+        blob and mask are deleted.
+        
+        :param document: ImageDocument to release
+        :return: The remaining reference count
+        """
+        ImageDocument.query.filter_by(id=document.id).update({ImageDocument.ref_count: ImageDocument.ref_count - 1})
+        db.session.flush()
+        db.session.refresh(document)
+        remaining = document.ref_count
+        if remaining <= 0:
+            ImageService.garbage_collect(document)
+        db.session.commit()
+        return max(remaining, 0)
+
+    @staticmethod
+    def garbage_collect(document):
+        """
+        Delete an unreferenced image's files (blob, mask, resized and converted copies)
+        and metadata. The caller commits.
+        The files are removed before the row is, so a concurrent upload of the same
+        content either still references this row or writes a fresh blob afterwards.
+        
+        :param document: ImageDocument whose reference count reached zero
+        """
+        root = os.path.splitext(document.file_path)[0]
+        for path in [document.file_path] + glob.glob(glob.escape(root) + '_*'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            ImageService.log_usage('D', path)
+        ImageSimilarityService.remove_image(document.id)
+        db.session.delete(document)
+
+    @staticmethod
+    def save_upload(image_file):
+        """
+        Read an uploaded image once and store it by content hash.
+        
+        :param image_file: Uploaded image file
+        :return: Tuple of (stored filename, file path, image bytes)
+        """
+        data, content_hash = ImageService.read_upload(image_file)
+        document, _ = ImageService.store_image(data, content_hash, image_file.filename)
+        return document.unique_filename, document.file_path, data
+
+    @staticmethod
+    def persist_async(path, data):
+        """
+        Write bytes to a file in the background. The file appears atomically once complete.
+        
+        :param path: Destination path
+        :param data: Bytes to write
+        """
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+
+        ImageService.write_async(path, write)
+
+    @staticmethod
+    def write_async(path, writer):
+        """
+        Produce a file in the background. The file appears atomically once complete.
+        
+        :param path: Destination path
+        :param writer: Callable writing the content to the temporary path it is given
+        """
+        def run():
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                writer(tmp_path)
+                os.replace(tmp_path, path)
+                ImageService.log_usage('W', path)
+            except Exception:
+                logger.exception(f"Could not write {path}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        def forget(future):
+            with _pending_writes_lock:
+                if _pending_writes.get(path) is future:
+                    del _pending_writes[path]
+
+        with _pending_writes_lock:
+            future = _pending_writes[path] = _persist_executor.submit(run)
+        future.add_done_callback(forget)
+
+    @staticmethod
+    def wait_for_write(path, timeout=WRITE_WAIT_SECONDS):
+        """
+        Wait until a background write of this process to a path is complete, so a file
+        named in a response right after its upload can be read. Returns at once if none
+        is pending.
+        
+        :param path: Destination path of the write
+        :param timeout: Longest wait in seconds
+        """
+        with _pending_writes_lock:
+            future = _pending_writes.get(path)
+        if future is not None:
+            wait([future], timeout=timeout)
+
+    @staticmethod
+    def batch_process_images(image_files, app, mask_method=None):
+        """
+        Process multiple images in a batch, in parallel on a bounded thread pool
+        (IMAGE_BATCH_WORKERS).
         
         :param image_files: List of uploaded image files
-        :return: List of processed image details
+        :param app: The Flask application (worker threads need their own app context)
+        :param mask_method: Segmentation method of masks to compute right away (default: none)
+        :return: List of processed image details, in input order; a file that could not
+            be processed yields {'original_filename', 'error'} instead
         """
-        results = []
-        for image_file in image_files:
-            if image_file and ImageService.allowed_file(image_file.filename):
-                filename = ImageService.generate_unique_filename(image_file.filename)
-                filepath = os.path.join(ImageService.UPLOAD_FOLDER, filename)
-                image_file.save(filepath)
+        return list(_batch_executor.map(partial(ImageService._process_upload, app, mask_method=mask_method), image_files))
 
-                result = ImageService.process_single_image(filepath)
-                result['segmentation_mask'] = ImageService.generate_segmentation_mask(filepath)
-                results.append(result)
+    @staticmethod
+    def _process_upload(app, image_file, mask_method=None):
+        """
+        Process one uploaded image, reporting failures instead of raising. The upload is
+        hashed while it is read; already stored content is not processed again.
+        
+        :param app: The Flask application
+        :param image_file: Uploaded image file
+        :param mask_method: Segmentation method of a mask to compute right away
+        :return: Dictionary containing image details, or an error
+        """
+        if not image_file or not ImageService.allowed_file(image_file.filename):
+            return {'original_filename': getattr(image_file, 'filename', None), 'error': 'Unsupported file format'}
+
+        with app.app_context():
+            try:
+                data, content_hash = ImageService.read_upload(image_file)
+                document, created = ImageService.store_image(
+                    data, content_hash, image_file.filename, mask_method=mask_method
+                )
+            except Exception as e:
+                db.session.rollback()
+                return {'original_filename': image_file.filename, 'error': str(e)}
 
-        return results
+            return {
+                'id': document.id,
+                'filename': document.unique_filename,
+                'original_filename': image_file.filename,
+                'file_size': document.file_size,
+                'dimensions': {'height': document.dimensions['height'], 'width': document.dimensions['width']},
+                'channels': document.dimensions.get('channels'),
+                'color_histogram': document.color_histogram,
+                'segmentation_mask': (
+                    os.path.basename(ImageService.mask_path(document.unique_filename, mask_method)) if mask_method else None
+                ),
+                'duplicate': not created
+            }
 
     @staticmethod
-    def resize_image(image_path, width=None, height=None):
+    def _new_document(original_filename, filename, file_size, dimensions, channels, color_histogram):
+        return ImageDocument(
+            original_filename=original_filename[:255],
+            unique_filename=filename,
+            file_path=ImageService.storage_path(filename),
+            file_extension=filename.rsplit('.', 1)[-1].lower()[:10],
+            file_size=file_size,
+            dimensions=dict(dimensions, channels=channels),
+            color_histogram=color_histogram,
+            processing_history=[]
+        )
+
+    @staticmethod
+    def get_document(image_id):
+        """
+        Find an image's stored metadata by id or unique filename. Images stored before
+        metadata was recorded are found once `record_file` has recorded them.
+        
+        :param image_id: Document id, or unique filename of the image
+        :return: ImageDocument, or None if there is no such image
+        """
+        if str(image_id).isdigit():
+            return db.session.get(ImageDocument, int(image_id))
+        return ImageDocument.query.filter_by(unique_filename=image_id).first()
+
+    @staticmethod
+    def record_file(image_path):
+        """
+        Record the metadata of an image stored before metadata was recorded, decoding it once.
+        
+        :param image_path: Path of the stored original
+        :return: Its new ImageDocument, or the existing one if it was recorded concurrently
+        """
+        filename = os.path.basename(image_path)
+        img = ImageService.load_raster(image_path)
+        details = ImageService.describe_image(img, filename)
+        document = ImageService._new_document(
+            filename, filename, os.path.getsize(image_path),
+            details['dimensions'], details['channels'], details['color_histogram']
+        )
+        document.file_path = image_path
+        db.session.add(document)
+        try:
+            db.session.flush()
+            ImageService.index_similarity(document, img)
+            db.session.commit()
+        except IntegrityError:
+            # Recorded concurrently by another process.
+            db.session.rollback()
+            document = ImageDocument.query.filter_by(unique_filename=filename).first()
+        return document
+
+    @staticmethod
+    def resize_image(image_path, width=None, height=None, data=None, mode=None):
         """
         Resize an image while maintaining aspect ratio if only one dimension is provided.
         
         :param image_path: Path to the image file
         :param width: Desired width (optional)
         :param height: Desired height (optional)
+        :param data: Image bytes, if already in memory (avoids re-reading image_path)
+        :param mode: Downscale mode, trading quality for speed (default: IMAGE_DOWNSCALE_MODE)
         :return: Path to the resized image
         """
-        img = Image.open(image_path)
+        mode = mode or Config.IMAGE_DOWNSCALE_MODE
+        img = Image.open(io.BytesIO(data) if data is not None else image_path)
+        source_format = img.format
 
+        size = img.size
         if width and height:
-            img = img.resize((width, height), PIL.Image.LANCZOS)
+            size = (width, height)
         elif width:
             aspect_ratio = width / img.width
-            new_height = int(img.height * aspect_ratio)
-            img = img.resize((width, new_height), PIL.Image.LANCZOS)
+            size = (width, int(img.height * aspect_ratio))
         elif height:
             aspect_ratio = height / img.height
-            new_width = int(img.width * aspect_ratio)
-            img = img.resize((new_width, height), PIL.Image.LANCZOS)
+            size = (int(img.width * aspect_ratio), height)
+
+        options = ImageService.encoder_options(source_format, source_format=source_format)
+        root, ext = os.path.splitext(image_path)
+        new_path = f"{root}_resized_{size[0]}x{size[1]}_{mode}_{ImageService.profile_tag(source_format, options)}{ext}"
+        if os.path.isfile(new_path):
+            return new_path
 
-        new_path = image_path.replace('.', f'_resized.')
-        img.save(new_path)
+        if size != img.size:
+            ImageService.draft(img, size, mode)
+            img = ImageService.resample(img, size, mode=mode)
+        ImageService.save_atomic(img, new_path, format=source_format, **options)
         return new_path
 
     @staticmethod
-    def convert_image_format(image_path, output_format='png'):
+    def convert_image_format(image_path, output_format='png', data=None):
         """
         Convert an image to a specified format, handling transparency issues if needed.
         
         :param image_path: Path to the image file
         :param output_format: Desired output format ('png', 'jpg', etc.)
+        :param data: Image bytes, if already in memory (avoids re-reading image_path)
         :return: Path to the converted image
         """
-        img = Image.open(image_path)
+        img = Image.open(io.BytesIO(data) if data is not None else image_path)
+        source_format = img.format
+        image_format = Image.registered_extensions().get(f'.{output_format.lower()}')
+        options = ImageService.encoder_options(image_format, source_format=source_format)
+        new_path = (
+            f"{os.path.splitext(image_path)[0]}_converted_{ImageService.profile_tag(image_format, options)}.{output_format}"
+        )
+        if os.path.isfile(new_path):
+            return new_path
 
         if output_format.lower() in ['jpg', 'jpeg'] and img.mode == 'RGBA':
             background = Image.new('RGB', img.size, (255, 255, 255))
@@ -150,6 +897,56 @@ class ImageService:
         if output_format.lower() in ['jpg', 'jpeg']:
             img = img.convert('RGB')
 
-        new_path = image_path.rsplit('.', 1)[0] + f'.{output_format}'
-        img.save(new_path)
+        ImageService.save_atomic(img, new_path, format=image_format, **options)
         return new_path
+
+    @staticmethod
+    def profile_tag(image_format, options):
+        """
+        Short hash of an output format and its encoder settings, part of the name of resized /
+        converted copies so that a changed profile gets a new (immutably cacheable) name.
+        
+        :param image_format: Pillow format name of the output
+        :param options: Encoder settings from `encoder_options`
+        :return: 8 hex digits
+        """
+        return hashlib.sha256(f"{image_format}|{sorted(options.items())}".encode()).hexdigest()[:8]
+
+    @staticmethod
+    def save_atomic(img, path, **kwargs):
+        """
+        Encode an image to a file that appears atomically once complete.
+        
+        :param img: PIL image
+        :param path: Destination path
+        :param kwargs: Arguments of Image.save
+        """
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            img.save(tmp_path, **kwargs)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        ImageService.log_usage('W', path)
+
+    @staticmethod
+    def log_usage(event, path):
+        """
+        Append a write ('W'), access ('A') or removal ('D') of a file of the upload directory
+        to the journal the storage garbage collector updates its usage index from, instead of
+        walking the directory. Paths outside the upload directory are ignored.
+        
+        :param event: 'W', 'A' or 'D'
+        :param path: Path of the file
+        """
+        relative_path = os.path.relpath(path, ImageService.UPLOAD_FOLDER)
+        if relative_path.startswith(os.pardir):
+            return
+        try:
+            size = os.path.getsize(path) if event == 'W' else 0
+            # One short append per event: O_APPEND keeps lines from concurrent processes whole.
+            with open(os.path.join(ImageService.UPLOAD_FOLDER, USAGE_JOURNAL), 'a') as journal:
+                journal.write(f"{event}\t{size}\t{time.time()}\t{relative_path}\n")
+        except OSError as e:
+            logger.warning(f"Could not journal {event} {path}: {e}")
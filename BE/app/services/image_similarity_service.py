@@ -0,0 +1,163 @@
+import itertools
+import numpy as np
+from app import db
+from app.models.image import ImageDocument, ImageHashBand
+from config import Config
+
+
+class ImageSimilarityService:
+    """
+    Similar and near-duplicate image search with perceptual hashes and a multi-index
+    hashing table stored in the database.
+
+    Each image gets a 64-bit difference hash (dHash) of its gray thumbnail and a compact
+    color signature derived from its histogram. The hash is split into CHUNKS 16-bit chunks,
+    each stored as a bucket in image_hash_band. Two hashes within Hamming distance d agree
+    within d // CHUNKS bits on at least one chunk, so a query probes only the buckets near
+    its own chunks instead of scanning every image; candidates are then ranked by exact
+    Hamming distance and color signature distance.
+    """
+    HASH_BITS = 64
+    CHUNKS = 4
+    CHUNK_BITS = HASH_BITS // CHUNKS
+    MAX_DISTANCE = 12  # Probes grow combinatorially with the per-chunk radius (3 bits: 697 per chunk).
+    MAX_CANDIDATES = 10000
+    COLOR_BINS = 8  # Histogram bins per channel in the color signature.
+    THUMBNAIL_SIZE = (9, 8)  # (width, height) of the gray thumbnail dHash compares.
+
+    @staticmethod
+    def dhash(thumbnail):
+        """
+        Compute the difference hash of a gray thumbnail: one bit per horizontally
+        adjacent pixel pair, set where brightness increases.
+
+        Args:
+            thumbnail (np.ndarray): Gray image of THUMBNAIL_SIZE.
+
+        Returns:
+            int: Signed 64-bit hash (as stored in the database).
+        """
+        bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+        return int(np.packbits(bits).view('>i8')[0])
+
+    @staticmethod
+    def color_signature(color_histogram):
+        """
+        Reduce a color histogram to COLOR_BINS bins per channel, normalized to sum to 1
+        per channel.
+
+        Args:
+            color_histogram (dict): 256 pixel counts per channel ('red', 'green', 'blue').
+
+        Returns:
+            np.ndarray: float32 signature of length 3 * COLOR_BINS.
+        """
+        counts = np.array(
+            [color_histogram[channel] for channel in ('red', 'green', 'blue')], dtype=np.float64
+        ).reshape(3, ImageSimilarityService.COLOR_BINS, -1).sum(axis=2)
+        totals = counts.sum(axis=1, keepdims=True)
+        return (counts / np.where(totals == 0, 1, totals)).astype(np.float32).ravel()
+
+    @staticmethod
+    def color_distance(signature, others):
+        """L1 distance between color signatures, from 0 (same colors) to 2 (disjoint)."""
+        return np.abs(others - signature).reshape(len(others), 3, -1).sum(axis=2).mean(axis=1)
+
+    @staticmethod
+    def hamming(value, others):
+        """Hamming distances between a hash and an array of hashes."""
+        xor = np.bitwise_xor(np.array(others, dtype=np.int64), np.int64(value))
+        return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+    @staticmethod
+    def _chunks(value):
+        unsigned = value & ((1 << ImageSimilarityService.HASH_BITS) - 1)
+        mask = (1 << ImageSimilarityService.CHUNK_BITS) - 1
+        return [(unsigned >> (i * ImageSimilarityService.CHUNK_BITS)) & mask for i in range(ImageSimilarityService.CHUNKS)]
+
+    @staticmethod
+    def buckets(value, radius=0):
+        """
+        Buckets of a hash's chunks, plus every chunk value within `radius` bits of them.
+        A bucket id packs the chunk index above the chunk value, so it is unique per chunk.
+        """
+        buckets = []
+        bits = ImageSimilarityService.CHUNK_BITS
+        for index, chunk in enumerate(ImageSimilarityService._chunks(value)):
+            for distance in range(radius + 1):
+                for flipped in itertools.combinations(range(bits), distance):
+                    probe = chunk
+                    for bit in flipped:
+                        probe ^= 1 << bit
+                    buckets.append((index << bits) | probe)
+        return buckets
+
+    @staticmethod
+    def index_image(document, thumbnail):
+        """
+        Store an image's hash, color signature and hash buckets. The caller commits.
+
+        Args:
+            document (ImageDocument): A flushed document (it must have an id).
+            thumbnail (np.ndarray): Gray thumbnail of THUMBNAIL_SIZE.
+        """
+        ImageSimilarityService.remove_image(document.id)
+        document.dhash = ImageSimilarityService.dhash(thumbnail)
+        document.color_signature = ImageSimilarityService.color_signature(document.color_histogram).tobytes()
+        db.session.add_all([
+            ImageHashBand(bucket=bucket, image_id=document.id)
+            for bucket in ImageSimilarityService.buckets(document.dhash)
+        ])
+
+    @staticmethod
+    def remove_image(image_id):
+        """Drop an image's hash buckets. The caller commits."""
+        ImageHashBand.query.filter_by(image_id=image_id).delete()
+
+    @staticmethod
+    def find_similar(document, limit=10, max_distance=None, max_color_distance=None):
+        """
+        Find the images most similar to an indexed image.
+
+        Args:
+            document (ImageDocument): The query image (with dhash and color_signature).
+            limit (int): Maximum number of results.
+            max_distance (int): Maximum Hamming distance between hashes (default: IMAGE_SIMILAR_MAX_DISTANCE).
+            max_color_distance (float): Maximum color signature distance, 0-2 (default: no limit).
+
+        Returns:
+            list: (ImageDocument, hash distance, color distance) tuples, closest first.
+        """
+        max_distance = Config.IMAGE_SIMILAR_MAX_DISTANCE if max_distance is None else max_distance
+        buckets = ImageSimilarityService.buckets(document.dhash, max_distance // ImageSimilarityService.CHUNKS)
+        # Images matching more chunks are likelier to be close: keep those when there are too many.
+        matched_chunks = db.func.count(ImageHashBand.bucket)
+        candidate_ids = db.session.query(ImageHashBand.image_id).filter(
+            ImageHashBand.bucket.in_(buckets),
+            ImageHashBand.image_id != document.id
+        ).group_by(ImageHashBand.image_id).order_by(
+            matched_chunks.desc(), ImageHashBand.image_id.desc()
+        ).limit(ImageSimilarityService.MAX_CANDIDATES).subquery()
+
+        candidates = db.session.query(ImageDocument.id, ImageDocument.dhash, ImageDocument.color_signature).join(
+            candidate_ids, ImageDocument.id == candidate_ids.c.image_id
+        ).all()
+        if not candidates:
+            return []
+
+        ids = np.array([candidate.id for candidate in candidates])
+        distances = ImageSimilarityService.hamming(document.dhash, [candidate.dhash for candidate in candidates])
+        color_distances = ImageSimilarityService.color_distance(
+            np.frombuffer(document.color_signature, dtype=np.float32),
+            np.stack([np.frombuffer(candidate.color_signature, dtype=np.float32) for candidate in candidates])
+        )
+
+        keep = distances <= max_distance
+        if max_color_distance is not None:
+            keep &= color_distances <= max_color_distance
+        ids, distances, color_distances = ids[keep], distances[keep], color_distances[keep]
+        order = np.lexsort((color_distances, distances))[:limit]
+        matches = [(int(ids[i]), int(distances[i]), float(color_distances[i])) for i in order]
+
+        documents = {doc.id: doc for doc in ImageDocument.query.filter(ImageDocument.id.in_([m[0] for m in matches]))}
+        return [(documents[image_id], distance, color) for image_id, distance, color in matches if image_id in documents]
@@ -0,0 +1,426 @@
+import fcntl
+import glob
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from app import db
+from app.models.image import ImageDocument
+from app.services.image_service import USAGE_JOURNAL, ImageService
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Suffixes of files that are still being written (or were abandoned by a crash).
+TEMPORARY_SUFFIXES = ('.tmp', '.raw')
+# Names of masks and resized / converted copies: `<image name>_<operation>...`.
+DERIVATIVE_PATTERN = re.compile(r'_(mask|resized|converted)(_|$)')
+# The collector's index of the upload directory: {relative path: [kind, size, last used]}.
+USAGE_INDEX = '.usage-index.json'
+
+
+class ImageStorageService:
+    """
+    Maintenance of the upload directory: migration to the sharded layout and a garbage
+    collector enforcing a disk quota.
+
+    Originals are named after their content hash (or random hex for older uploads), and
+    derivatives are named after the image they were made from (`<name>_mask_*`,
+    `<name>_resized_*` and `<name>_converted_*`). Derivatives can be made again,
+    so they are evicted least recently used first (by access time, or modification time
+    where access times are not kept) whenever the directory exceeds
+    IMAGE_STORAGE_QUOTA_BYTES. Originals are never evicted; they are deleted with their
+    last reference. Temporary files older than IMAGE_GC_TEMP_MAX_AGE are always removed.
+
+    Rather than walking the directory on every run, the collector keeps an index of sizes and
+    last uses, updated from the journal of writes, accesses and removals (ImageService.log_usage).
+    The first run of each process rebuilds it with a full walk, which also finds the temporary
+    files left behind by a crash.
+    """
+    _metrics_lock = threading.Lock()
+    _metrics = {
+        'runs': 0,
+        'last_run_at': None,
+        'last_run_seconds': None,
+        'usage_bytes': None,
+        'original_bytes': None,
+        'derivative_bytes': None,
+        'reclaimed_bytes': 0,
+        'reclaimed_files': 0,
+        'reclaimed_derivative_bytes': 0,
+        'reclaimed_temporary_bytes': 0
+    }
+    _collector = None
+    _collector_guard = threading.Lock()
+    _full_scan_due = True
+
+    @staticmethod
+    def classify(filename):
+        """
+        Tell what kind of file of the upload directory a name belongs to.
+
+        Args:
+            filename (str): Name of the file.
+
+        Returns:
+            str: "temporary", "derivative" or "original".
+        """
+        if filename.endswith(TEMPORARY_SUFFIXES):
+            return 'temporary'
+        if DERIVATIVE_PATTERN.search(os.path.splitext(filename)[0]):
+            return 'derivative'
+        return 'original'
+
+    @staticmethod
+    def _entries():
+        """Yield (path, kind, size, last used) for every file in the upload directory."""
+        for root, _, files in os.walk(ImageService.UPLOAD_FOLDER):
+            for filename in files:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, ImageStorageService.classify(filename), stat.st_size, max(stat.st_atime, stat.st_mtime)
+
+    @staticmethod
+    def record_access(path):
+        """Journal a use of a derivative, which keeps it from being evicted first."""
+        if ImageStorageService.classify(os.path.basename(path)) == 'derivative':
+            ImageService.log_usage('A', path)
+
+    @staticmethod
+    def _usage_index():
+        """
+        Bring the usage index up to date: fold in the journal, or rebuild the index with a
+        full walk on this process's first run (or if it is missing or unreadable).
+        Called with the collector lock held.
+
+        Returns:
+            tuple: (index, whether it was rebuilt)
+        """
+        folder = ImageService.UPLOAD_FOLDER
+        journal = os.path.join(folder, USAGE_JOURNAL)
+        # Events logged from now on go to a fresh journal, folded in on the next run.
+        reading = journal + '.reading'
+        if not os.path.exists(reading):
+            try:
+                os.replace(journal, reading)
+            except FileNotFoundError:
+                pass
+
+        index = None
+        if not ImageStorageService._full_scan_due:
+            try:
+                with open(os.path.join(folder, USAGE_INDEX)) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                pass
+        rebuilt = index is None
+        if rebuilt:
+            index = {
+                os.path.relpath(path, folder): [kind, size, last_used]
+                for path, kind, size, last_used in ImageStorageService._entries()
+            }
+        else:
+            try:
+                with open(reading) as f:
+                    for line in f:
+                        ImageStorageService._apply(index, line)
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(reading)
+        except FileNotFoundError:
+            pass
+        ImageStorageService._full_scan_due = False
+        return index, rebuilt
+
+    @staticmethod
+    def _apply(index, line):
+        """Apply one journal line to the usage index."""
+        if not line.endswith('\n'):
+            return  # Cut short by a crash.
+        try:
+            event, size, at, relative_path = line[:-1].split('\t', 3)
+            size, at = int(size), float(at)
+        except ValueError:
+            return
+        if event == 'W':
+            index[relative_path] = [ImageStorageService.classify(os.path.basename(relative_path)), size, at]
+        elif event == 'D':
+            index.pop(relative_path, None)
+        elif event == 'A' and relative_path in index:
+            index[relative_path][2] = max(index[relative_path][2], at)
+
+    @staticmethod
+    def _save_index(index):
+        path = os.path.join(ImageService.UPLOAD_FOLDER, USAGE_INDEX)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def collect(quota=None):
+        """
+        Run one garbage collection over the upload directory: remove stale temporary files,
+        then evict least recently used derivatives until usage is under 90% of the quota.
+        Only one process collects at a time; others skip the run.
+
+        Args:
+            quota (int): Disk quota in bytes (default: IMAGE_STORAGE_QUOTA_BYTES; 0 for none).
+
+        Returns:
+            dict: What the run found and reclaimed, or None if another process was collecting.
+        """
+        quota = Config.IMAGE_STORAGE_QUOTA_BYTES if quota is None else quota
+        os.makedirs(ImageService.UPLOAD_FOLDER, exist_ok=True)
+        with open(os.path.join(ImageService.UPLOAD_FOLDER, '.gc.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            return ImageStorageService._collect(quota)
+
+    @staticmethod
+    def _collect(quota):
+        start = time.perf_counter()
+        now = time.time()
+        usage = {'original': 0, 'derivative': 0, 'temporary': 0}
+        reclaimed = {'derivative': 0, 'temporary': 0}
+        files = 0
+        derivatives = []
+        index, rebuilt = ImageStorageService._usage_index()
+
+        for relative_path, (kind, size, last_used) in list(index.items()):
+            if kind == 'temporary' and now - last_used > Config.IMAGE_GC_TEMP_MAX_AGE:
+                del index[relative_path]
+                if ImageStorageService._remove(relative_path):
+                    reclaimed['temporary'] += size
+                    files += 1
+                continue
+            usage[kind] += size
+            if kind == 'derivative':
+                derivatives.append((last_used, relative_path, size))
+
+        total = sum(usage.values())
+        if quota and total > quota:
+            target = quota * 0.9
+            for _, relative_path, size in sorted(derivatives):
+                if total <= target:
+                    break
+                # A file already gone was removed without a journal entry: drop it either way.
+                del index[relative_path]
+                total -= size
+                usage['derivative'] -= size
+                if ImageStorageService._remove(relative_path):
+                    reclaimed['derivative'] += size
+                    files += 1
+            if total > quota:
+                logger.warning(f"Stored images use {total} bytes, above the {quota} byte quota, after evicting all derivatives")
+
+        ImageStorageService._save_index(index)
+        elapsed = time.perf_counter() - start
+        report = {
+            'usage_bytes': total,
+            'original_bytes': usage['original'],
+            'derivative_bytes': usage['derivative'],
+            'quota_bytes': quota,
+            'reclaimed_bytes': reclaimed['derivative'] + reclaimed['temporary'],
+            'reclaimed_files': files,
+            'reclaimed_derivative_bytes': reclaimed['derivative'],
+            'reclaimed_temporary_bytes': reclaimed['temporary'],
+            'full_scan': rebuilt,
+            'seconds': round(elapsed, 3)
+        }
+        with ImageStorageService._metrics_lock:
+            metrics = ImageStorageService._metrics
+            metrics['runs'] += 1
+            metrics['last_run_at'] = now
+            metrics['last_run_seconds'] = report['seconds']
+            for key in ('usage_bytes', 'original_bytes', 'derivative_bytes'):
+                metrics[key] = report[key]
+            for key in ('reclaimed_bytes', 'reclaimed_files', 'reclaimed_derivative_bytes', 'reclaimed_temporary_bytes'):
+                metrics[key] += report[key]
+        if report['reclaimed_files']:
+            logger.info(f"Image storage GC reclaimed {report['reclaimed_bytes']} bytes in {files} files")
+        return report
+
+    @staticmethod
+    def _remove(relative_path):
+        try:
+            os.remove(os.path.join(ImageService.UPLOAD_FOLDER, relative_path))
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def metrics():
+        """
+        Report this process's garbage collector metrics: runs, usage at the last run and
+        bytes / files reclaimed since the process started.
+
+        Returns:
+            dict: Metrics snapshot.
+        """
+        with ImageStorageService._metrics_lock:
+            return dict(
+                ImageStorageService._metrics,
+                quota_bytes=Config.IMAGE_STORAGE_QUOTA_BYTES,
+                interval_seconds=Config.IMAGE_GC_INTERVAL,
+                collector_running=ImageStorageService._collector is not None
+            )
+
+    @staticmethod
+    def start_collector():
+        """
+        Run `collect` every IMAGE_GC_INTERVAL seconds in a background thread, unless the
+        interval is 0 or the collector already runs in this process.
+
+        Returns:
+            bool: True if the collector was started.
+        """
+        with ImageStorageService._collector_guard:
+            if Config.IMAGE_GC_INTERVAL <= 0 or ImageStorageService._collector is not None:
+                return False
+
+            def run():
+                while True:
+                    time.sleep(Config.IMAGE_GC_INTERVAL)
+                    try:
+                        ImageStorageService.collect()
+                    except Exception:
+                        logger.exception("Image storage GC failed")
+
+            ImageStorageService._collector = threading.Thread(target=run, name="image-storage-gc", daemon=True)
+            ImageStorageService._collector.start()
+            return True
+
+    @staticmethod
+    def record_unrecorded(batch_size=100):
+        """
+        Record the metadata of originals stored before metadata was recorded (files without
+        an image_document row); masks and resized / converted copies are left alone.
+
+        Args:
+            batch_size (int): Files looked up per query.
+
+        Returns:
+            dict: Numbers of images recorded and of files that could not be decoded.
+        """
+        counts = {'recorded': 0, 'failed': 0}
+        originals = (
+            path for path, kind, _, _ in ImageStorageService._entries() if kind == 'original'
+        )
+        while True:
+            batch = {os.path.basename(path): path for path in itertools.islice(originals, batch_size)}
+            if not batch:
+                return counts
+            recorded = {filename for (filename,) in db.session.query(ImageDocument.unique_filename).filter(
+                ImageDocument.unique_filename.in_(batch)
+            )}
+            for filename, path in batch.items():
+                if filename in recorded:
+                    continue
+                try:
+                    ImageService.record_file(path)
+                    counts['recorded'] += 1
+                except (OSError, ValueError) as e:
+                    db.session.rollback()
+                    logger.warning(f"Could not record {filename}: {e}")
+                    counts['failed'] += 1
+
+    @staticmethod
+    def migrate_layout(batch_size=100, dry_run=False):
+        """
+        Move files stored directly in the upload directory into their shards. Each image's
+        files are copied to its shard, its row is updated, and the old files are removed
+        only once the batch is committed; files without a row (from before metadata was
+        recorded) are moved afterwards. Safe to run again after an interruption, and while
+        the application serves requests: a file is always at the path its row gives, and
+        files are looked up in their shard first, then in the upload directory.
+
+        Args:
+            batch_size (int): Images moved per commit.
+            dry_run (bool): Only count what would be moved.
+
+        Returns:
+            dict: Numbers of images and files moved, and of files left in place because
+                their shard already had a file of that name.
+        """
+        counts = {'images': 0, 'files': 0, 'conflicts': 0}
+        seen = set()
+        flat_prefix = os.path.join(ImageService.UPLOAD_FOLDER, '')
+        last_id = 0
+        while True:
+            documents = ImageDocument.query.filter(ImageDocument.id > last_id).order_by(
+                ImageDocument.id
+            ).limit(batch_size).all()
+            if not documents:
+                break
+            copied = []
+            for document in documents:
+                target = ImageService.storage_path(document.unique_filename)
+                if document.file_path == target or os.path.dirname(document.file_path) + os.sep != flat_prefix:
+                    continue
+                root = os.path.splitext(document.file_path)[0]
+                for path in [document.file_path] + glob.glob(glob.escape(root) + '_*'):
+                    if ImageStorageService._copy_to_shard(path, counts, seen, dry_run):
+                        copied.append(path)
+                counts['images'] += 1
+                if not dry_run:
+                    document.file_path = target
+            if not dry_run:
+                db.session.commit()
+                for path in copied:
+                    ImageStorageService._unlink(path)
+            last_id = documents[-1].id
+
+        for entry in os.scandir(ImageService.UPLOAD_FOLDER):
+            if entry.is_file() and not entry.name.startswith('.'):
+                if ImageStorageService._copy_to_shard(entry.path, counts, seen, dry_run) and not dry_run:
+                    ImageStorageService._unlink(entry.path)
+        return counts
+
+    @staticmethod
+    def _copy_to_shard(path, counts, seen, dry_run):
+        """Copy a file into its shard (a hard link where possible). Returns True if it was copied."""
+        # Temporary files are being written in place (or are left for the garbage collector).
+        if path in seen or not os.path.isfile(path) or ImageStorageService.classify(os.path.basename(path)) == 'temporary':
+            return False
+        seen.add(path)
+        target = ImageService.storage_path(os.path.basename(path))
+        if os.path.exists(target):
+            counts['conflicts'] += 1
+            return False
+        counts['files'] += 1
+        if dry_run:
+            return True
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            try:
+                os.link(path, tmp_path)
+            except OSError:
+                shutil.copy2(path, tmp_path)
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        ImageService.log_usage('W', target)
+        return True
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        ImageService.log_usage('D', path)
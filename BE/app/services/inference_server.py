@@ -0,0 +1,217 @@
+import ipaddress
+import logging
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from config import Config
+from app.services.model_loader import configure_torch_threads, configured_pipelines, load_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+def parse_address(address):
+    """
+    Turn a configured address into a multiprocessing.connection address.
+    "host:port" becomes a TCP address, anything else is a Unix socket path.
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+# Keys that give no protection: unset, or the public default of SECRET_KEY.
+INSECURE_AUTHKEYS = ("", "supersecretkey")
+
+
+def resolve_authkey(authkey=None):
+    """
+    Return the shared secret as bytes.
+
+    Raises:
+        RuntimeError: If the key is unset or a known default. Connections carry pickled
+            requests, so anyone who knows the key can run code in the server.
+    """
+    authkey = authkey or Config.INFERENCE_SERVER_AUTHKEY
+    if authkey in INSECURE_AUTHKEYS:
+        raise RuntimeError("Set INFERENCE_SERVER_AUTHKEY to a random secret to use the inference server")
+    return authkey.encode()
+
+
+def is_loopback(host):
+    """Whether a TCP host only accepts connections from this machine."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class InferenceServer:
+    """
+    A local inference process that owns the transformer pipelines, so web workers
+    don't each hold their own copy of the models.
+
+    Web workers connect over a local socket (see `InferenceClient`) and send
+    (task, args, kwargs) requests. At most `max_concurrency` requests run at once;
+    the rest wait in a queue whose depth is reported by the "metrics" request.
+    """
+
+    def __init__(self, address=None, authkey=None, max_concurrency=None, backend=None, allow_remote=None):
+        """
+        Raises:
+            RuntimeError: If the authkey is insecure, or the address is a non-loopback TCP
+                host and remote connections aren't allowed (INFERENCE_SERVER_ALLOW_REMOTE).
+        """
+        self.address = parse_address(address or Config.INFERENCE_SERVER_ADDRESS)
+        self.authkey = resolve_authkey(authkey)
+        allow_remote = Config.INFERENCE_SERVER_ALLOW_REMOTE if allow_remote is None else allow_remote
+        if isinstance(self.address, tuple) and not allow_remote and not is_loopback(self.address[0]):
+            raise RuntimeError(
+                f"Refusing to listen on {self.address[0]}: set INFERENCE_SERVER_ALLOW_REMOTE=true "
+                "to accept connections from other hosts"
+            )
+        self.max_concurrency = max_concurrency or Config.INFERENCE_SERVER_CONCURRENCY
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "queue_depth": 0,
+            "in_flight": 0,
+            "completed": 0,
+            "errors": 0,
+            "connections": 0,
+            "busy_seconds": 0.0,
+            "tasks": {},
+        }
+
+        configure_torch_threads()
+        start = time.perf_counter()
+        self.pipelines = {
+            key: load_pipeline(task, model, backend) for key, (task, model) in configured_pipelines().items()
+        }
+        logger.info(f"Inference server loaded {len(self.pipelines)} pipelines in {time.perf_counter() - start:.1f}s")
+
+    def serve_forever(self):
+        """Accept connections and handle each one on its own thread."""
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logger.info(
+                f"Inference server listening on {self.address} "
+                f"(tasks: {', '.join(self.pipelines)}, concurrency: {self.max_concurrency})"
+            )
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError) as e:
+                    logger.warning(f"Rejected inference connection: {e}")
+                    continue
+                threading.Thread(target=self._handle_connection, args=(connection,), daemon=True).start()
+
+    def metrics(self):
+        """Return a snapshot of the server's queue and throughput metrics."""
+        with self._metrics_lock:
+            snapshot = dict(self._metrics, tasks=dict(self._metrics["tasks"]))
+        snapshot["max_concurrency"] = self.max_concurrency
+        return snapshot
+
+    def _handle_connection(self, connection):
+        self._update_metrics(connections=1)
+        try:
+            while True:
+                try:
+                    task, args, kwargs = connection.recv()
+                except EOFError:
+                    break
+
+                if task == "metrics":
+                    connection.send(("ok", self.metrics()))
+                    continue
+
+                connection.send(self._run(task, args, kwargs))
+        finally:
+            self._update_metrics(connections=-1)
+            connection.close()
+
+    def _run(self, task, args, kwargs):
+        pipe = self.pipelines.get(task)
+        if pipe is None:
+            return "error", f"Task '{task}' is not served by this inference server"
+
+        self._update_metrics(queue_depth=1)
+        with self._slots:
+            self._update_metrics(queue_depth=-1, in_flight=1)
+            start = time.perf_counter()
+            try:
+                result = ("ok", pipe(*args, **kwargs))
+                self._update_metrics(completed=1, task=task)
+            except Exception as e:
+                logger.exception(f"Inference error in task '{task}'")
+                result = ("error", str(e))
+                self._update_metrics(errors=1)
+            finally:
+                self._update_metrics(in_flight=-1, busy_seconds=time.perf_counter() - start)
+        return result
+
+    def _update_metrics(self, task=None, **deltas):
+        with self._metrics_lock:
+            for key, delta in deltas.items():
+                self._metrics[key] += delta
+            if task:
+                self._metrics["tasks"][task] = self._metrics["tasks"].get(task, 0) + 1
+
+
+class InferenceClient:
+    """
+    Client used by web workers to talk to an `InferenceServer`.
+    Each thread keeps its own connection, opened lazily and re-opened once if it drops.
+    """
+
+    def __init__(self, address=None, authkey=None):
+        self.address = parse_address(address or Config.INFERENCE_SERVER_ADDRESS)
+        self.authkey = resolve_authkey(authkey)
+        self._local = threading.local()
+
+    def call(self, task, *args, **kwargs):
+        """
+        Run a pipeline call on the inference server.
+
+        Raises:
+            RuntimeError: If the server reports an error.
+        """
+        status, payload = self._request((task, args, kwargs))
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+    def metrics(self):
+        """Fetch the inference server's metrics."""
+        return self._request(("metrics", (), {}))[1]
+
+    def _request(self, message):
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            try:
+                if connection is None:
+                    connection = Client(self.address, authkey=self.authkey)
+                    self._local.connection = connection
+                connection.send(message)
+                return connection.recv()
+            except (EOFError, OSError):
+                self._local.connection = None
+                if attempt:
+                    raise
+
+
+class RemotePipeline:
+    """Callable stand-in for a transformers pipeline that runs on the inference server."""
+
+    def __init__(self, client, task):
+        self.client = client
+        self.task = task
+
+    def __call__(self, *args, **kwargs):
+        return self.client.call(self.task, *args, **kwargs)
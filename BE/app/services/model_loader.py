@@ -0,0 +1,226 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKENDS = ("pytorch", "quantized", "onnx")
+MODEL_TIERS = ("fast", "balanced", "quality")  # ordered from cheapest to most accurate
+MANIFEST_FILE = "manifest.json"
+
+
+def enabled_tiers():
+    """Return the enabled model tiers, in MODEL_TIERS order (at least "quality")."""
+    return [tier for tier in MODEL_TIERS if tier in Config.TEXT_ENABLED_TIERS] or ["quality"]
+
+
+def pipeline_key(task, tier=None):
+    """Name under which a task's pipeline for a given tier is served, e.g. "summarization/fast"."""
+    return f"{task}/{tier}" if tier else task
+
+
+def configured_pipelines():
+    """Return {pipeline key: (task, model)} for every pipeline TextService uses under the current config."""
+    pipelines = {}
+    for tier in enabled_tiers():
+        models = Config.TEXT_MODEL_TIERS[tier]
+        pipelines[pipeline_key("summarization", tier)] = ("summarization", models["summarization"])
+        if Config.TEXT_CATEGORIZER != "embedding":
+            pipelines[pipeline_key("zero-shot-classification", tier)] = (
+                "zero-shot-classification", models["zero-shot-classification"]
+            )
+    if Config.TEXT_CATEGORIZER == "embedding":
+        pipelines[pipeline_key("feature-extraction")] = ("feature-extraction", Config.TEXT_EMBEDDING_MODEL)
+    return pipelines
+
+
+def local_model_path(model_name, backend):
+    """Directory of a model's prefetched copy under TEXT_MODEL_DIR (ONNX exports are kept apart)."""
+    name = model_name.replace("/", "--") + ("--onnx" if backend == "onnx" else "")
+    return os.path.join(Config.TEXT_MODEL_DIR, name)
+
+
+def _file_checksums(path):
+    checksums = {}
+    for root, _, files in os.walk(path):
+        for filename in sorted(files):
+            file_path = os.path.join(root, filename)
+            relative_path = os.path.relpath(file_path, path)
+            if relative_path == MANIFEST_FILE:
+                continue
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            checksums[relative_path] = digest.hexdigest()
+    return checksums
+
+
+def verify_local_model(path):
+    """
+    Check a prefetched model directory against its manifest.
+
+    Raises:
+        RuntimeError: If the manifest is missing, or a file is missing, unexpected or modified.
+    """
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            expected = json.load(f)["files"]
+    except (OSError, ValueError, KeyError) as e:
+        raise RuntimeError(f"No valid model manifest in {path}: {e}")
+
+    actual = _file_checksums(path)
+    mismatched = sorted(name for name in set(expected) | set(actual) if expected.get(name) != actual.get(name))
+    if mismatched:
+        raise RuntimeError(f"Checksum verification failed for {path}: {', '.join(mismatched)}")
+
+
+def resolve_model_source(model_name, backend):
+    """
+    Return where to load a model from: its prefetched directory if there is one, else the hub id.
+    In offline mode (TEXT_MODELS_OFFLINE) the prefetched copy is required and verified.
+    """
+    path = local_model_path(model_name, backend)
+    if os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+        if Config.TEXT_MODELS_OFFLINE:
+            verify_local_model(path)
+        return path
+    if Config.TEXT_MODELS_OFFLINE:
+        raise RuntimeError(
+            f"Model '{model_name}' ({backend}) is not in {Config.TEXT_MODEL_DIR} and TEXT_MODELS_OFFLINE is set. "
+            f"Run `flask models prefetch` first."
+        )
+    return model_name
+
+
+def prefetch_model(task, model_name, backend=None, force=False):
+    """
+    Download a model (or export its ONNX graph) into TEXT_MODEL_DIR and write a checksum manifest.
+    Weights are saved as safetensors, which are memory-mapped when loaded.
+
+    Returns:
+        str: The model directory.
+    """
+    from transformers import pipeline
+
+    backend = (backend or Config.TEXT_INFERENCE_BACKEND).lower()
+    path = local_model_path(model_name, backend)
+    if os.path.isfile(os.path.join(path, MANIFEST_FILE)) and not force:
+        return path
+
+    # Write to a temporary directory and swap it in, so a failed download never looks complete.
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    if backend == "onnx":
+        _load_onnx_pipeline(task, model_name, export=True).save_pretrained(tmp_path)
+    else:
+        # Quantization happens at load time, so "quantized" shares the fp32 weights.
+        pipeline(task, model=model_name, device=-1).save_pretrained(tmp_path, safe_serialization=True)
+
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+        json.dump({
+            "task": task,
+            "model": model_name,
+            "backend": backend,
+            "files": _file_checksums(tmp_path),
+        }, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def configure_torch_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Apply explicit intra-op / inter-op thread settings for the current process.
+
+    Args:
+        intra_op_threads (int): Threads used inside a single operator (0 keeps the torch default).
+        inter_op_threads (int): Threads used to run independent operators (0 keeps the torch default).
+    """
+    import torch
+
+    intra_op_threads = Config.TORCH_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    inter_op_threads = Config.TORCH_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            # Can only be set once per process, before any inter-op work has started.
+            logger.warning(f"Could not set inter-op threads: {e}")
+
+
+def load_pipeline(task, model_name, backend=None):
+    """
+    Build a transformers pipeline on the configured CPU inference backend.
+
+    Args:
+        task (str): Pipeline task, e.g. "summarization" or "zero-shot-classification".
+        model_name (str): Hugging Face model identifier.
+        backend (str): One of "pytorch" (fp32), "quantized" (dynamic int8) or "onnx" (ONNX Runtime).
+
+    Returns:
+        Pipeline: A callable pipeline with the usual transformers interface.
+    """
+    backend = (backend or Config.TEXT_INFERENCE_BACKEND).lower()
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unsupported inference backend '{backend}'. Expected one of {INFERENCE_BACKENDS}.")
+
+    if Config.TEXT_MODELS_OFFLINE:
+        # Belt and braces: never let the hub libraries reach the network.
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    # Imported lazily so processes that only talk to the inference server stay light.
+    from transformers import pipeline
+
+    start = time.perf_counter()
+    source = resolve_model_source(model_name, backend)
+    if backend == "onnx":
+        pipe = _load_onnx_pipeline(task, source, export=source == model_name)
+    else:
+        pipe = pipeline(task, model=source, device=-1)
+        if backend == "quantized":
+            import torch
+
+            pipe.model = torch.quantization.quantize_dynamic(
+                pipe.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+    logger.info(f"Loaded {task} pipeline {model_name} ({backend}) from {source} in {time.perf_counter() - start:.1f}s")
+    return pipe
+
+
+def _load_onnx_pipeline(task, model_name, export=True):
+    """
+    Export (or load an already exported) ONNX graph and wrap it in a transformers pipeline.
+    Requires the optional `optimum[onnxruntime]` package.
+    """
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import (
+            ORTModelForFeatureExtraction, ORTModelForSeq2SeqLM, ORTModelForSequenceClassification
+        )
+        from transformers import AutoTokenizer, pipeline
+    except ImportError as e:
+        raise RuntimeError("The 'onnx' backend requires `pip install optimum[onnxruntime]`.") from e
+
+    session_options = onnxruntime.SessionOptions()
+    if Config.TORCH_INTRA_OP_THREADS:
+        session_options.intra_op_num_threads = Config.TORCH_INTRA_OP_THREADS
+    if Config.TORCH_INTER_OP_THREADS:
+        session_options.inter_op_num_threads = Config.TORCH_INTER_OP_THREADS
+
+    model_class = {
+        "summarization": ORTModelForSeq2SeqLM,
+        "zero-shot-classification": ORTModelForSequenceClassification,
+        "feature-extraction": ORTModelForFeatureExtraction,
+    }[task]
+    model = model_class.from_pretrained(model_name, export=export, session_options=session_options)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return pipeline(task, model=model, tokenizer=tokenizer)
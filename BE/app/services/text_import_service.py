@@ -0,0 +1,264 @@
+import codecs
+import csv
+import json
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from app import db
+from app.models.text import TextDocument, TextImportJob
+from app.services.dedup_service import DedupService
+from app.services.cluster_service import ClusterService
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Background workers shared by all import jobs; each runs one model-sized batch at a time.
+_executor = ThreadPoolExecutor(max_workers=Config.TEXT_IMPORT_WORKERS, thread_name_prefix="text-import")
+
+
+class TextImportService:
+    """
+    Bulk import of text documents: rows are inserted immediately with batched commits,
+    and their analysis is filled in by background workers in model-sized batches.
+    """
+
+    @staticmethod
+    def iter_rows(stream, file_type):
+        """
+        Parse an NDJSON or CSV stream into documents without loading it all in memory.
+
+        Args:
+            stream: Binary file-like object.
+            file_type (str): "ndjson" or "csv".
+
+        Yields:
+            tuple: (content, title) for each valid row, or None for a row that was skipped.
+        """
+        # Not io.TextIOWrapper: uploaded files are spooled to SpooledTemporaryFile, which has no
+        # readable() before Python 3.11.
+        text_stream = codecs.getreader("utf-8")(stream)
+        if file_type == "csv":
+            rows = csv.DictReader(text_stream)
+        else:
+            rows = TextImportService._iter_ndjson(text_stream)
+
+        for row in rows:
+            content = (row.get("text") or row.get("content")) if isinstance(row, dict) else None
+            if not isinstance(content, str) or not content.strip():
+                yield None
+                continue
+            yield content, str(row.get("title") or "Untitled")
+
+    @staticmethod
+    def _iter_ndjson(text_stream):
+        for line in text_stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield None
+
+    @staticmethod
+    def create_job(filename, rows):
+        """
+        Create an import job and insert its documents with batched commits.
+
+        Args:
+            filename (str): Name of the imported file, for reference.
+            rows (iterable): (content, title) tuples, or None for skipped rows.
+
+        Returns:
+            tuple: (TextImportJob, number of skipped rows)
+        """
+        job = TextImportJob(filename=filename, status='pending')
+        db.session.add(job)
+        db.session.commit()
+
+        batch, total, skipped = [], 0, 0
+        for row in rows:
+            if row is None:
+                skipped += 1
+                continue
+            content, title = row
+            batch.append({
+                'content': content,
+                'title': title[:200],
+                'created_at': datetime.utcnow(),
+                'analysis_status': 'pending',
+                'import_job_id': job.id
+            })
+            if len(batch) >= Config.TEXT_IMPORT_INSERT_BATCH:
+                total += TextImportService._insert_batch(batch)
+                batch = []
+        if batch:
+            total += TextImportService._insert_batch(batch)
+
+        job.total = total
+        db.session.commit()
+        return job, skipped
+
+    @staticmethod
+    def _insert_batch(batch):
+        db.session.bulk_insert_mappings(TextDocument, batch)
+        db.session.commit()
+        return len(batch)
+
+    @staticmethod
+    def start_analysis(app, job_id, text_service, mode=None):
+        """
+        Start filling in the analysis of a job's documents in the background.
+
+        Args:
+            app: The Flask application (background threads need their own app context).
+            job_id (int): The import job to process.
+            text_service (TextService): Service used to analyze the documents.
+            mode (str): Model tier used for the analysis (defaults to the configured tier).
+        """
+        threading.Thread(
+            target=TextImportService._run_job, args=(app, job_id, text_service, mode),
+            name=f"text-import-job-{job_id}", daemon=True
+        ).start()
+
+    @staticmethod
+    def fail_interrupted_jobs():
+        """
+        Mark jobs left pending or running by a previous process (whose background workers
+        died with it) as failed, along with their documents still awaiting analysis.
+        Run at startup, before any worker accepts imports.
+
+        Returns:
+            int: Number of jobs marked as failed.
+        """
+        jobs = TextImportJob.query.filter(TextImportJob.status.in_(('pending', 'running'))).all()
+        for job in jobs:
+            failed = TextDocument.query.filter_by(import_job_id=job.id, analysis_status='pending').update(
+                {TextDocument.analysis_status: 'failed'}, synchronize_session=False
+            )
+            job.failed += failed
+            job.status = 'failed'
+            job.error = 'Interrupted by a restart'
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return len(jobs)
+
+    @staticmethod
+    def _run_job(app, job_id, text_service, mode):
+        with app.app_context():
+            job = db.session.get(TextImportJob, job_id)
+            job.status = 'running'
+            db.session.commit()
+
+            try:
+                # Keep a bounded number of batches in flight so huge imports don't queue up at once.
+                in_flight, last_id = set(), 0
+                while True:
+                    batch = [doc_id for (doc_id,) in db.session.query(TextDocument.id).filter(
+                        TextDocument.import_job_id == job_id,
+                        TextDocument.analysis_status == 'pending',
+                        TextDocument.id > last_id
+                    ).order_by(TextDocument.id).limit(Config.TEXT_IMPORT_ANALYSIS_BATCH)]
+                    if not batch:
+                        break
+                    last_id = batch[-1]
+                    in_flight.add(_executor.submit(
+                        TextImportService._analyze_batch, app, job_id, batch, text_service, mode
+                    ))
+                    if len(in_flight) >= 2 * Config.TEXT_IMPORT_WORKERS:
+                        _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                wait(in_flight)
+
+                job = db.session.get(TextImportJob, job_id)
+                db.session.refresh(job)
+                job.status = 'completed'
+            except Exception as e:
+                logger.exception(f"Import job {job_id} failed")
+                db.session.rollback()
+                job = db.session.get(TextImportJob, job_id)
+                job.status = 'failed'
+                job.error = str(e)
+
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+    @staticmethod
+    def _analyze_batch(app, job_id, doc_ids, text_service, mode):
+        with app.app_context():
+            documents = TextDocument.query.filter(TextDocument.id.in_(doc_ids)).all()
+            analyzed = failed = duplicates = 0
+
+            # Near-duplicates of already analyzed documents skip the models entirely.
+            to_analyze = []
+            for doc in documents:
+                signature = DedupService.signature(doc.content)
+                duplicate = None
+                if Config.TEXT_DEDUP_MODE in ('reuse', 'reject'):
+                    duplicate, _ = DedupService.find_duplicate(signature, exclude_id=doc.id)
+
+                if duplicate is not None and Config.TEXT_DEDUP_MODE == 'reject':
+                    db.session.delete(doc)
+                    duplicates += 1
+                    continue
+
+                DedupService.index_document(doc, signature)
+                if duplicate is not None:
+                    TextImportService._apply_analysis(doc, {
+                        'sentiment_score': duplicate.sentiment_score,
+                        'keywords': duplicate.keywords,
+                        'summary': duplicate.summary,
+                        'category': duplicate.category
+                    })
+                    duplicates += 1
+                else:
+                    to_analyze.append(doc)
+
+            try:
+                results = text_service.analyze_batch([doc.content for doc in to_analyze], mode) if to_analyze else []
+            except Exception as e:
+                logger.exception(f"Analysis failed for a batch of import job {job_id}: {e}")
+                results = [None] * len(to_analyze)
+
+            for doc, analysis in zip(to_analyze, results):
+                if analysis is None:
+                    doc.analysis_status = 'failed'
+                    failed += 1
+                    continue
+                TextImportService._apply_analysis(doc, analysis)
+                analyzed += 1
+
+            ClusterService.assign([doc for doc in documents if doc not in db.session.deleted], app)
+
+            # Atomic increments: several workers update the same job concurrently.
+            TextImportJob.query.filter_by(id=job_id).update({
+                TextImportJob.analyzed: TextImportJob.analyzed + analyzed,
+                TextImportJob.failed: TextImportJob.failed + failed,
+                TextImportJob.duplicates: TextImportJob.duplicates + duplicates
+            })
+            db.session.commit()
+
+    @staticmethod
+    def _apply_analysis(doc, analysis):
+        doc.sentiment_score = analysis['sentiment_score']
+        doc.keywords = analysis['keywords']
+        doc.summary = analysis['summary']
+        doc.category = analysis['category']
+        doc.analysis_status = 'done'
+
+    @staticmethod
+    def job_to_dict(job):
+        """Serialize an import job, including its progress."""
+        processed = job.analyzed + job.failed + job.duplicates
+        return {
+            'id': job.id,
+            'filename': job.filename,
+            'status': job.status,
+            'total': job.total,
+            'analyzed': job.analyzed,
+            'failed': job.failed,
+            'duplicates': job.duplicates,
+            'progress': round(processed / job.total, 4) if job.total else 1.0,
+            'error': job.error,
+            'created_at': job.created_at.isoformat(),
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None
+        }
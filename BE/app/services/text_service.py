@@ -1,68 +1,296 @@
-from transformers import pipeline
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.manifold import TSNE
 import numpy as np
 from textblob import TextBlob
+from config import Config
+from app.services.model_loader import MODEL_TIERS, configure_torch_threads, enabled_tiers, load_pipeline, pipeline_key
+from app.services.category_classifier import EmbeddingCategorizer
+from app.services.inference_server import InferenceClient, RemotePipeline
+
+logger = logging.getLogger(__name__)
 
 class TextService:
     """
     A service for analyzing, summarizing, categorizing, and searching text data.
     This class provides methods for sentiment analysis, keyword extraction,
     text summarization, text categorization, T-SNE visualization, and document search.
+
+    Summarization and zero-shot classification come in model tiers (fast, balanced,
+    quality); only the enabled tiers are loaded, and each request picks one.
     """
-    def __init__(self):
-        """Initialize pipelines and vectorizers."""
+    # Initial latency estimates per tier (summary + category, in ms per input word),
+    # refined from observed latencies to route mode=auto requests with a latency budget.
+    DEFAULT_MS_PER_WORD = {'fast': 3.0, 'balanced': 5.0, 'quality': 10.0}
+    # How often iter_analysis checks whether its queued stages have started.
+    QUEUE_POLL_SECONDS = 0.05
+
+    def __init__(self, backend=None, mode=None):
+        """
+        Initialize pipelines and vectorizers.
+
+        Args:
+            backend (str): Inference backend override ("pytorch", "quantized" or "onnx").
+                Defaults to Config.TEXT_INFERENCE_BACKEND.
+            mode (str): "local" to load the models in this process, or "remote" to use the
+                shared inference server. Defaults to Config.TEXT_INFERENCE_MODE.
+        """
+        self.mode = mode or Config.TEXT_INFERENCE_MODE
+        self.inference_client = InferenceClient() if self.mode == "remote" else None
+        start = time.perf_counter()
         try:
-            self.summarizer = pipeline("summarization", model="facebook/bart-large-cnn")
-            self.classifier = pipeline("zero-shot-classification")
-            self.vectorizer = TfidfVectorizer()
+            if self.inference_client is None:
+                configure_torch_threads()
+            self.enabled_tiers = enabled_tiers()
+            self.default_tier = self._nearest_tier(Config.TEXT_DEFAULT_TIER)
+            self.summarizers = {
+                tier: self._load_pipeline("summarization", Config.TEXT_MODEL_TIERS[tier]["summarization"], backend, tier)
+                for tier in self.enabled_tiers
+            }
+            self.categorizer = Config.TEXT_CATEGORIZER
+            self.category_labels = Config.TEXT_CATEGORY_LABELS
+            self.classifiers = {}
+            self.embedding_categorizer = None
+            if self.categorizer == "embedding":
+                self.embedding_categorizer = EmbeddingCategorizer(
+                    self._load_pipeline("feature-extraction", Config.TEXT_EMBEDDING_MODEL, backend),
+                    min_similarity=Config.TEXT_EMBEDDING_MIN_SIMILARITY,
+                    head_path=Config.TEXT_CATEGORIZER_HEAD_PATH,
+                    model_name=Config.TEXT_EMBEDDING_MODEL
+                )
+                # Encode the label set once at startup rather than on the first request
+                # (in remote mode the server may not be up yet, so it happens lazily).
+                if self.inference_client is None:
+                    self.embedding_categorizer.label_embeddings(self.category_labels)
+            else:
+                self.classifiers = {
+                    tier: self._load_pipeline(
+                        "zero-shot-classification", Config.TEXT_MODEL_TIERS[tier]["zero-shot-classification"],
+                        backend, tier
+                    ) for tier in self.enabled_tiers
+                }
         except Exception as e:
             raise RuntimeError(f"Error initializing pipelines: {e}")
+        self.startup_seconds = round(time.perf_counter() - start, 2)
+        logger.info(f"Text models ready in {self.startup_seconds}s (mode: {self.mode}, tiers: {', '.join(self.enabled_tiers)})")
+
+        # Bounded pool shared by all requests; the transformer stages release the GIL.
+        self.executor = ThreadPoolExecutor(
+            max_workers=Config.TEXT_ANALYSIS_WORKERS, thread_name_prefix="text-analysis"
+        )
+        self.stage_timeouts = {
+            'sentiment_score': Config.TEXT_STAGE_TIMEOUT,
+            'keywords': Config.TEXT_STAGE_TIMEOUT,
+            'summary': Config.TEXT_STAGE_TIMEOUT,
+            'category': Config.TEXT_STAGE_TIMEOUT
+        }
+        self.ms_per_word = {tier: self.DEFAULT_MS_PER_WORD[tier] for tier in self.enabled_tiers}
+        self._latency_lock = threading.Lock()
+    
+    def _load_pipeline(self, task, model_name, backend, tier=None):
+        """Load a pipeline in-process, or proxy it to the inference server in remote mode."""
+        if self.inference_client is not None:
+            return RemotePipeline(self.inference_client, pipeline_key(task, tier))
+        return load_pipeline(task, model_name, backend)
+    
+    def _nearest_tier(self, tier):
+        """Map a requested tier to the closest enabled one, preferring the more accurate on ties."""
+        if tier not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier '{tier}'. Expected one of {MODEL_TIERS} or 'auto'.")
+        target = MODEL_TIERS.index(tier)
+        return min(reversed(self.enabled_tiers), key=lambda t: abs(MODEL_TIERS.index(t) - target))
     
-    def analyze_text(self, text):
+    def select_tier(self, text, mode=None, latency_budget_ms=None):
+        """
+        Pick the model tier for a request.
+        
+        Args:
+            text (str): The input text.
+            mode (str): "fast", "balanced", "quality" or "auto". Defaults to the configured tier,
+                or "auto" when a latency budget is given.
+            latency_budget_ms (float): With "auto", the most accurate tier expected to finish
+                within this budget is used.
+        
+        Returns:
+            str: An enabled tier.
+        """
+        if mode is None:
+            mode = 'auto' if latency_budget_ms is not None else self.default_tier
+        if mode != 'auto':
+            return self._nearest_tier(mode)
+
+        words = len(text.split())
+        if latency_budget_ms is not None:
+            for tier in reversed(self.enabled_tiers):
+                if self.ms_per_word[tier] * words <= latency_budget_ms:
+                    return tier
+            return self.enabled_tiers[0]
+        return self.enabled_tiers[0] if words > Config.TEXT_AUTO_FAST_WORDS else self.default_tier
+    
+    def _record_latency(self, tier, words, milliseconds):
+        """Update a tier's latency estimate with an exponentially weighted moving average."""
+        with self._latency_lock:
+            self.ms_per_word[tier] = 0.8 * self.ms_per_word[tier] + 0.2 * milliseconds / words
+    
+    def inference_metrics(self):
+        """
+        Report inference server metrics (queue depth, in-flight requests, throughput).
+        
+        Returns:
+            dict: Metrics, or just the mode and model startup time when models are loaded in-process.
+        """
+        if self.inference_client is None:
+            return {'mode': self.mode, 'startup_seconds': self.startup_seconds}
+        return dict(self.inference_client.metrics(), mode=self.mode, startup_seconds=self.startup_seconds)
+    
+    def analyze_text(self, text, mode=None, latency_budget_ms=None):
         """
         Perform comprehensive text analysis, including sentiment analysis,
         keyword extraction, summarization, and categorization.
         
         Args:
             text (str): The input text to analyze.
+            mode (str): Model tier, see `select_tier`.
+            latency_budget_ms (float): Latency budget for automatic tier selection.
         
         Returns:
-            dict: Analysis results including sentiment score, keywords, summary, and category.
+            dict: Analysis results including sentiment score, keywords, summary, and category,
+                plus the tier used and per-stage timings under 'metadata'.
+        """
+        return dict(self.iter_analysis(text, mode, latency_budget_ms))
+    
+    def iter_analysis(self, text, mode=None, latency_budget_ms=None):
+        """
+        Run the analysis stages concurrently on the shared pool, yielding each result
+        as soon as it is ready. A stage that runs longer than its timeout (counted from
+        when it starts, not while it waits for a worker) yields None instead of failing
+        the whole analysis.
+        
+        Args:
+            text (str): The input text to analyze.
+            mode (str): Model tier, see `select_tier`.
+            latency_budget_ms (float): Latency budget for automatic tier selection.
+        
+        Yields:
+            tuple: (field name, value) for sentiment_score, keywords, summary and category
+                in completion order, followed by ('metadata', {...}) with the tier used
+                and per-stage timings.
         """
         if not isinstance(text, str) or not text.strip():
             raise ValueError("Input text must be a non-empty string.")
 
+        tier = self.select_tier(text, mode, latency_budget_ms)
+        stages = {
+            'sentiment_score': self._analyze_sentiment,
+            'keywords': self._extract_keywords,
+            'summary': partial(self._generate_summary, tier=tier),
+            'category': partial(self._categorize_text_safe, tier=tier)
+        }
+        start = time.perf_counter()
+        started = {}
+        futures = {
+            self.executor.submit(self._timed, fn, text, started, field): field
+            for field, fn in stages.items()
+        }
+        timings, timed_out = {}, []
+
+        pending = set(futures)
         try:
-            blob = TextBlob(text)
-            sentiment_score = blob.sentiment.polarity
-        except Exception as e:
-            print(f"Sentiment analysis error: {e}")
-            sentiment_score = None
+            while pending:
+                # A stage's clock starts when it leaves the pool's queue, so waiting behind
+                # other requests' stages doesn't count against its timeout.
+                deadlines = [started[futures[f]] + self.stage_timeouts[futures[f]]
+                             for f in pending if futures[f] in started]
+                timeout = min(deadlines) - time.perf_counter() if deadlines else self.QUEUE_POLL_SECONDS
+                if len(deadlines) < len(pending):
+                    timeout = min(timeout, self.QUEUE_POLL_SECONDS)
+                done, pending = wait(pending, timeout=max(0, timeout), return_when=FIRST_COMPLETED)
+                for future in done:
+                    value, seconds = future.result()
+                    timings[futures[future]] = round(seconds * 1000, 1)
+                    yield futures[future], value
 
+                now = time.perf_counter()
+                for future in [f for f in pending if futures[f] in started
+                               and started[futures[f]] + self.stage_timeouts[futures[f]] <= now]:
+                    # A running stage cannot be interrupted; it finishes in the background.
+                    pending.discard(future)
+                    timed_out.append(futures[future])
+                    yield futures[future], None
+        finally:
+            # Stages still queued when the caller stops listening never run.
+            for future in pending:
+                future.cancel()
+
+        # A model stage that timed out counts as taking its full timeout.
+        words = len(text.split())
+        model_ms = [timings.get(field, self.stage_timeouts[field] * 1000) for field in ('summary', 'category')]
+        if words >= 50:
+            self._record_latency(tier, words, max(model_ms))
+
+        yield 'metadata', {
+            'tier': tier,
+            'timings_ms': timings,
+            'timed_out': timed_out,
+            'total_ms': round((time.perf_counter() - start) * 1000, 1)
+        }
+    
+    @staticmethod
+    def _timed(fn, text, started, field):
+        """Run a single analysis stage, recording its start time under `field` in `started`."""
+        start = started[field] = time.perf_counter()
+        value = fn(text)
+        return value, time.perf_counter() - start
+    
+    def _categorize_text_safe(self, text, tier=None):
+        """Categorize the text, returning None instead of raising."""
         try:
-            tfidf_matrix = self.vectorizer.fit_transform([text])
-            feature_names = self.vectorizer.get_feature_names_out()
-            sorted_items = self._sort_tfidf_features(tfidf_matrix, feature_names)
-            keywords = [item[0] for item in sorted_items[:10]]
+            return self._categorize_text(text, tier)
         except Exception as e:
-            print(f"TF-IDF keyword extraction error: {e}")
-            keywords = []
-
-        summary = self._generate_summary(text)
+            print(f"Categorization error: {e}")
+            return None
+    
+    def _analyze_sentiment(self, text):
+        """
+        Compute the sentiment polarity of the input text with TextBlob.
+        
+        Args:
+            text (str): The input text.
         
+        Returns:
+            float: Polarity in [-1, 1], or None on failure.
+        """
         try:
-            category = self._categorize_text(text)
+            blob = TextBlob(text)
+            return blob.sentiment.polarity
         except Exception as e:
-            print(f"Categorization error: {e}")
-            category = None
+            print(f"Sentiment analysis error: {e}")
+            return None
+    
+    def _extract_keywords(self, text):
+        """
+        Extract the top 10 TF-IDF keywords from the input text.
         
-        return {
-            'sentiment_score': sentiment_score,
-            'keywords': keywords,
-            'summary': summary,
-            'category': category
-        }
+        Args:
+            text (str): The input text.
+        
+        Returns:
+            list: Keywords ordered by importance.
+        """
+        try:
+            # A fresh vectorizer per call: stages of concurrent requests run in parallel.
+            vectorizer = TfidfVectorizer()
+            tfidf_matrix = vectorizer.fit_transform([text])
+            feature_names = vectorizer.get_feature_names_out()
+            sorted_items = self._sort_tfidf_features(tfidf_matrix, feature_names)
+            return [item[0] for item in sorted_items[:10]]
+        except Exception as e:
+            print(f"TF-IDF keyword extraction error: {e}")
+            return []
     
     def generate_tsne(self, texts):
         """
@@ -78,7 +306,7 @@ class TextService:
             raise ValueError("Need at least 2 texts for T-SNE visualization.")
 
         try:
-            tfidf_matrix = self.vectorizer.fit_transform(texts)
+            tfidf_matrix = TfidfVectorizer().fit_transform(texts)
             perplexity = min(30, len(texts) - 1)
             tsne = TSNE(n_components=2, perplexity=perplexity, random_state=42)
             tsne_result = tsne.fit_transform(tfidf_matrix.toarray())
@@ -86,12 +314,83 @@ class TextService:
         except Exception as e:
             raise RuntimeError(f"T-SNE generation error: {e}")
     
-    def _generate_summary(self, text):
+    def analyze_batch(self, texts, mode=None):
         """
-        Generate a summary of the input text using BART model.
+        Analyze a batch of texts, running the transformer stages once per batch
+        instead of once per text. Used for background analysis of bulk imports.
+        
+        Args:
+            texts (list of str): Non-empty texts to analyze.
+            mode (str): Model tier ("fast", "balanced" or "quality"); defaults to the configured tier.
+        
+        Returns:
+            list of dict: Analysis results (sentiment score, keywords, summary, category) per text.
+        """
+        tier = self._nearest_tier(mode) if mode and mode != 'auto' else self.default_tier
+        summaries = self._generate_summaries(texts, tier)
+        categories = self._categorize_texts(texts, tier)
+        return [{
+            'sentiment_score': self._analyze_sentiment(text),
+            'keywords': self._extract_keywords(text),
+            'summary': summary,
+            'category': category
+        } for text, summary, category in zip(texts, summaries, categories)]
+    
+    def _generate_summaries(self, texts, tier=None):
+        """
+        Summarize several texts in one batched call; short texts are returned unchanged.
+        
+        Args:
+            texts (list of str): Input texts to summarize.
+            tier (str): Model tier (defaults to the configured tier).
+        
+        Returns:
+            list of str: One summary per input text.
+        """
+        summaries = list(texts)
+        long_indexes = [i for i, text in enumerate(texts) if len(text.split()) >= 50]
+        if not long_indexes:
+            return summaries
+        
+        try:
+            results = self.summarizers[tier or self.default_tier](
+                [texts[i] for i in long_indexes], max_length=50, min_length=20, do_sample=False,
+                truncation=True, batch_size=len(long_indexes)
+            )
+            for i, result in zip(long_indexes, results):
+                summaries[i] = result['summary_text']
+        except Exception as e:
+            print(f"Batch summary generation error: {e}")
+        return summaries
+    
+    def _categorize_texts(self, texts, tier=None):
+        """
+        Categorize several texts in one batched call.
+        
+        Args:
+            texts (list of str): The input texts to classify.
+            tier (str): Model tier (defaults to the configured tier).
+        
+        Returns:
+            list of str: Best matching category (or 'Uncategorized') per text, None on failure.
+        """
+        try:
+            if self.embedding_categorizer is not None:
+                return self.embedding_categorizer.predict_batch(texts, self.category_labels)
+
+            results = self.classifiers[tier or self.default_tier](texts, self.category_labels)
+            return [r["labels"][0] if r["scores"][0] > 0.3 else "Uncategorized" for r in results]
+        except Exception as e:
+            print(f"Batch text classification error: {e}")
+            return [None] * len(texts)
+    
+    def _generate_summary(self, text, tier=None):
+        """
+        Generate a summary of the input text using the tier's BART model.
         
         Args:
             text (str): Input text to summarize.
+            tier (str): Model tier (defaults to the configured tier).
         
         Returns:
             str: Summarized text.
@@ -100,35 +399,52 @@ class TextService:
             return text
         
         try:
-            summary = self.summarizer(text, max_length=50, min_length=20, do_sample=False)
+            summary = self.summarizers[tier or self.default_tier](text, max_length=50, min_length=20, do_sample=False)
             return summary[0]['summary_text']
         except Exception as e:
             print(f"Summary generation error: {e}")
             return text
     
-    def _categorize_text(self, text):
+    def _categorize_text(self, text, tier=None):
         """
-        Categorize the input text using a zero-shot classification model.
+        Categorize the input text using the configured categorizer: the tier's zero-shot
+        classification model, or similarity against cached label embeddings.
         
         Args:
             text (str): The input text to classify.
+            tier (str): Model tier (defaults to the configured tier).
         
         Returns:
             str: Best matching category or 'Uncategorized'.
         """
-        candidate_labels = [
-            "Technology", "Science", "Business", "Politics", "Entertainment", "Sports",
-            "Health", "Education", "Environment"
-        ]
+        candidate_labels = self.category_labels
         
         try:
-            results = self.classifier(text, candidate_labels)
+            if self.embedding_categorizer is not None:
+                return self.embedding_categorizer.predict(text, candidate_labels)
+
+            results = self.classifiers[tier or self.default_tier](text, candidate_labels)
             best_category = results["labels"][0] if results["scores"][0] > 0.3 else "Uncategorized"
             return best_category
         except Exception as e:
             print(f"Text classification error: {e}")
             return "Uncategorized"
     
+    def train_categorizer(self, texts, categories):
+        """
+        Train the embedding categorizer's classification head on previously categorized texts.
+        
+        Args:
+            texts (list of str): Document contents.
+            categories (list of str): Category of each document.
+        
+        Returns:
+            int: Number of distinct categories learned.
+        """
+        if self.embedding_categorizer is None:
+            raise ValueError("Categorizer training requires TEXT_CATEGORIZER=embedding.")
+        return self.embedding_categorizer.fit(texts, categories)
+    
     def _sort_tfidf_features(self, tfidf_matrix, feature_names):
         """
         Sort TF-IDF features by importance.
@@ -170,9 +486,9 @@ class TextService:
             if not all_texts:
                 return []
             
-            self.vectorizer.fit(all_texts)
-            query_vector = self.vectorizer.transform([query])
-            doc_vectors = self.vectorizer.transform(all_texts)
+            vectorizer = TfidfVectorizer().fit(all_texts)
+            query_vector = vectorizer.transform([query])
+            doc_vectors = vectorizer.transform(all_texts)
             similarities = (query_vector * doc_vectors.T).toarray()[0]
             results = [(doc, score) for doc, score in zip(documents, similarities) if score > 0.1]
             return sorted(results, key=lambda x: x[1], reverse=True)
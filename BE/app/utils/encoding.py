@@ -0,0 +1,116 @@
+"""
+Content negotiation for numeric-heavy responses.
+
+JSON stays the default. Clients can ask for a compact encoding with the Accept header:
+
+- `application/msgpack` (or `application/x-msgpack`): the payload as MessagePack, with numeric
+  arrays as `{"dtype": "<f4", "shape": [...], "data": <little-endian bytes>}` maps.
+- `application/x-npy`: endpoints whose payload is a single array send it in NumPy's .npy
+  format (a small header with dtype and shape, then the little-endian data); axis labels,
+  if any, are in the X-Array-Labels header as JSON.
+"""
+import io
+import json
+import msgpack
+import numpy as np
+from flask import current_app, jsonify, request
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+NPY = 'application/x-npy'
+# Accepted alias of MSGPACK.
+_MSGPACK_TYPES = (MSGPACK, 'application/x-msgpack')
+
+
+def negotiate(*offers):
+    """
+    Pick a response encoding from the request's Accept header.
+
+    Args:
+        *offers: Binary encodings the endpoint can send besides JSON (MSGPACK, NPY).
+
+    Returns:
+        str: JSON, or one of the offers the client prefers to it.
+    """
+    available = [JSON]
+    for offer in offers:
+        available.extend(_MSGPACK_TYPES if offer == MSGPACK else (offer,))
+    best = request.accept_mimetypes.best_match(available, default=JSON)
+    return MSGPACK if best in _MSGPACK_TYPES else best
+
+
+def counts(values):
+    """Integer counts as an array of the smallest unsigned type that holds them."""
+    array = np.asarray(values)
+    return array.astype(np.min_scalar_type(int(array.max()) if array.size else 0))
+
+
+def labelled_matrix(mapping, dtype=np.float32):
+    """
+    Turn a nested {row: {column: value}} mapping (as from DataFrame.to_dict()) into
+    {"columns": [...], "values": 2-D array}.
+    """
+    columns = list(mapping)
+    values = np.array([[mapping[row][column] for column in columns] for row in columns], dtype=dtype)
+    return {'columns': columns, 'values': values.reshape(len(columns), len(columns))}
+
+
+def _little_endian(array):
+    array = np.ascontiguousarray(array)
+    return array.astype(array.dtype.newbyteorder('<'), copy=False)
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+
+def _to_msgpack(value):
+    if isinstance(value, np.ndarray):
+        array = _little_endian(value)
+        return {'dtype': array.dtype.str, 'shape': list(array.shape), 'data': array.tobytes()}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {key: _to_msgpack(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_msgpack(item) for item in value]
+    return value
+
+
+def encoded_response(payload, encoding=JSON, status=200, labels=None):
+    """
+    Build a response in the negotiated encoding.
+
+    Args:
+        payload: Response data; numpy arrays become lists in JSON and typed binary arrays otherwise.
+            Must be a single array for NPY.
+        encoding (str): Result of `negotiate`.
+        status (int): HTTP status code.
+        labels: Axis labels of an NPY array, sent in the X-Array-Labels header.
+
+    Returns:
+        Response: Varying by Accept.
+    """
+    if encoding == MSGPACK:
+        response = current_app.response_class(
+            msgpack.packb(_to_msgpack(payload), use_bin_type=True), mimetype=MSGPACK
+        )
+    elif encoding == NPY:
+        buffer = io.BytesIO()
+        np.lib.format.write_array(buffer, _little_endian(payload), allow_pickle=False)
+        response = current_app.response_class(buffer.getvalue(), mimetype=NPY)
+        if labels is not None:
+            response.headers['X-Array-Labels'] = json.dumps(labels)
+    else:
+        response = jsonify(_to_json(payload))
+    response.status_code = status
+    response.vary.add('Accept')
+    return response
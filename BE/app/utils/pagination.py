@@ -0,0 +1,65 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) position as an opaque URL-safe cursor."""
+    payload = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Clamp a requested page size to [1, maximum]."""
+    if value is None:
+        return default
+    return max(1, min(int(value), maximum))
+
+
+def keyset_paginate(query, created_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Apply newest-first keyset pagination ordered by (created_at, id).
+
+    Args:
+        query: SQLAlchemy query to paginate.
+        created_column: The model's created_at column.
+        id_column: The model's primary key column.
+        cursor (str): Cursor returned with the previous page, if any.
+        limit (int): Page size.
+
+    Returns:
+        tuple: (rows for this page, cursor for the next page or None)
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < row_id)
+        ))
+
+    rows = query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
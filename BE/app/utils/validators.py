@@ -1,6 +1,7 @@
 from functools import wraps
 import os
 from flask import request, jsonify
+from config import Config
 
 def validate_file_upload(f):
     """Decorator to validate file upload requests."""
@@ -41,6 +42,20 @@ def validate_file_update(f):
     return decorated_function
 
 
+ANALYSIS_MODES = ('fast', 'balanced', 'quality', 'auto')
+
+
+def analysis_mode_error(mode, latency_budget_ms=None):
+    """Return an error message for an invalid analysis mode or latency budget, or None."""
+    if mode is not None and mode not in ANALYSIS_MODES:
+        return f"Invalid mode. Expected one of: {', '.join(ANALYSIS_MODES)}"
+    if latency_budget_ms is not None and (
+        isinstance(latency_budget_ms, bool) or not isinstance(latency_budget_ms, (int, float)) or latency_budget_ms <= 0
+    ):
+        return 'latency_budget_ms must be a positive number'
+    return None
+
+
 def validate_text_input(f):
     """Decorator to validate text input in POST requests."""
     @wraps(f)
@@ -48,6 +63,34 @@ def validate_text_input(f):
         data = request.get_json()
         if not data or 'text' not in data:
             return jsonify({'error': 'No text provided'}), 400
+        if not isinstance(data['text'], str) or not data['text'].strip():
+            return jsonify({'error': 'Input text must be a non-empty string.'}), 400
+        error = analysis_mode_error(data.get('mode'), data.get('latency_budget_ms'))
+        if error:
+            return jsonify({'error': error}), 400
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def validate_text_import(f):
+    """Decorator to validate bulk text import requests (NDJSON or CSV, as a file or raw body)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if "file" in request.files:
+            file = request.files["file"]
+            if file.filename == "":
+                return jsonify({"error": "No selected file"}), 400
+
+            file_extension = file.filename.rsplit(".", 1)[-1].lower()
+            if file_extension not in ['ndjson', 'jsonl', 'csv']:
+                return jsonify({"error": "Unsupported file format. Only NDJSON and CSV files are allowed."}), 400
+        elif request.mimetype not in ['application/x-ndjson', 'application/jsonl', 'text/csv']:
+            return jsonify({"error": "Send a file part, or an application/x-ndjson or text/csv body"}), 400
+
+        error = analysis_mode_error(request.args.get("mode"))
+        if error:
+            return jsonify({"error": error}), 400
+
         return f(*args, **kwargs)
     return decorated_function
 
@@ -59,6 +102,9 @@ def validate_document_update(f):
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided for update'}), 400
+        error = analysis_mode_error(data.get('mode'), data.get('latency_budget_ms'))
+        if error:
+            return jsonify({'error': error}), 400
         return f(*args, **kwargs)
     return decorated_function
 
@@ -141,6 +187,26 @@ def validate_single_image_upload(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def validate_batch_transform(f):
+    """Decorator to validate batch transform requests: a JSON list of stored images, or a multipart batch."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.is_json:
+            images = (request.get_json(silent=True) or {}).get('images')
+            if not isinstance(images, list) or not images or not all(isinstance(i, (str, int)) for i in images):
+                return jsonify({"error": "'images' must be a non-empty list of image ids or filenames"}), 400
+            count = len(images)
+        else:
+            count = len(request.files.getlist('files'))
+
+        if count > Config.IMAGE_BATCH_TRANSFORM_MAX:
+            return jsonify({"error": f"At most {Config.IMAGE_BATCH_TRANSFORM_MAX} images per batch"}), 400
+
+        if request.is_json:
+            return f(*args, **kwargs)
+        return validate_image_upload(f)(*args, **kwargs)
+    return decorated_function
+
 def validate_tsne_input(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
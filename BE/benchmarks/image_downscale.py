@@ -0,0 +1,111 @@
+"""
+Compare the downscale modes used by ImageService.resize_image and the derivative cache.
+
+"quality" is the full-resolution decode + LANCZOS resize the service always used; "balanced"
+and "fast" decode JPEGs at a reduced scale and shrink by whole factors before resampling.
+Reports per-mode latency (p50/p95), peak RSS and PSNR against the "quality" output.
+Each mode runs in its own process so RSS numbers are not polluted by the others.
+
+Usage (from the BE directory):
+    python -m benchmarks.image_downscale --size 256 --repeat 5
+    python -m benchmarks.image_downscale --image photo.jpg --size 320
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _synthetic_jpeg(path, width, height):
+    """Write a large photo-like JPEG: smooth gradients plus fine detail."""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rng = np.random.default_rng(0)
+    pixels = np.stack([
+        127 + 100 * np.sin(x / 97) * np.cos(y / 131),
+        127 + 100 * np.sin((x + y) / 211),
+        127 + 100 * np.cos(x / 53 - y / 71),
+    ], axis=-1) + rng.normal(0, 12, (height, width, 3))
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, quality=92)
+
+
+def _run_mode(mode, image_path, size, repeat, queue):
+    """Thumbnail image_path in one downscale mode, the way ImageService.resize_image does."""
+    from app.services.image_service import ImageService
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with Image.open(image_path) as img:
+            target = (size, max(1, round(img.height * size / img.width)))
+            ImageService.draft(img, target, mode)
+            thumbnail = ImageService.resample(img, target, mode=mode)
+        latencies.append(time.perf_counter() - start)
+
+    output = io.BytesIO()
+    np.save(output, np.asarray(thumbnail.convert('RGB')))
+    queue.put({
+        "mode": mode,
+        "size": list(thumbnail.size),
+        "latency_p50_ms": statistics.median(latencies) * 1000,
+        "latency_p95_ms": _percentile(latencies, 95) * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "pixels": output.getvalue(),
+    })
+
+
+def _psnr(candidate, reference):
+    error = np.mean((candidate.astype(np.float64) - reference.astype(np.float64)) ** 2)
+    return float('inf') if error == 0 else 10 * np.log10(255 ** 2 / error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Source image (default: a generated 6000x4000 JPEG).")
+    parser.add_argument("--size", type=int, default=256, help="Thumbnail width.")
+    parser.add_argument("--modes", nargs="+", default=["quality", "balanced", "fast"])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = args.image
+        if image_path is None:
+            # Generated in a child process, so this process's peak RSS stays small (children inherit it).
+            image_path = os.path.join(tmp_dir, "source.jpg")
+            process = context.Process(target=_synthetic_jpeg, args=(image_path, 6000, 4000))
+            process.start()
+            process.join()
+
+        modes = args.modes if args.modes[0] == "quality" else ["quality"] + args.modes
+        results = []
+        for mode in dict.fromkeys(modes):
+            queue = context.Queue()
+            process = context.Process(target=_run_mode, args=(mode, image_path, args.size, args.repeat, queue))
+            process.start()
+            results.append(queue.get())
+            process.join()
+
+    baseline = np.load(io.BytesIO(results[0]["pixels"]))
+    for result in results:
+        pixels = np.load(io.BytesIO(result.pop("pixels")))
+        result["psnr_db_vs_quality"] = _psnr(pixels, baseline) if pixels.shape == baseline.shape else None
+        result["speedup_vs_quality"] = results[0]["latency_p50_ms"] / result["latency_p50_ms"]
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
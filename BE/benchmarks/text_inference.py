@@ -0,0 +1,134 @@
+"""
+Compare the CPU inference backends used by TextService against the fp32 baseline.
+
+Reports per-backend latency (p50/p95), throughput, peak RSS and output agreement
+(category match rate and summary unigram F1 against the "pytorch" backend).
+Each backend runs in its own process so RSS numbers are not polluted by the others.
+
+Usage (from the BE directory):
+    python -m benchmarks.text_inference --backends pytorch quantized onnx --repeat 3
+"""
+import argparse
+import json
+import multiprocessing
+import queue as queue_module
+import resource
+import statistics
+import time
+
+SAMPLE_TEXTS = [
+    (
+        "The central bank raised interest rates by half a percentage point on Wednesday, "
+        "its largest increase in two decades, as policymakers tried to cool inflation that "
+        "has climbed to the highest level in forty years. Officials signalled that further "
+        "increases are likely in the coming months, and markets reacted with a sharp sell-off "
+        "in technology shares while bond yields rose across maturities. Analysts said the "
+        "decision reflected growing concern that higher prices were becoming entrenched."
+    ),
+    (
+        "Researchers have developed a new battery chemistry that could double the range of "
+        "electric vehicles while relying on abundant materials. The team replaced cobalt in "
+        "the cathode with a manganese-rich compound and used a solid electrolyte to prevent "
+        "dendrite formation. Early prototypes retained more than ninety percent of their "
+        "capacity after a thousand charge cycles, and the group is now working with a "
+        "manufacturer to test the cells at commercial scale over the next two years."
+    ),
+    (
+        "The home side secured a dramatic late victory in the cup final on Saturday after "
+        "their substitute striker scored twice in the final ten minutes. The visitors had "
+        "dominated possession for most of the match and led through a first-half header, "
+        "but tired legs and a red card shortly after the hour changed the momentum. The win "
+        "gives the club its first major trophy in over a decade and a place in next season's "
+        "continental competition, which the manager called the reward for years of rebuilding."
+    ),
+]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _unigram_f1(candidate, reference):
+    candidate_tokens = set(candidate.lower().split())
+    reference_tokens = set(reference.lower().split())
+    if not candidate_tokens or not reference_tokens:
+        return 0.0
+    overlap = len(candidate_tokens & reference_tokens)
+    if not overlap:
+        return 0.0
+    precision = overlap / len(candidate_tokens)
+    recall = overlap / len(reference_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def _run_backend(backend, repeat, queue):
+    """Load TextService on one backend and time summarization + categorization."""
+    from app.services.text_service import TextService
+
+    load_start = time.perf_counter()
+    service = TextService(backend=backend)
+    load_seconds = time.perf_counter() - load_start
+
+    latencies, summaries, categories = [], [], []
+    for _ in range(repeat):
+        summaries, categories = [], []
+        for text in SAMPLE_TEXTS:
+            start = time.perf_counter()
+            summaries.append(service._generate_summary(text))
+            categories.append(service._categorize_text(text))
+            latencies.append(time.perf_counter() - start)
+
+    queue.put({
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "latency_p50_ms": statistics.median(latencies) * 1000,
+        "latency_p95_ms": _percentile(latencies, 95) * 1000,
+        "throughput_docs_per_s": len(latencies) / sum(latencies),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "summaries": summaries,
+        "categories": categories,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "quantized", "onnx"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    backends = args.backends if args.backends[0] == "pytorch" else ["pytorch"] + args.backends
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for backend in dict.fromkeys(backends):
+        queue = context.Queue()
+        process = context.Process(target=_run_backend, args=(backend, args.repeat, queue))
+        process.start()
+        while True:
+            try:
+                results.append(queue.get(timeout=5))
+                break
+            except queue_module.Empty:
+                if not process.is_alive():
+                    print(f"{backend}: failed (exit code {process.exitcode})")
+                    break
+        process.join()
+
+    if not results or results[0]["backend"] != "pytorch":
+        raise SystemExit("The fp32 baseline failed; nothing to compare against.")
+
+    baseline = results[0]
+    for result in results:
+        result["category_agreement"] = sum(
+            a == b for a, b in zip(result["categories"], baseline["categories"])
+        ) / len(SAMPLE_TEXTS)
+        result["summary_unigram_f1"] = statistics.mean(
+            _unigram_f1(a, b) for a, b in zip(result["summaries"], baseline["summaries"])
+        )
+        del result["summaries"], result["categories"]
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,3 +7,118 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
+
+    # Text inference (CPU only): "pytorch" (fp32), "quantized" (dynamic int8) or "onnx"
+    TEXT_INFERENCE_BACKEND = os.getenv("TEXT_INFERENCE_BACKEND", "pytorch")
+    TEXT_SUMMARIZER_MODEL = os.getenv("TEXT_SUMMARIZER_MODEL", "facebook/bart-large-cnn")
+    TEXT_CLASSIFIER_MODEL = os.getenv("TEXT_CLASSIFIER_MODEL", "facebook/bart-large-mnli")
+    TORCH_INTRA_OP_THREADS = int(os.getenv("TORCH_INTRA_OP_THREADS", "0"))  # 0 = library default
+    TORCH_INTER_OP_THREADS = int(os.getenv("TORCH_INTER_OP_THREADS", "0"))
+    # Prefetched models (`flask models prefetch`); offline mode loads only verified local copies
+    TEXT_MODEL_DIR = os.getenv("TEXT_MODEL_DIR", os.path.join(os.getcwd(), "instance", "models"))
+    TEXT_MODELS_OFFLINE = os.getenv("TEXT_MODELS_OFFLINE", "false").lower() in ("1", "true", "yes")
+
+    # Text categorization: "zero-shot" (one NLI pass per label) or "embedding" (cached label embeddings)
+    TEXT_CATEGORIZER = os.getenv("TEXT_CATEGORIZER", "zero-shot")
+    TEXT_EMBEDDING_MODEL = os.getenv("TEXT_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    TEXT_CATEGORY_LABELS = [
+        label.strip() for label in os.getenv(
+            "TEXT_CATEGORY_LABELS",
+            "Technology,Science,Business,Politics,Entertainment,Sports,Health,Education,Environment"
+        ).split(",") if label.strip()
+    ]
+    TEXT_EMBEDDING_MIN_SIMILARITY = float(os.getenv("TEXT_EMBEDDING_MIN_SIMILARITY", "0.2"))
+    TEXT_CATEGORIZER_HEAD_PATH = os.getenv(
+        "TEXT_CATEGORIZER_HEAD_PATH", os.path.join(os.getcwd(), "instance", "text_categorizer_head.joblib")
+    )
+
+    # Analysis stages run concurrently on a shared, bounded thread pool
+    TEXT_ANALYSIS_WORKERS = int(os.getenv("TEXT_ANALYSIS_WORKERS", "4"))
+    TEXT_STAGE_TIMEOUT = float(os.getenv("TEXT_STAGE_TIMEOUT", "30"))  # seconds, per stage
+
+    # "local" loads the models in every web worker; "remote" uses the shared inference server
+    TEXT_INFERENCE_MODE = os.getenv("TEXT_INFERENCE_MODE", "local")
+    INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", "/tmp/text-inference.sock")  # path or host:port
+    # Requests are unpickled: the server refuses to run without a key, and to listen beyond
+    # loopback unless INFERENCE_SERVER_ALLOW_REMOTE is set
+    INFERENCE_SERVER_AUTHKEY = os.getenv("INFERENCE_SERVER_AUTHKEY", "")
+    INFERENCE_SERVER_ALLOW_REMOTE = os.getenv("INFERENCE_SERVER_ALLOW_REMOTE", "false").lower() in ("1", "true", "yes")
+    INFERENCE_SERVER_CONCURRENCY = int(os.getenv("INFERENCE_SERVER_CONCURRENCY", "2"))
+
+    # Bulk text import: rows are inserted in batches, then analyzed by background workers
+    TEXT_IMPORT_INSERT_BATCH = int(os.getenv("TEXT_IMPORT_INSERT_BATCH", "1000"))
+    TEXT_IMPORT_ANALYSIS_BATCH = int(os.getenv("TEXT_IMPORT_ANALYSIS_BATCH", "16"))
+    TEXT_IMPORT_WORKERS = int(os.getenv("TEXT_IMPORT_WORKERS", "2"))
+
+    # Near-duplicate detection (MinHash LSH): "off", "reuse" the duplicate's analysis, or "reject"
+    TEXT_DEDUP_MODE = os.getenv("TEXT_DEDUP_MODE", "off")
+    TEXT_DEDUP_THRESHOLD = float(os.getenv("TEXT_DEDUP_THRESHOLD", "0.85"))  # estimated Jaccard similarity
+
+    # Incremental topic clustering of stored documents
+    TEXT_CLUSTER_COUNT = int(os.getenv("TEXT_CLUSTER_COUNT", "20"))
+    TEXT_CLUSTER_REFIT_EVERY = int(os.getenv("TEXT_CLUSTER_REFIT_EVERY", "500"))  # new documents between refits
+    TEXT_CLUSTER_FIT_SAMPLE = int(os.getenv("TEXT_CLUSTER_FIT_SAMPLE", "20000"))
+    TEXT_CLUSTER_MODEL_PATH = os.getenv(
+        "TEXT_CLUSTER_MODEL_PATH", os.path.join(os.getcwd(), "instance", "text_clusters.joblib")
+    )
+
+    # Model tiers selectable per request with mode=fast|balanced|quality|auto; only enabled tiers are loaded
+    TEXT_MODEL_TIERS = {
+        "fast": {
+            "summarization": os.getenv("TEXT_FAST_SUMMARIZER_MODEL", "sshleifer/distilbart-cnn-6-6"),
+            "zero-shot-classification": os.getenv("TEXT_FAST_CLASSIFIER_MODEL", "typeform/distilbert-base-uncased-mnli"),
+        },
+        "balanced": {
+            "summarization": os.getenv("TEXT_BALANCED_SUMMARIZER_MODEL", "sshleifer/distilbart-cnn-12-6"),
+            "zero-shot-classification": os.getenv("TEXT_BALANCED_CLASSIFIER_MODEL", "valhalla/distilbart-mnli-12-3"),
+        },
+        "quality": {
+            "summarization": TEXT_SUMMARIZER_MODEL,
+            "zero-shot-classification": TEXT_CLASSIFIER_MODEL,
+        },
+    }
+    TEXT_ENABLED_TIERS = [tier.strip() for tier in os.getenv("TEXT_ENABLED_TIERS", "quality").split(",") if tier.strip()]
+    TEXT_DEFAULT_TIER = os.getenv("TEXT_DEFAULT_TIER", "quality")
+    TEXT_AUTO_FAST_WORDS = int(os.getenv("TEXT_AUTO_FAST_WORDS", "800"))  # mode=auto sends longer texts to the fastest tier
+
+    # Image processing
+    IMAGE_BATCH_WORKERS = int(os.getenv("IMAGE_BATCH_WORKERS", str(os.cpu_count() or 4)))  # parallel batch uploads
+    IMAGE_PERSIST_WORKERS = int(os.getenv("IMAGE_PERSIST_WORKERS", "2"))  # background writes of uploads and masks
+    IMAGE_BATCH_TRANSFORM_MAX = int(os.getenv("IMAGE_BATCH_TRANSFORM_MAX", "1000"))  # images per /batch-transform request
+    # Images above this many pixels get their histogram and mask computed in strips of rows, using
+    # about IMAGE_TILE_BYTES of working memory per strip; uncompressed BMP / TIFF are memory-mapped
+    IMAGE_TILED_PIXELS = int(os.getenv("IMAGE_TILED_PIXELS", str(16_000_000)))
+    IMAGE_TILE_BYTES = int(os.getenv("IMAGE_TILE_BYTES", str(64 * 1024 ** 2)))
+    # Disk quota of the upload directory: above it, least recently used masks and resized /
+    # converted copies are evicted by a background collector (0: no quota)
+    IMAGE_STORAGE_QUOTA_BYTES = int(os.getenv("IMAGE_STORAGE_QUOTA_BYTES", "0"))
+    IMAGE_GC_INTERVAL = int(os.getenv("IMAGE_GC_INTERVAL", "600"))  # seconds between collections, 0: off
+    IMAGE_GC_TEMP_MAX_AGE = int(os.getenv("IMAGE_GC_TEMP_MAX_AGE", "3600"))  # abandoned temporary files
+    # Derivatives served by /api/images/view/<name>?w=&h=&fit=&format=&quality=
+    IMAGE_DERIVATIVE_CACHE_DIR = os.getenv(
+        "IMAGE_DERIVATIVE_CACHE_DIR", os.path.join(os.getcwd(), "instance", "image_derivatives")
+    )
+    IMAGE_DERIVATIVE_CACHE_BYTES = int(os.getenv("IMAGE_DERIVATIVE_CACHE_BYTES", str(1024 ** 3)))  # LRU-evicted above this
+    IMAGE_DERIVATIVE_MAX_DIMENSION = int(os.getenv("IMAGE_DERIVATIVE_MAX_DIMENSION", "4096"))
+    IMAGE_DOWNSCALE_MODE = os.getenv("IMAGE_DOWNSCALE_MODE", "balanced")  # fast, balanced or quality
+    # Encoder profiles of resized / converted images and derivatives (encoded once, then cached)
+    IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+    IMAGE_JPEG_PROGRESSIVE = os.getenv("IMAGE_JPEG_PROGRESSIVE", "true").lower() in ("1", "true", "yes")
+    IMAGE_PNG_COMPRESS_LEVEL = int(os.getenv("IMAGE_PNG_COMPRESS_LEVEL", "9"))
+    IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+    IMAGE_WEBP_METHOD = int(os.getenv("IMAGE_WEBP_METHOD", "6"))  # 0 (fast) - 6 (smallest)
+    IMAGE_WEBP_LOSSLESS = os.getenv("IMAGE_WEBP_LOSSLESS", "auto").lower()  # true, false, or auto: for lossless sources
+    # Serve WebP from /view to clients whose Accept header lists image/webp
+    IMAGE_NEGOTIATE_WEBP = os.getenv("IMAGE_NEGOTIATE_WEBP", "true").lower() in ("1", "true", "yes")
+    # Segmentation masks are computed on first request; set a method (simple, adaptive or otsu)
+    # to also compute one for every new upload
+    IMAGE_EAGER_MASK = os.getenv("IMAGE_EAGER_MASK", "")
+    IMAGE_MASK_MAX_DIMENSION = int(os.getenv("IMAGE_MASK_MAX_DIMENSION", "0"))  # default /mask resolution, 0: full
+    IMAGE_SIMILAR_MAX_DISTANCE = int(os.getenv("IMAGE_SIMILAR_MAX_DISTANCE", "7"))  # default hash Hamming radius of /similar (up to 7: 1 bit per chunk probed)
+    # Stored images and derivatives have immutable names and are cached by clients for this long
+    IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+    # "off" (Flask streams files), "x-sendfile" (Apache/lighttpd) or "x-accel" (nginx internal redirect)
+    IMAGE_SENDFILE_MODE = os.getenv("IMAGE_SENDFILE_MODE", "off")
+    USE_X_SENDFILE = IMAGE_SENDFILE_MODE == "x-sendfile"  # Flask setting, only affects files sent by path
+    IMAGE_SENDFILE_ROOT = os.getenv("IMAGE_SENDFILE_ROOT", os.getcwd())  # mapped to the nginx internal location
+    IMAGE_ACCEL_REDIRECT_PREFIX = os.getenv("IMAGE_ACCEL_REDIRECT_PREFIX", "/internal/")
@@ -0,0 +1,35 @@
+import os
+import sys
+
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ.setdefault("IMAGE_GC_INTERVAL", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from app import create_app, db
+from app.services.image_service import ImageService
+from config import Config
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def upload_folder(tmp_path, monkeypatch):
+    """Store images and derivatives under a temporary directory."""
+    monkeypatch.setattr(ImageService, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setattr(Config, "IMAGE_DERIVATIVE_CACHE_DIR", str(tmp_path / "derivatives"))
+    return tmp_path / "uploads"
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import numpy as np
+from app import db
+from app.controllers import text_controller
+from app.models.text import TextDocument
+from app.services.categorizer_training_service import CategorizerTrainingService
+from app.services.category_classifier import EmbeddingCategorizer
+
+
+class CountingEmbedder:
+    """Embeds a text as (number of a's, number of b's) and records the batch sizes."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts, truncation=True):
+        self.batches.append(len(texts))
+        return [[[[float(text.count("a")), float(text.count("b"))]]] for text in texts]
+
+
+def trained(tmp_path, embedder=None):
+    categorizer = EmbeddingCategorizer(
+        embedder or CountingEmbedder(), head_path=str(tmp_path / "head.joblib"), model_name="m"
+    )
+    categorizer.fit(["aaaa", "aaab", "aaa", "bbbb", "abbb", "bbb"], ["A", "A", "A", "B", "B", "B"])
+    return categorizer
+
+
+def test_fit_embeds_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(EmbeddingCategorizer, "EMBED_BATCH_SIZE", 4)
+    embedder = CountingEmbedder()
+
+    trained(tmp_path, embedder)
+
+    assert embedder.batches == [4, 2]
+
+
+def test_head_only_predicts_configured_labels(tmp_path):
+    categorizer = trained(tmp_path)
+
+    assert categorizer.predict_batch(["aaaa", "bbbb"], ["A", "B"]) == ["A", "B"]
+    assert categorizer.predict_batch(["aaaa", "bbbb"], ["B"])[0] != "A"
+    assert categorizer.head_info["categories"] == ["A", "B"]
+
+
+def test_unreadable_head_falls_back_to_label_similarity(tmp_path):
+    (tmp_path / "head.joblib").write_bytes(b"not a joblib file")
+    categorizer = EmbeddingCategorizer(CountingEmbedder(), head_path=str(tmp_path / "head.joblib"), model_name="m")
+    categorizer._label_embeddings[("A", "B")] = np.array([[1.0, 0.0], [0.0, 1.0]])
+
+    assert not categorizer.is_trained
+    assert categorizer.predict_batch(["aaaa", "bbbb"], ["A", "B"]) == ["A", "B"]
+
+
+def test_train_starts_a_background_job_on_configured_labels(client, tmp_path, monkeypatch):
+    service = SimpleNamespace(
+        embedding_categorizer=EmbeddingCategorizer(CountingEmbedder(), head_path=str(tmp_path / "head.joblib")),
+        category_labels=["A", "B"],
+        train_categorizer=lambda texts, categories: service.embedding_categorizer.fit(texts, categories)
+    )
+    monkeypatch.setattr(text_controller, "get_text_service", lambda: service)
+    started = []
+    monkeypatch.setattr(CategorizerTrainingService, "start", lambda app, svc, limit: started.append(limit) or True)
+    db.session.add_all([TextDocument(content="aaaa", title="t", category="A"),
+                        TextDocument(content="bbbb", title="t", category="Other")])
+    db.session.commit()
+
+    assert client.post("/api/text/categorizer/train", json={}).status_code == 400
+
+    db.session.add(TextDocument(content="abbb", title="t", category="B"))
+    db.session.commit()
+    response = client.post("/api/text/categorizer/train", json={"limit": 10})
+
+    assert response.status_code == 202
+    assert started == [10]
+    assert CategorizerTrainingService.train(service, 10) == 2
+    assert service.embedding_categorizer.head_info["documents"] == 2
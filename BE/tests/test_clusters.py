@@ -0,0 +1,49 @@
+import pytest
+from app import db
+from app.models.text import TextCluster, TextDocument
+from app.services.cluster_service import ClusterService
+from config import Config
+
+
+@pytest.fixture
+def cluster_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "TEXT_CLUSTER_MODEL_PATH", str(tmp_path / "clusters.joblib"))
+    monkeypatch.setattr(Config, "TEXT_CLUSTER_COUNT", 2)
+    monkeypatch.setattr(Config, "TEXT_CLUSTER_REFIT_EVERY", 50)
+    monkeypatch.setattr(ClusterService, "_model_mtime", None)
+
+
+def add(*contents):
+    db.session.add_all([TextDocument(content=content, title="t") for content in contents])
+    db.session.commit()
+
+
+def test_refit_with_too_few_documents_waits_for_more(app, cluster_config):
+    add("cats purr and sleep")
+
+    assert ClusterService.refit() == 0
+    model = ClusterService._load_model()
+    assert model["kmeans"] is None
+    assert not ClusterService._refit_due(model)
+    assert ClusterService.model_info() == {"fitted_at": None, "clusters": 0}
+
+    add("stock markets fell today")
+    assert ClusterService._refit_due(model)
+    assert ClusterService.refit() == 2
+
+
+def test_sizes_are_recounted_after_the_swap(app, cluster_config):
+    add("cats purr and sleep", "kittens purr", "stock markets fell", "markets rallied on earnings")
+    ClusterService.refit()
+    # A document assigned while the rows were being replaced, whose size adjustment was lost.
+    db.session.add(TextDocument(content="cats sleep", title="t", cluster_id=0))
+    db.session.commit()
+
+    ClusterService.recount_sizes()
+
+    sizes = {cluster.id: cluster.size for cluster in TextCluster.query}
+    counts = dict(db.session.query(TextDocument.cluster_id, db.func.count(TextDocument.id)).group_by(
+        TextDocument.cluster_id
+    ).all())
+    assert sizes == {cluster_id: counts.get(cluster_id, 0) for cluster_id in (0, 1)}
+    assert sum(sizes.values()) == 5
@@ -0,0 +1,51 @@
+import numpy as np
+from app import db
+from app.models.text import TextDocument
+from app.services.dedup_service import DedupService
+
+
+def words(start, stop):
+    return " ".join(f"word{i}" for i in range(start, stop))
+
+
+def indexed(content, status="done"):
+    doc = TextDocument(content=content, title="t", analysis_status=status)
+    db.session.add(doc)
+    db.session.flush()
+    DedupService.index_document(doc, DedupService.signature(content))
+    db.session.commit()
+    return doc
+
+
+def test_signature_is_stable_and_estimates_jaccard_similarity():
+    signature = DedupService.signature(words(0, 100))
+
+    assert signature.dtype == np.uint32 and signature.shape == (DedupService.NUM_PERM,)
+    assert np.array_equal(signature, DedupService.signature(words(0, 100).upper() + "!"))
+    # 5-word shingles: 86 shared out of 106 distinct (Jaccard ~0.81), and 36 out of 156 (~0.23).
+    assert abs(DedupService.similarity(signature, DedupService.signature(words(10, 110))) - 86 / 106) < 0.12
+    assert abs(DedupService.similarity(signature, DedupService.signature(words(60, 160))) - 36 / 156) < 0.12
+
+
+def test_short_texts_are_one_shingle():
+    assert DedupService.similarity(DedupService.signature("Hello there"), DedupService.signature("hello, there")) == 1.0
+
+
+def test_find_duplicate_respects_the_threshold(app):
+    original = indexed(words(0, 100))
+    near = DedupService.signature(words(10, 110))
+    similarity = DedupService.similarity(near, DedupService.signature(words(0, 100)))
+
+    assert DedupService.find_duplicate(near, threshold=0.7) == (original, similarity)
+    assert DedupService.find_duplicate(near, threshold=similarity) == (original, similarity)
+    assert DedupService.find_duplicate(near, threshold=similarity + 0.01) == (None, 0.0)
+    assert DedupService.find_duplicate(near, threshold=0.7, exclude_id=original.id) == (None, 0.0)
+
+
+def test_dissimilar_and_unanalyzed_documents_are_not_duplicates(app):
+    indexed(words(0, 100), status="pending")
+    indexed(words(200, 300))
+
+    assert DedupService.find_duplicate(DedupService.signature(words(0, 100)), threshold=0.0) == (None, 0.0)
+    # Jaccard ~0.41: far below the ~0.7 where documents start sharing an LSH band.
+    assert DedupService.find_duplicate(DedupService.signature(words(240, 340)), threshold=0.0) == (None, 0.0)
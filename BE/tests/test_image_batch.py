@@ -0,0 +1,54 @@
+import io
+import json
+import zipfile
+
+from tests.test_image_documents import png_bytes, upload
+
+
+def archive(response):
+    assert response.status_code == 200
+    assert response.mimetype == "application/zip"
+    return zipfile.ZipFile(io.BytesIO(response.get_data()))
+
+
+def test_stored_batch_reports_missing_images_in_the_manifest(client, upload_folder):
+    first = upload(client, png_bytes(0), "first.png")
+    second = upload(client, png_bytes(1), "second.png")
+
+    response = client.post("/api/images/batch-transform", json={
+        "images": [first["id"], 999999, second["filename"]], "w": 32, "format": "jpeg", "mask": "simple"
+    })
+
+    with archive(response) as zip_file:
+        manifest = json.loads(zip_file.read("manifest.json"))
+        assert sorted(zip_file.namelist()) == [
+            "first.jpg", "first_mask.png", "manifest.json", "second.jpg", "second_mask.png"
+        ]
+        assert zip_file.testzip() is None
+    assert (manifest["succeeded"], manifest["failed"]) == (2, 1)
+    assert manifest["options"] == {"w": 32, "format": "jpeg", "mask": "simple"}
+    assert [result["source"] for result in manifest["results"]] == [first["id"], 999999, second["filename"]]
+    assert manifest["results"][1] == {"source": 999999, "error": "Image not found"}
+    assert manifest["results"][0]["output"] == "first.jpg"
+    assert (manifest["results"][0]["width"], manifest["results"][0]["height"]) == (32, 24)
+
+
+def test_uploaded_batch_streams_and_keeps_going_after_a_failure(client, upload_folder):
+    response = client.post("/api/images/batch-transform", data={
+        "format": "png",
+        "files": [
+            (io.BytesIO(png_bytes(0)), "a.png"),
+            (io.BytesIO(b"not an image"), "broken.png"),
+            (io.BytesIO(png_bytes(1)), "a.png"),
+        ]
+    }, content_type="multipart/form-data", buffered=False)
+
+    chunks = [chunk for chunk in response.response if chunk]
+    assert len(chunks) > 1  # Streamed as images finish, not built up front.
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zip_file:
+        manifest = json.loads(zip_file.read("manifest.json"))
+        outputs = [result.get("output") for result in manifest["results"]]
+        assert sorted(zip_file.namelist()) == sorted(["manifest.json"] + [name for name in outputs if name])
+    assert (manifest["succeeded"], manifest["failed"]) == (2, 1)
+    assert manifest["results"][1] == {"source": "broken.png", "error": "Could not decode image"}
+    assert outputs[0] != outputs[2]  # Same file name, distinct entries.
@@ -0,0 +1,55 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+from app.models.image import ImageDocument
+from app.services.image_service import ImageService
+
+
+def png_bytes(seed=0, size=(48, 64)):
+    pixels = np.random.default_rng(seed).integers(0, 256, size + (3,), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def upload(client, data, name="image.png", **form):
+    response = client.post(
+        "/api/images/upload", data=dict(form, files=[(io.BytesIO(data), name)]),
+        content_type="multipart/form-data"
+    )
+    result = response.get_json()["results"][0]
+    ImageService.wait_for_write(ImageService.storage_path(result["filename"]))
+    if result.get("segmentation_mask"):
+        ImageService.wait_for_write(ImageService.storage_path(result["segmentation_mask"]))
+    return result
+
+
+def test_derivatives_are_not_recorded_as_images(client, upload_folder):
+    result = upload(client, png_bytes(), mask="simple")
+    mask_name = result["segmentation_mask"]
+    assert os.path.isfile(ImageService.storage_path(mask_name))
+
+    assert client.get(f"/api/images/{mask_name}").status_code == 404
+    assert client.delete(f"/api/images/{mask_name}").status_code == 404
+    assert os.path.isfile(ImageService.storage_path(mask_name))
+    assert ImageDocument.query.count() == 1
+    assert [image["filename"] for image in client.get("/api/images").get_json()] == [result["filename"]]
+
+
+def test_record_files_records_unrecorded_originals_only(app, client, upload_folder):
+    upload(client, png_bytes(), mask="simple")
+    path = ImageService.storage_path("legacy.png")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(png_bytes(1))
+    assert client.get("/api/images/legacy.png").status_code == 404
+
+    result = app.test_cli_runner().invoke(args=["images", "record-files", "--batch-size", "1"])
+
+    assert result.output == "Recorded 1 images (0 failed)\n"
+    response = client.get("/api/images/legacy.png")
+    assert response.status_code == 200
+    assert response.get_json()["dimensions"] == {"height": 48, "width": 64}
+    assert ImageDocument.query.count() == 2
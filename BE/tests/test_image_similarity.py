@@ -0,0 +1,63 @@
+from math import comb
+
+import numpy as np
+from app import db
+from app.models.image import ImageDocument, ImageHashBand
+from app.services.image_similarity_service import ImageSimilarityService
+
+BASE_HASH = 0x0123456789ABCDEF
+SIGNATURE = np.full(3 * ImageSimilarityService.COLOR_BINS, 1 / ImageSimilarityService.COLOR_BINS, dtype=np.float32)
+
+
+def flipped(value, flips_per_chunk):
+    """Flip the lowest n bits of each 16-bit chunk, n given per chunk."""
+    for chunk, flips in enumerate(flips_per_chunk):
+        for bit in range(flips):
+            value ^= 1 << (chunk * ImageSimilarityService.CHUNK_BITS + bit)
+    return value
+
+
+def indexed(dhash, name):
+    document = ImageDocument(
+        original_filename=name, unique_filename=name, file_path=name, file_extension="png", file_size=1,
+        dhash=dhash, color_signature=SIGNATURE.tobytes()
+    )
+    db.session.add(document)
+    db.session.flush()
+    db.session.add_all([ImageHashBand(bucket=bucket, image_id=document.id) for bucket in ImageSimilarityService.buckets(dhash)])
+    db.session.commit()
+    return document
+
+
+def found(query, **kwargs):
+    return {document.unique_filename: distance for document, distance, _ in ImageSimilarityService.find_similar(query, **kwargs)}
+
+
+def test_buckets_probe_every_chunk_value_within_the_radius():
+    for radius in range(3):
+        buckets = ImageSimilarityService.buckets(BASE_HASH, radius)
+        assert len(set(buckets)) == len(buckets) == 4 * sum(comb(16, d) for d in range(radius + 1))
+    assert ImageSimilarityService.buckets(flipped(BASE_HASH, [1, 0, 0, 0]))[1:] == ImageSimilarityService.buckets(BASE_HASH)[1:]
+
+
+def test_find_similar_at_the_exact_radius(app):
+    query = indexed(BASE_HASH, "query")
+    indexed(flipped(BASE_HASH, [2, 2, 2, 2]), "at-radius")  # Every chunk exactly 2 bits away.
+    indexed(flipped(BASE_HASH, [3, 2, 2, 2]), "beyond")
+    indexed(flipped(BASE_HASH, [3, 3, 3, 3]), "unprobed")
+
+    assert found(query, max_distance=8) == {"at-radius": 8}
+    assert found(query, max_distance=9) == {"at-radius": 8, "beyond": 9}
+    assert found(query, max_distance=7) == {}
+
+
+def test_candidates_matching_more_chunks_are_kept_first(app, monkeypatch):
+    query = indexed(BASE_HASH, "query")
+    for weak in ([0, 9, 9, 9], [9, 0, 9, 9]):
+        indexed(flipped(BASE_HASH, weak), f"one-chunk-{weak.index(0)}")
+    indexed(flipped(BASE_HASH, [0, 0, 0, 1]), "all-chunks")
+    for weak in ([9, 9, 0, 9], [9, 9, 9, 0]):
+        indexed(flipped(BASE_HASH, weak), f"one-chunk-{weak.index(0)}")
+    monkeypatch.setattr(ImageSimilarityService, "MAX_CANDIDATES", 1)
+
+    assert found(query, max_distance=12) == {"all-chunks": 1}
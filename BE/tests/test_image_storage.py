@@ -0,0 +1,81 @@
+import os
+
+from app import db
+from app.models.image import ImageDocument
+from app.services.image_service import ImageService
+from app.services.image_storage_service import ImageStorageService
+from config import Config
+from tests.test_image_documents import png_bytes, upload
+
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    ImageService.log_usage("W", path)
+
+
+def test_collect_evicts_least_recently_used_derivatives_from_the_journal(upload_folder, monkeypatch):
+    monkeypatch.setattr(ImageStorageService, "_full_scan_due", True)
+    original = ImageService.storage_path("abcd.png")
+    write(original, 100)
+    assert ImageStorageService.collect(quota=0)["full_scan"]
+
+    old, recent = ImageService.storage_path("abcd_mask_simple.png"), ImageService.storage_path("abcd_resized_1.png")
+    write(old, 100)
+    write(recent, 100)
+    ImageStorageService.record_access(recent)
+    ImageStorageService.record_access(original)  # Originals are not journaled on access.
+
+    def walk():
+        raise AssertionError("the directory was walked")
+
+    monkeypatch.setattr(ImageStorageService, "_entries", staticmethod(walk))
+    report = ImageStorageService.collect(quota=250)
+
+    assert not report["full_scan"]
+    assert (report["usage_bytes"], report["reclaimed_derivative_bytes"]) == (200, 100)
+    assert not os.path.exists(old) and os.path.exists(recent)
+    assert ImageStorageService.collect(quota=250)["usage_bytes"] == 200
+
+
+def test_collector_starts_with_the_first_request_only(app, client, monkeypatch):
+    monkeypatch.setattr(Config, "IMAGE_GC_INTERVAL", 3600)
+    monkeypatch.setattr(ImageStorageService, "_collector", None)
+    started = []
+    monkeypatch.setattr(ImageStorageService, "start_collector", lambda: started.append(True))
+
+    app.test_cli_runner().invoke(args=["images", "--help"])
+    assert started == []
+
+    client.get("/api/images/storage/metrics")
+    assert started == [True]
+
+
+def test_migrate_layout_commits_before_removing_flat_files(app, client, upload_folder, monkeypatch):
+    result = upload(client, png_bytes(), mask="simple")
+    document = db.session.get(ImageDocument, result["id"])
+    sharded = document.file_path
+    flat = os.path.join(str(upload_folder), result["filename"])
+    os.replace(sharded, flat)
+    os.replace(ImageService.storage_path(result["segmentation_mask"]),
+               os.path.join(str(upload_folder), result["segmentation_mask"]))
+    document.file_path = flat
+    db.session.commit()
+
+    unlinked = []
+    commit = db.session.commit
+
+    def checked_commit():
+        assert os.path.exists(flat), "a file was removed before its row was committed"
+        commit()
+
+    monkeypatch.setattr(db.session, "commit", checked_commit)
+    monkeypatch.setattr(ImageStorageService, "_unlink", staticmethod(lambda path: unlinked.append(path) or os.remove(path)))
+    counts = ImageStorageService.migrate_layout()
+
+    assert counts == {"images": 1, "files": 2, "conflicts": 0}
+    assert sorted(os.path.basename(path) for path in unlinked) == sorted([result["filename"], result["segmentation_mask"]])
+    assert db.session.get(ImageDocument, result["id"]).file_path == sharded
+    assert os.path.isfile(sharded) and not os.path.exists(flat)
+    assert client.get(f"/api/images/{result['id']}/mask").status_code == 200
@@ -0,0 +1,107 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from app.services.image_service import ImageService
+from config import Config
+
+HEIGHT, WIDTH = 50, 40
+
+
+@pytest.fixture
+def pixels():
+    """A BGR image with smooth regions (so masks are not all noise) and some noise."""
+    rng = np.random.default_rng(0)
+    rows, columns = np.mgrid[0:HEIGHT, 0:WIDTH]
+    base = np.stack([rows * 5, columns * 6, (rows + columns) * 3], axis=2)
+    return np.clip(base + rng.integers(-20, 20, base.shape), 0, 255).astype(np.uint8)
+
+
+def stripped(monkeypatch, rows_per_strip=7):
+    """Process every raster in strips of `rows_per_strip` rows."""
+    monkeypatch.setattr(Config, "IMAGE_TILED_PIXELS", 100)
+    monkeypatch.setattr(Config, "IMAGE_TILE_BYTES", WIDTH * 32 * rows_per_strip)
+
+
+def mask_pixels(img, tmp_path, method, name):
+    path = str(tmp_path / f"{name}.png")
+    ImageService.write_segmentation_mask(img, path, ".png", method)
+    return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+
+def memmapped(array):
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array is not None
+
+
+def test_strips_cover_every_row_once(monkeypatch):
+    stripped(monkeypatch)
+
+    strips = list(ImageService.strips(HEIGHT, WIDTH))
+
+    assert strips[0] == (0, 7) and strips[-1] == (49, 50)
+    assert all(bottom == top for (_, bottom), (top, _) in zip(strips, strips[1:]))
+
+
+@pytest.mark.parametrize("method", ["simple", "adaptive", "otsu"])
+def test_strip_masks_equal_whole_image_masks(pixels, tmp_path, monkeypatch, method):
+    whole = mask_pixels(pixels, tmp_path, method, "whole")
+    stripped(monkeypatch)
+
+    assert np.array_equal(mask_pixels(pixels, tmp_path, method, "strips"), whole)
+
+
+def test_strip_histogram_and_otsu_threshold_equal_whole_image(pixels, monkeypatch):
+    whole = ImageService.compute_color_histogram(pixels)
+    threshold, _ = cv2.threshold(cv2.cvtColor(pixels, cv2.COLOR_BGR2GRAY), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    stripped(monkeypatch)
+
+    assert ImageService.compute_color_histogram(pixels) == whole
+    assert ImageService.otsu_threshold(pixels) == threshold
+
+
+def test_strip_thumbnail_matches_area_resize(pixels, monkeypatch):
+    whole = ImageService.gray_thumbnail(pixels, (8, 10))
+    stripped(monkeypatch)
+
+    assert np.abs(ImageService.gray_thumbnail(pixels, (8, 10)).astype(int) - whole).max() <= 1
+
+
+@pytest.mark.parametrize("image_format, options", [("BMP", {}), ("TIFF", {"compression": None})])
+def test_uncompressed_files_are_memory_mapped(pixels, tmp_path, monkeypatch, image_format, options):
+    path = str(tmp_path / f"image.{image_format.lower()}")
+    Image.fromarray(pixels[..., ::-1]).save(path, image_format, **options)
+    stripped(monkeypatch)
+
+    view = ImageService.load_raster(path)
+
+    assert memmapped(view)
+    assert np.array_equal(view, pixels)
+    with open(path, "rb") as f:
+        assert np.array_equal(ImageService.load_raster(f.read()), pixels)
+
+
+def test_gray_tiff_maps_to_a_gray_view(pixels, tmp_path, monkeypatch):
+    gray = cv2.cvtColor(pixels, cv2.COLOR_BGR2GRAY)
+    path = str(tmp_path / "gray.tiff")
+    Image.fromarray(gray).save(path, "TIFF")
+    stripped(monkeypatch)
+
+    view = ImageService.load_raster(path)
+
+    assert memmapped(view) and view.ndim == 2
+    assert np.array_equal(view, gray)
+
+
+def test_compressed_files_are_decoded(pixels, monkeypatch):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels[..., ::-1]).save(buffer, "PNG")
+    stripped(monkeypatch)
+
+    img = ImageService.load_raster(buffer.getvalue())
+
+    assert not memmapped(img)
+    assert np.array_equal(img, pixels)
@@ -0,0 +1,65 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+from app.services.image_service import ImageService
+from config import Config
+
+
+def jpeg_bytes(size=(60, 80)):
+    pixels = np.random.default_rng(0).integers(0, 256, size + (3,), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def post(client, endpoint, **form):
+    response = client.post(
+        f"/api/images/{endpoint}", data=dict(form, image=(io.BytesIO(jpeg_bytes()), "photo.jpg")),
+        content_type="multipart/form-data"
+    )
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_resized_and_converted_names_follow_the_encoder_profile(client, upload_folder, monkeypatch):
+    resized = post(client, "resize", width="40")["resized_filename"]
+    converted = post(client, "convert", format="png")["converted_filename"]
+    path = ImageService.resolve_path(resized)
+    mtime = os.stat(path).st_mtime_ns
+
+    assert post(client, "resize", width="40")["resized_filename"] == resized
+    assert os.stat(path).st_mtime_ns == mtime  # Not written again.
+    assert Image.open(path).size == (40, 30)
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".tmp")]
+
+    monkeypatch.setattr(Config, "IMAGE_JPEG_QUALITY", 50)
+    monkeypatch.setattr(Config, "IMAGE_PNG_COMPRESS_LEVEL", 1)
+    assert post(client, "resize", width="40")["resized_filename"] != resized
+    assert post(client, "convert", format="png")["converted_filename"] != converted
+    assert os.path.isfile(path)
+
+
+def test_derivative_urls_are_revalidated(client, upload_folder, monkeypatch):
+    response = client.post(
+        "/api/images/upload", data={"files": [(io.BytesIO(jpeg_bytes()), "photo.jpg")]},
+        content_type="multipart/form-data"
+    )
+    filename = response.get_json()["results"][0]["filename"]
+    ImageService.wait_for_write(ImageService.storage_path(filename))
+
+    original = client.get(f"/api/images/view/{filename}", headers={"Accept": "image/jpeg"})
+    assert original.cache_control.immutable
+
+    derivative = client.get(f"/api/images/view/{filename}?w=20&format=png")
+    assert derivative.status_code == 200
+    assert derivative.cache_control.no_cache and not derivative.cache_control.immutable
+    assert client.get(
+        f"/api/images/view/{filename}?w=20&format=png", headers={"If-None-Match": derivative.headers["ETag"]}
+    ).status_code == 304
+
+    monkeypatch.setattr(Config, "IMAGE_PNG_COMPRESS_LEVEL", 1)
+    assert client.get(
+        f"/api/images/view/{filename}?w=20&format=png", headers={"If-None-Match": derivative.headers["ETag"]}
+    ).status_code == 200
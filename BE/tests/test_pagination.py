@@ -0,0 +1,71 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from app import db
+from app.models.text import TextDocument
+from app.utils.pagination import decode_cursor, encode_cursor, parse_limit
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 2, 29, 23, 59, 58, 123456)
+
+    cursor = encode_cursor(created_at, 42)
+
+    assert decode_cursor(cursor) == (created_at, 42)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b'{"id": 1}').decode(),
+    base64.urlsafe_b64encode(json.dumps(["2024-01-01T00:00:00"]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(["yesterday", 1]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(["2024-01-01T00:00:00", "one"]).encode()).decode(),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_parse_limit_clamps():
+    assert parse_limit(None) == 50
+    assert (parse_limit(0), parse_limit(500), parse_limit(20)) == (1, 200, 20)
+
+
+def pages(client, limit):
+    ids, cursor, requests = [], None, 0
+    while True:
+        response = client.get("/api/text/documents", query_string={"fields": "id", "limit": limit, "cursor": cursor})
+        assert response.status_code == 200
+        ids += [document["id"] for document in response.get_json()]
+        requests += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return ids, requests
+
+
+def test_pages_split_ties_on_created_at_by_id(client):
+    tied = datetime(2024, 1, 1, 12, 0, 0)
+    db.session.add_all(
+        [TextDocument(content=f"tied {i}", title="t", created_at=tied) for i in range(7)]
+        + [TextDocument(content="newer", title="t", created_at=tied + timedelta(seconds=1)),
+           TextDocument(content="older", title="t", created_at=tied - timedelta(seconds=1))]
+    )
+    db.session.commit()
+    newer, *tied_ids, older = [
+        doc.id for doc in TextDocument.query.order_by(TextDocument.created_at.desc(), TextDocument.id.desc())
+    ]
+
+    ids, requests = pages(client, limit=3)
+
+    assert ids == [newer] + tied_ids + [older]
+    assert tied_ids == sorted(tied_ids, reverse=True)
+    assert requests == 3
+
+
+def test_invalid_cursor_is_a_bad_request(client):
+    response = client.get("/api/text/documents", query_string={"cursor": "garbage"})
+
+    assert response.status_code == 400
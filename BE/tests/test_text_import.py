@@ -0,0 +1,97 @@
+import io
+import json
+
+import pytest
+from app import db
+from app.controllers import text_controller
+from app.models.text import TextDocument, TextImportJob
+from app.services.text_import_service import TextImportService
+
+
+class SpooledUpload(io.RawIOBase):
+    """A binary stream without readable(), like SpooledTemporaryFile before Python 3.11."""
+
+    def __init__(self, data):
+        self._buffer = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+    def __getattribute__(self, name):
+        if name in ("readable", "readinto"):
+            raise AttributeError(name)
+        return super().__getattribute__(name)
+
+
+@pytest.fixture
+def started_jobs(monkeypatch):
+    """Ids of the jobs whose analysis was started (the analysis itself doesn't run)."""
+    started = []
+    monkeypatch.setattr(text_controller, "get_text_service", lambda: None)
+    monkeypatch.setattr(TextImportService, "start_analysis", lambda *args: started.append(args[1]))
+    return started
+
+
+def test_import_multipart_csv(client, started_jobs):
+    body = 'text,title\n"First, with a comma",One\nSecond document,\n,Empty\n'
+    response = client.post(
+        "/api/text/documents/import",
+        data={"file": (io.BytesIO(body.encode("utf-8")), "documents.csv")},
+        content_type="multipart/form-data"
+    )
+
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job["total"] == 2
+    assert job["skipped"] == 1
+    assert started_jobs == [job["id"]]
+    documents = TextDocument.query.filter_by(import_job_id=job["id"]).order_by(TextDocument.id).all()
+    assert [(doc.content, doc.title, doc.analysis_status) for doc in documents] == [
+        ("First, with a comma", "One", "pending"),
+        ("Second document", "Untitled", "pending"),
+    ]
+
+
+def test_iter_rows_without_readable_stream():
+    rows = list(TextImportService.iter_rows(SpooledUpload(b"text\nh\xc3\xa9llo\n"), "csv"))
+
+    assert rows == [("héllo", "Untitled")]
+
+
+def test_import_coerces_non_string_titles(client, started_jobs):
+    lines = [{"text": "Numbered", "title": 42}, {"text": "Listed", "title": ["a"]}]
+    response = client.post(
+        "/api/text/documents/import",
+        data="\n".join(json.dumps(line) for line in lines),
+        content_type="application/x-ndjson"
+    )
+
+    assert response.status_code == 202
+    assert [doc.title for doc in TextDocument.query.order_by(TextDocument.id)] == ["42", "['a']"]
+
+
+def test_fail_interrupted_jobs(app):
+    job = TextImportJob(filename="documents.csv", status="running", total=2)
+    done = TextImportJob(filename="done.csv", status="completed", total=0)
+    db.session.add_all([job, done])
+    db.session.commit()
+    db.session.add_all([
+        TextDocument(content="analyzed", title="a", analysis_status="done", import_job_id=job.id),
+        TextDocument(content="waiting", title="b", analysis_status="pending", import_job_id=job.id),
+    ])
+    db.session.commit()
+
+    assert TextImportService.fail_interrupted_jobs() == 1
+
+    assert (job.status, job.failed, job.error) == ("failed", 1, "Interrupted by a restart")
+    assert job.finished_at is not None
+    assert done.status == "completed"
+    assert sorted(doc.analysis_status for doc in TextDocument.query) == ["done", "failed"]
+
+
+@pytest.mark.parametrize("value", ["high", "nan", ""])
+def test_documents_reject_invalid_sentiment_bounds(client, value):
+    response = client.get("/api/text/documents", query_string={"min_sentiment": value})
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "'min_sentiment' must be a number"}
@@ -1,6 +1,8 @@
 import axios from "axios"
 
 const BASE_URL = "http://localhost:5000/api/text"
+const MAX_PAGE_SIZE = 200 // Largest page the API serves
+const LIST_FIELDS = "id,title,category,created_at"
 
 export interface Document {
   id: number
@@ -13,6 +15,15 @@ export interface Document {
   category?: string
 }
 
+export type DocumentSummary = Pick<Document, "id" | "title" | "category" | "created_at">
+
+export type DocumentText = Pick<Document, "id" | "title" | "content">
+
+export interface DocumentPage {
+  documents: DocumentSummary[]
+  nextCursor: string | null
+}
+
 export interface AnalysisResult {
   sentiment: string
   sentiment_score: number
@@ -25,18 +36,35 @@ export interface TSNEResult {
 }
 
 export const textAnalysisService = {
-  getDocuments: async (query = ""): Promise<Document[]> => {
+  // One page of the document list, newest first, without the documents' content.
+  getDocuments: async (query = "", cursor?: string): Promise<DocumentPage> => {
     try {
       const response = await axios.get(`${BASE_URL}/documents`, {
-        params: { search: query },
+        params: { search: query || undefined, fields: LIST_FIELDS, cursor },
       })
-      return response.data || []
+      return {
+        documents: response.data || [],
+        nextCursor: response.headers["x-next-cursor"] || null,
+      }
     } catch (error) {
       console.error("Error fetching documents:", error)
       throw error 
     }
   },
 
+  // Titles and content of the newest matching documents, for the t-SNE view.
+  getDocumentTexts: async (query = "", limit = MAX_PAGE_SIZE): Promise<DocumentText[]> => {
+    try {
+      const response = await axios.get(`${BASE_URL}/documents`, {
+        params: { search: query || undefined, fields: "id,title,content", limit: Math.min(limit, MAX_PAGE_SIZE) },
+      })
+      return response.data || []
+    } catch (error) {
+      console.error("Error fetching document texts:", error)
+      throw error
+    }
+  },
+
   getDocument: async (id: number): Promise<Document> => {
     try {
       const response = await axios.get(`${BASE_URL}/documents/${id}`)
@@ -291,7 +291,7 @@ export default function ImageProcessing() {
             <CardContent>
               {selectedUploadedImage ? (
                 <img
-                  src={`http://localhost:5000/api/images/view/${selectedUploadedImage.segmentationMask}`}
+                  src={`http://localhost:5000/api/images/${selectedUploadedImage.filename}/mask`}
                   alt="Masked"
                   className="max-w-full h-auto"
                 />
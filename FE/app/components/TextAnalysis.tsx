@@ -27,17 +27,22 @@ import {
 import {
   textAnalysisService,
   type Document,
+  type DocumentSummary,
   type TSNEResult,
 } from "../api/textAnalysisService";
 import { LoadingSpinner } from "@/components/ui/loading-spinner";
 import { toast } from "react-toastify";
 
 export default function TextAnalysis() {
-  const [documents, setDocuments] = useState<Document[]>([]);
+  const [documents, setDocuments] = useState<DocumentSummary[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [listedQuery, setListedQuery] = useState("");
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedDocument, setSelectedDocument] = useState<Document | null>(
     null
   );
   const [tsneResult, setTsneResult] = useState<TSNEResult | null>(null);
+  const [tsneTitles, setTsneTitles] = useState<string[]>([]);
   const [loading, setLoading] = useState(false);
   const [selectedDocumentLoading, setSelectedDocumentLoading] = useState(false);
   const [updateModalOpen, setUpdateModalOpen] = useState(false);
@@ -49,11 +54,14 @@ export default function TextAnalysis() {
   const fetchDocuments = useCallback(async () => {
     try {
       setLoading(true);
-      const fetchedDocuments = await textAnalysisService.getDocuments();
-      setDocuments(fetchedDocuments || []);
+      const page = await textAnalysisService.getDocuments();
+      setDocuments(page.documents);
+      setNextCursor(page.nextCursor);
+      setListedQuery("");
     } catch (error) {
       console.error("Error fetching documents:", error);
       setDocuments([]);
+      setNextCursor(null);
       toast.error("Failed to fetch documents. Please try again.");
     } finally {
       setLoading(false);
@@ -137,11 +145,29 @@ export default function TextAnalysis() {
     }
   };
 
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+
+    try {
+      setLoadingMore(true);
+      const page = await textAnalysisService.getDocuments(listedQuery, nextCursor);
+      setDocuments((listed) => [...listed, ...page.documents]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Error fetching documents:", error);
+      toast.error("Failed to fetch more documents. Please try again.");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleGenerateTSNE = async () => {
     try {
       setLoading(true);
-      const texts = documents.map((doc) => doc.content);
-      const result = await textAnalysisService.generateTSNE(texts);
+      // The list holds no content: fetch the texts of the listed documents (up to one full page).
+      const texts = await textAnalysisService.getDocumentTexts(listedQuery, documents.length);
+      const result = await textAnalysisService.generateTSNE(texts.map((doc) => doc.content));
+      setTsneTitles(texts.map((doc) => doc.title));
       setTsneResult(result);
       toast.success("T-SNE visualization generated successfully.");
     } catch (error) {
@@ -155,8 +181,10 @@ export default function TextAnalysis() {
   const handleSearch = async () => {
     try {
       setLoading(true);
-      const searchResults = await textAnalysisService.getDocuments(searchQuery);
-      setDocuments(searchResults);
+      const page = await textAnalysisService.getDocuments(searchQuery);
+      setDocuments(page.documents);
+      setNextCursor(page.nextCursor);
+      setListedQuery(searchQuery);
     } catch (error) {
       console.error("Error searching documents:", error);
       toast.error("Failed to search documents. Please try again.");
@@ -183,7 +211,7 @@ export default function TextAnalysis() {
     const normalizedData = tsneResult.coordinates.map((coord, index) => ({
       x: normalizeData([coord[0]], xMin, xMax)[0],
       y: normalizeData([coord[1]], yMin, yMax)[0],
-      name: documents[index].title,
+      name: tsneTitles[index],
     }));
 
     return (
@@ -347,6 +375,18 @@ export default function TextAnalysis() {
                       </Button>
                     </li>
                   ))}
+                  {nextCursor && (
+                    <li>
+                      <Button
+                        variant="ghost"
+                        onClick={handleLoadMore}
+                        disabled={loadingMore}
+                        className="w-full"
+                      >
+                        {loadingMore ? <LoadingSpinner size="small" /> : "Load more"}
+                      </Button>
+                    </li>
+                  )}
                 </ul>
               ) : (
                 <p>No documents available</p>